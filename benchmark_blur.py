@@ -0,0 +1,115 @@
+# path
+import sys
+
+# time
+import time
+
+# numpy / opencv
+import numpy as np
+import cv2
+
+# blur_face_manual
+from blur_face_manual.BlurRegion import BlurRegion, BLUR_METHODS
+
+# region sizes (larger side, pixels) and frame size of the benchmark
+REGION_SIZES = [30, 60, 120, 300, 600]
+FRAME_SIZE = (1080, 1920)
+REPEATS = 20
+
+# identifiable detail: structure finer than a third of the region (gaussian high-pass, half power at 3 cycles per region)
+DETAIL_SIGMA_RATIO = 1 / 16
+
+# regions of an image file with less detail than this (gray level std) are not checked
+MIN_DETAIL_STD = 2.0
+
+# a size-scaled method passes when at most this fraction of the original detail is left inside the region
+# (the fixed gaussian is reported for comparison, it is too weak for large regions)
+RETAINED_DETAIL_LIMIT = 0.05
+
+def natural_image(shape, seed = 0):
+    # 1/f noise, the amplitude spectrum of natural images, so every scale carries detail
+    rng = np.random.default_rng(seed)
+    fy = np.fft.fftfreq(shape[0])[:, None]
+    fx = np.fft.rfftfreq(shape[1])[None, :]
+    amplitude = 1 / np.maximum(np.hypot(fx, fy), 1 / max(shape))
+    channels = []
+    for _ in range(3):
+        phase = np.exp(2j * np.pi * rng.random(amplitude.shape))
+        channel = np.fft.irfft2(amplitude * phase, s=shape)
+        channels.append((channel - channel.mean()) / channel.std())
+    return np.clip(128 + 40 * np.stack(channels, axis=-1), 0, 255).astype(np.uint8)
+
+def full_frame_gaussian(image, region):
+    # the blur before the region crop: the whole frame is filtered
+    mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    cv2.ellipse(mask, ((region.start_x + region.end_x) // 2, (region.start_y + region.end_y) // 2), (region.width // 2, region.height // 2), 0, 0, 360, 255, thickness=-1)
+    blurred = cv2.GaussianBlur(image, (101, 101), 0)
+    image[mask == 255] = blurred[mask == 255]
+
+def retained_detail(original, blurred, region):
+    # projection of the detail left in the region on the original detail: 1 untouched, 0 removed.
+    # Measured away from the border of the ellipse, where the high-pass also sees the untouched surroundings
+    sigma = max(region.width, region.height) * DETAIL_SIGMA_RATIO
+    inset = int(np.ceil(2 * sigma))
+    mask = np.zeros(original.shape[:2], dtype=np.uint8)
+    cv2.ellipse(mask, ((region.start_x + region.end_x) // 2, (region.start_y + region.end_y) // 2), (region.width // 2 - inset, region.height // 2 - inset), 0, 0, 360, 255, thickness=-1)
+    def detail(image):
+        image = image.astype(np.float32)
+        return (image - cv2.GaussianBlur(image, (0, 0), sigma))[mask == 255]
+    d_original, d_blurred = detail(original), detail(blurred)
+    if d_original.std() < MIN_DETAIL_STD:
+        return None
+    return max(0.0, float(np.sum(d_original * d_blurred) / np.sum(d_original * d_original)))
+
+def time_ms(function, image, region):
+    times = []
+    for _ in range(REPEATS):
+        target = image.copy()
+        start = time.perf_counter()
+        function(target, region)
+        times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times))
+
+def benchmark(image):
+    failed = []
+    print(f'{"size":>6} {"method":>10} {"ms":>9} {"speedup":>8} {"detail":>8}')
+    for size in REGION_SIZES:
+        # face-like region in the middle of the frame
+        region = BlurRegion()
+        cx, cy = image.shape[1] // 2, image.shape[0] // 2
+        region.set_region(cx - size * 3 // 8, cy - size // 2, cx + size * 3 // 8, cy + size // 2)
+
+        reference = time_ms(full_frame_gaussian, image, region)
+        print(f'{size:>6} {"before":>10} {reference:>9.2f} {1.0:>8.1f}')
+        for method in BLUR_METHODS:
+            blurred = image.copy()
+            region.blur_region(blurred, method = method)
+            detail = retained_detail(image, blurred, region)
+            elapsed = time_ms(lambda target, r: r.blur_region(target, method = method), image, region)
+            if detail is None:
+                print(f'{size:>6} {method:>10} {elapsed:>9.2f} {reference / elapsed:>8.1f} {"n/a":>8}')
+                continue
+            status = '' if detail <= RETAINED_DETAIL_LIMIT else '  weak' if method == 'gaussian' else '  FAIL'
+            print(f'{size:>6} {method:>10} {elapsed:>9.2f} {reference / elapsed:>8.1f} {detail:>8.3f}{status}')
+            if status == '  FAIL':
+                failed.append((size, method))
+    return failed
+
+if __name__ == '__main__':
+    # benchmark on an image file, or on a synthetic natural image
+    if len(sys.argv) == 2:
+        image = cv2.imread(sys.argv[1], cv2.IMREAD_COLOR)
+        if image is None:
+            print(f'Cannot read image "{sys.argv[1]}".')
+            sys.exit(1)
+    elif len(sys.argv) == 1:
+        image = natural_image(FRAME_SIZE)
+    else:
+        print("Usage: python benchmark_blur.py [<path_to_image>]")
+        sys.exit(1)
+
+    failed = benchmark(image)
+    print(f'detail: fraction of the detail finer than 1/3 of the region left after blurring (limit {RETAINED_DETAIL_LIMIT})')
+    if failed:
+        print('Not removing identifiable detail: ' + ', '.join(f'{method} at {size} px' for size, method in failed))
+        sys.exit(1)
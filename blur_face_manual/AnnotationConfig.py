@@ -0,0 +1,45 @@
+# region backends: file is one <stem>_save.txt per bag, sqlite a <stem>_regions.sqlite shared by several annotators
+REGION_BACKENDS = ['file', 'sqlite']
+
+class AnnotationConfig:
+    """
+    Annotation settings of an Application. Defaults reproduce the single annotator save file.
+    - backend: where regions are stored, one of REGION_BACKENDS
+    - annotator: name recorded with every region row and lock (sqlite), defaults to user@host:pid
+    - cams: indices of the cameras this annotator edits (sqlite), None for all
+    - frame_range: (start, end) frames this annotator edits, end excluded (sqlite), None for all
+    - read_only: only read the regions, no lock and no writes (e.g. to export while others annotate)
+    - time_window: (start, end) in seconds from the start of the bag, end None for the end of the bag.
+      Only the frames of the window are loaded (file backend); None loads the whole bag
+    - thumbnail_width: width of the thumbnails shown while jumping along the timeline, built in the background
+      into <stem>_thumbnails next to the bag; None disables them
+    - timeline: open the timeline strip window at startup (T toggles it)
+    """
+
+    def __init__(self, **kwargs):
+        self.backend = 'file'
+        self.annotator = None
+        self.cams = None
+        self.frame_range = None
+        self.read_only = False
+        self.time_window = None
+        self.thumbnail_width = 160
+        self.timeline = False
+
+        for key, value in kwargs.items():
+            if not hasattr(self, key):
+                raise ValueError(f'Unknown annotation option "{key}"')
+            setattr(self, key, value)
+
+        if self.backend not in REGION_BACKENDS:
+            raise ValueError(f'Unknown region backend "{self.backend}", expected one of {REGION_BACKENDS}')
+        if self.frame_range is not None and not 0 <= self.frame_range[0] < self.frame_range[1]:
+            raise ValueError(f'Invalid frame range {self.frame_range}')
+        if self.thumbnail_width is not None and self.thumbnail_width < 1:
+            raise ValueError(f'Invalid thumbnail width {self.thumbnail_width}')
+        if self.time_window is not None:
+            start, end = self.time_window
+            if start < 0 or end is not None and end <= start:
+                raise ValueError(f'Invalid time window {self.time_window}')
+            if self.backend != 'file':
+                raise ValueError('Time windows need the file backend, the region database is keyed by frame of the whole bag')
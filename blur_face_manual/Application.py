@@ -10,11 +10,20 @@ import copy
 # path
 from pathlib import Path
 
+# time
+import time
+
 # blur_face_manual
 from blur_face_manual.BlurRegion import BlurRegion, draw_crosshair, blur_image
 from blur_face_manual.SaveFileHandler import SaveFileHandler
-from blur_face_manual.BagFileHandler import BagFileHandler_ros1
-from blur_face_manual.BagFileHandler_ros2 import BagFileHandler_ros2
+from blur_face_manual.RegionDatabase import RegionDatabase
+from blur_face_manual.AnnotationConfig import AnnotationConfig
+from blur_face_manual.BackgroundExport import BackgroundExport
+from blur_face_manual.ThumbnailAtlas import ThumbnailAtlas
+from blur_face_manual.TimelineStrip import TimelineStrip
+
+# seconds without a key press before the frames shown as thumbnails after a jump are decoded in full
+REFINE_DELAY = 0.15
 
 class DisplayType(Enum):
     PREBLUR = 1
@@ -22,34 +31,141 @@ class DisplayType(Enum):
 
 class Application:
 
-    def __init__(self, input_bag_path, save_file_folder = "./", export_folder = "./", camera_topics = None, passthrough_topics = None, ros_version = 2):
-        # convert to path
-        input_bag_path = Path(input_bag_path)
+    def __init__(self, input_bag_path, save_file_folder = "./", export_folder = "./", camera_topics = None, passthrough_topics = None, ros_version = 2, export_config = None, annotation = None, session_queue = None):
+        # annotation settings
+        self.annotation = annotation or AnnotationConfig()
 
-        # helper objects
+        # bags annotated one after the other, the first one is opened
+        self.session_queue = session_queue
+        if self.session_queue is not None:
+            input_bag_path, save_file_folder = self.session_queue.entries[self.session_queue.current]
+
+        # helper objects, only the backend of ros_version is imported (ROS1 sessions run without ROS 2 installed)
+        start = time.perf_counter()
         if ros_version == 1:
-            self.BagFileHandler = BagFileHandler_ros1(input_bag_path, export_folder, camera_topics, passthrough_topics)
+            from blur_face_manual.BagFileHandler import BagFileHandler_ros1 as BagFileHandler
         elif ros_version == 2:
-            self.BagFileHandler = BagFileHandler_ros2(input_bag_path, export_folder, camera_topics, passthrough_topics)
+            from blur_face_manual.BagFileHandler_ros2 import BagFileHandler_ros2 as BagFileHandler
         else:
             print("Error: ros_version must be 1 or 2")
             exit(1)
-        self.SaveFileHandler = SaveFileHandler(save_file_folder + input_bag_path.stem + '_save.txt')
+        import_time = time.perf_counter() - start
+        self.handler_class = BagFileHandler
+        self.handler_args = (export_folder, camera_topics, passthrough_topics, export_config, self.annotation.time_window)
 
-        # get cams
-        self.cams = self.BagFileHandler.get_cams()
-        self.num_cams = len(self.cams)
+        # thumbnails shown right away on jumps, built in the background next to the bag
+        self.thumbnails = None
+        self.refine_time = None
 
-        # try to read regions from file
-        self.read_regions_from_file()
+        # handler, regions, cams and thumbnails of the bag
+        load_time = self.open_bag(input_bag_path, save_file_folder)
+
+        # startup metrics
+        print(f'startup: ROS{ros_version} backend imported in {1000 * import_time:.1f} ms, '
+              f'frames loaded in {1000 * load_time:.1f} ms, ready in {1000 * (time.perf_counter() - start):.1f} ms.')
 
         self.threashold_distance = 30
         
         self.render_type = DisplayType.PREBLUR
 
+        # exports run in a background process
+        self.background_export = BackgroundExport()
+
+        # timeline strip window, toggled with T
+        self.timeline = TimelineStrip(self.seek)
+        self.timeline_shown = False
+
         # # process passthrough topics and other topics
         # self.process_passthrough_and_other_topics()
 
+    def create_handler(self, input_bag_path):
+        # convert to path, a list of split bags is kept as a list
+        if not isinstance(input_bag_path, (list, tuple)):
+            input_bag_path = Path(input_bag_path)
+        return self.handler_class(input_bag_path, *self.handler_args)
+
+    def open_bag(self, input_bag_path, save_file_folder):
+        # open a bag with its regions, returns the seconds spent loading its frames
+        self.BagFileHandler = self.create_handler(input_bag_path)
+
+        # regions in a save file, or in a database shared with other annotators
+        if self.annotation.backend == 'sqlite':
+            self.SaveFileHandler = RegionDatabase(save_file_folder + self.BagFileHandler.session_stem + '_regions.sqlite', self.annotation.annotator,
+                                                  self.annotation.cams, self.annotation.frame_range, self.annotation.read_only)
+        else:
+            self.SaveFileHandler = SaveFileHandler(save_file_folder + self.BagFileHandler.session_stem + '_save.txt', self.annotation.time_window is not None)
+
+        # get cams
+        load_start = time.perf_counter()
+        self.cams = self.BagFileHandler.get_cams()
+        self.num_cams = len(self.cams)
+        load_time = time.perf_counter() - load_start
+
+        # lock the frames of this annotator
+        if self.annotation.backend == 'sqlite':
+            if not self.SaveFileHandler.register_cams(self.cams) or not self.SaveFileHandler.acquire_lock():
+                exit(1)
+
+        # try to read regions from file
+        self.read_regions_from_file()
+
+        # thumbnails of this bag
+        if self.annotation.thumbnail_width is not None:
+            thumbnail_folder = self.BagFileHandler.frame_index_file.path.parent / (self.BagFileHandler.session_stem + '_thumbnails')
+            self.thumbnails = ThumbnailAtlas(thumbnail_folder, self.BagFileHandler.input_bag_paths, self.cams, self.annotation.thumbnail_width)
+        self.refine_time = None
+        return load_time
+
+    def close_bag(self):
+        # stop building thumbnails, the next session goes on
+        if self.thumbnails is not None:
+            self.thumbnails.close()
+
+        # release the frame lock
+        if self.annotation.backend == 'sqlite':
+            self.SaveFileHandler.close()
+
+    def preload_next_bag(self):
+        # the next bag of the session queue is scanned in the background while this one is annotated
+        if self.session_queue is not None:
+            next_bag = self.session_queue.current + 1
+            if next_bag < len(self.session_queue):
+                self.session_queue.preload(next_bag, self.create_handler(self.session_queue.entries[next_bag][0]))
+
+    def switch_bag(self, step):
+        # write the regions of this bag and open the next (or previous) bag of the session queue
+        if self.session_queue is None:
+            print('No session queue, pass a queue file to main.py to annotate several bags in a row.')
+            return
+        target = self.session_queue.current + step
+        if not 0 <= target < len(self.session_queue):
+            print(f'No {"next" if step > 0 else "previous"} bag in the session queue.')
+            return
+        self.SaveFileHandler.write_to_save_file(self.cams)
+        self.close_bag()
+
+        # the stamp size carries over to the same cam of the next bag
+        last_regions = [cam.last_region for cam in self.cams]
+        start = time.perf_counter()
+        self.session_queue.wait(target)
+        self.session_queue.current = target
+        self.open_bag(*self.session_queue.entries[target])
+        for cam, last_region in zip(self.cams, last_regions):
+            cam.last_region = last_region
+        print(f'bag {target + 1}/{len(self.session_queue)} {self.session_queue.name(target)} opened in {1000 * (time.perf_counter() - start):.1f} ms.')
+
+        self.preload_next_bag()
+        if self.thumbnails is not None:
+            self.thumbnails.start()
+        self.update_window_titles()
+        self.render_windows()
+
+    def update_window_titles(self):
+        # bag name and position in the session queue
+        position = f' ({self.session_queue.current + 1}/{len(self.session_queue)})' if self.session_queue is not None else ''
+        for i in range(self.num_cams):
+            cv2.setWindowTitle('cam' + str(i), f'cam{i} - {self.BagFileHandler.session_stem}{position}')
+
     def process_image(self, input_image):
         return cv2.cvtColor(input_image, cv2.COLOR_BGR2GRAY)
 
@@ -93,7 +209,9 @@ class Application:
             self.cams[ith].drag_end_x = x
             self.cams[ith].drag_end_y = y
 
-            if self.cams[ith].moved_enoughed_distance:
+            if not self.SaveFileHandler.owns(ith, self.cams[ith].current_frame):
+                print(f'cam{ith} frame {self.cams[ith].current_frame} is outside the frames of this annotator.')
+            elif self.cams[ith].moved_enoughed_distance:
                 # add blur region from dragged region
                 blur_region = BlurRegion()
                 blur_region.set_region(self.cams[ith].drag_start_x, self.cams[ith].drag_start_y, self.cams[ith].drag_end_x, self.cams[ith].drag_end_y)
@@ -113,6 +231,10 @@ class Application:
 
         self.render_window(ith)
 
+        # a region may have been added
+        if event == cv2.EVENT_LBUTTONUP:
+            self.render_timeline()
+
     def create_window(self):
         # display windows
         for i in range(self.num_cams):
@@ -129,20 +251,28 @@ class Application:
     def increase_frame(self, num):
         for ith in range(self.num_cams):
             self.cams[ith].current_frame = min(self.cams[ith].total_frames - 1, self.cams[ith].current_frame + num)
-        self.render_windows()
+        self.render_windows(preview = num > 1)
 
     def decrease_frame(self, num):
         for ith in range(self.num_cams):
             self.cams[ith].current_frame = max(0, self.cams[ith].current_frame - num)
-        self.render_windows()
+        self.render_windows(preview = num > 1)
     
-    def render_windows(self):
+    def render_windows(self, preview = False):
+        # preview: jumps show the thumbnails, the frames are decoded once the keys rest
         for ith in range(self.num_cams):
-            self.render_window(ith)
-
-    def render_window(self, ith):
-        # get base image
-        window_content = self.cams[ith].get_current_image()
+            self.render_window(ith, preview)
+        self.render_timeline()
+
+    def render_window(self, ith, preview = False):
+        # get base image, the thumbnail of the frame when previewing
+        window_content = None
+        if preview and self.thumbnails is not None:
+            window_content = self.thumbnails.thumbnail(ith, self.cams[ith].current_frame)
+        if window_content is None:
+            window_content = self.cams[ith].get_current_image()
+        else:
+            self.refine_time = time.perf_counter() + REFINE_DELAY
 
         # print timestamp
         # print(f"cam{ith} {self.cams[ith].get_current_timestamp()}")
@@ -153,7 +283,7 @@ class Application:
                 region.draw_border(window_content)
         elif self.render_type == DisplayType.BLURRED:
             all_regions = self.cams[ith].blur_regions[self.cams[ith].current_frame]
-            blur_image(window_content, all_regions)
+            blur_image(window_content, all_regions, self.BagFileHandler.export_config.blur_method)
 
         # draw cursor
         mouse_location = (self.cams[ith].mouse_x, self.cams[ith].mouse_y)
@@ -170,15 +300,48 @@ class Application:
             live_region = BlurRegion()
             live_region.set_region(self.cams[ith].drag_start_x, self.cams[ith].drag_start_y, self.cams[ith].drag_end_x, self.cams[ith].drag_end_y)
             live_region.draw_border_with_crosshair(window_content)
+
+        # progress of a background export
+        export_status = self.background_export.status_line()
+        if export_status:
+            self.draw_status(window_content, export_status)
         
         # update window
         cv2.imshow('cam'+str(ith), window_content)        
 
+    def render_timeline(self):
+        if self.timeline_shown:
+            cv2.imshow('timeline', self.timeline.draw(self.cams, self.thumbnails))
+
+    def toggle_timeline(self):
+        if self.timeline_shown:
+            self.timeline_shown = False
+            cv2.destroyWindow('timeline')
+            return
+        self.timeline_shown = True
+        cv2.namedWindow('timeline', cv2.WINDOW_AUTOSIZE)
+        cv2.moveWindow('timeline', 0, 520)
+        cv2.setMouseCallback('timeline', self.timeline.mouse_callback)
+        self.render_timeline()
+
+    def seek(self, ratio):
+        # jump from the timeline strip
+        self.set_current_frame_as_ratio(ratio)
+        self.render_windows(preview = True)
+
+    def draw_status(self, image, text):
+        # outlined text in the top left corner, scaled with the image
+        scale = max(0.5, image.shape[1] / 1280)
+        origin = (int(10 * scale), int(30 * scale))
+        cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), max(1, int(4 * scale)), cv2.LINE_AA)
+        cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), max(1, int(scale)), cv2.LINE_AA)
+
     def read_regions_from_file(self):
-        loaded_cam = self.SaveFileHandler.read_from_save_file()
+        loaded_cam = self.SaveFileHandler.read_from_save_file(self.cams)
         if loaded_cam:    
             for ith in range(self.num_cams):
                 self.cams[ith].blur_regions = loaded_cam[ith].blur_regions
+                self.cams[ith].outside_regions = loaded_cam[ith].outside_regions
                 if len(self.cams[ith].blur_regions) != self.cams[ith].total_frames:
                     print("Error: loaded blur regions does not match total frames")
                     print(f"current = {str(self.BagFileHandler.input_bag_path)}, current cam = {ith}")
@@ -199,6 +362,8 @@ class Application:
     def confirm_and_increase_frame(self):
         added_region = False
         for ith in range(self.num_cams):
+            if not self.SaveFileHandler.owns(ith, self.cams[ith].current_frame):
+                continue
             if self.cams[ith].mouse_in_window and self.cams[ith].last_region:
                 blur_region = copy.deepcopy(self.cams[ith].last_region)
                 blur_region.set_bottom_right_corner(self.cams[ith].mouse_x, self.cams[ith].mouse_y)
@@ -209,7 +374,7 @@ class Application:
 
     def erase_region_under_cursor(self):
         for ith in range(self.num_cams):
-            if self.cams[ith].mouse_in_window:
+            if self.cams[ith].mouse_in_window and self.SaveFileHandler.owns(ith, self.cams[ith].current_frame):
                 x = self.cams[ith].mouse_x
                 y = self.cams[ith].mouse_y
 
@@ -222,6 +387,7 @@ class Application:
                     if region.contains(x, y):
                         self.cams[ith].blur_regions[self.cams[ith].current_frame].remove(region)
                         self.render_window(ith)
+                        self.render_timeline()
                         break
     
     def set_current_frame_as_ratio(self, ratio):
@@ -229,12 +395,33 @@ class Application:
             self.cams[ith].current_frame = max(0, int(ratio * self.cams[ith].total_frames) - 1)
 
     def export_to_bag(self):
-        self.BagFileHandler.export_cams(self.cams)
+        # exports a snapshot of the regions in the background, editing goes on meanwhile
+        if self.background_export.start(self.BagFileHandler, self.cams):
+            self.render_windows()
+
+    def verify_export(self):
+        # compares the exported bags with the input bags and the loaded regions, true when they match
+        return self.BagFileHandler.verify_export(self.cams)
+
+    def plan_export(self, write_sample = False):
+        # dry run of the export of the loaded regions: frames to re-encode, bytes copied, output size and runtime
+        # write_sample: time the writes of the samples in a scratch bag in the system temp folder
+        return self.BagFileHandler.plan_export(self.cams, write_sample)
 
     def run(self):
         # create windows
         self.create_window()
         self.register_callbacks()
+        self.update_window_titles()
+        if self.annotation.timeline:
+            self.toggle_timeline()
+
+        # build the thumbnails missing from previous sessions
+        if self.thumbnails is not None:
+            self.thumbnails.start()
+
+        # scan the next bag of the session queue meanwhile
+        self.preload_next_bag()
 
         # render windows
         for ith in range(self.num_cams):
@@ -243,6 +430,24 @@ class Application:
         # listen to key press
         while True:
             key = cv2.waitKey(1)
+
+            # keep the frame lock of this annotator alive
+            if self.annotation.backend == 'sqlite':
+                self.SaveFileHandler.heartbeat()
+
+            # progress of a background export
+            if self.background_export.poll():
+                self.render_windows()
+
+            # preload of the next bag
+            if self.session_queue is not None:
+                self.session_queue.poll()
+
+            # decode the frames shown as thumbnails once the keys rest
+            if key == -1 and self.refine_time is not None and time.perf_counter() >= self.refine_time:
+                self.refine_time = None
+                self.render_windows()
+
             if key == ord('z'):
                 self.decrease_frame(10)
             elif key == ord('a'):
@@ -258,9 +463,21 @@ class Application:
             elif key == ord('q'):
                 break
             elif key == ord('e'):
-                # write save then export
+                # write save then export, a shared database also holds the regions of the other annotators
                 self.SaveFileHandler.write_to_save_file(self.cams)
+                if self.annotation.backend == 'sqlite':
+                    self.read_regions_from_file()
                 self.export_to_bag()
+            elif key == ord('t'):
+                self.toggle_timeline()
+            elif key == ord('n'):
+                self.switch_bag(1)
+            elif key == ord('p'):
+                self.switch_bag(-1)
+            elif key == ord('k'):
+                # cancel the background export
+                self.background_export.cancel()
+                self.render_windows()
             elif key == ord('w'):
                 # write save
                 self.SaveFileHandler.write_to_save_file(self.cams)
@@ -279,40 +496,50 @@ class Application:
                 self.decrease_region_size()
             elif key == ord('1'):
                 self.set_current_frame_as_ratio(0.1)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('2'):
                 self.set_current_frame_as_ratio(0.2)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('3'):
                 self.set_current_frame_as_ratio(0.3)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('4'):
                 self.set_current_frame_as_ratio(0.4)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('5'):
                 self.set_current_frame_as_ratio(0.5)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('6'):
                 self.set_current_frame_as_ratio(0.6)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('7'):
                 self.set_current_frame_as_ratio(0.7)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('8'):
                 self.set_current_frame_as_ratio(0.8)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('9'):
                 self.set_current_frame_as_ratio(0.9)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('0'):
                 self.set_current_frame_as_ratio(1.0)
-                self.render_windows()
+                self.render_windows(preview = True)
             elif key == ord('o'):
                 self.set_current_frame_as_ratio(0.0)
-                self.render_windows()
+                self.render_windows(preview = True)
             else:
                 pass
         
         # close windows
         cv2.destroyAllWindows()
 
+        # stop a running export, it resumes from its checkpoint
+        self.background_export.close()
+
+        # stop preloading the next bag
+        if self.session_queue is not None:
+            self.session_queue.close()
+
+        # thumbnails and frame lock of the bag
+        self.close_bag()
+
@@ -0,0 +1,155 @@
+# multiprocessing
+import multiprocessing
+import queue
+
+# time
+import time
+
+# blur_face_manual
+from blur_face_manual.ExportStats import format_duration
+
+# seconds the final status of an export stays in the windows
+STATUS_LINGER = 10.0
+
+class ExportCancelled(KeyboardInterrupt):
+    # handled like Ctrl-C by the export: the checkpoint is kept and the next export resumes from it
+    pass
+
+class ExportListener:
+    """
+    Progress listener of an export running in a background process (ExportStats.listener).
+    Sends the progress to the GUI process and stops the export once it is cancelled.
+    """
+
+    def __init__(self, status_queue, cancel_event):
+        self.status_queue = status_queue
+        self.cancel_event = cancel_event
+
+    def __call__(self, stats):
+        if self.cancel_event.is_set():
+            raise ExportCancelled()
+        self.status_queue.put(('progress', stats.messages, stats.total_messages, stats.elapsed()))
+
+def run_export(handler, cams, status_queue, cancel_event):
+    # entry point of the export process
+    try:
+        done = handler.export_cams(cams, ExportListener(status_queue, cancel_event))
+    except ExportCancelled:
+        status_queue.put(('cancelled',))
+        return
+    except Exception:
+        status_queue.put(('failed',))
+        raise
+    status_queue.put(('done',) if done else ('failed',))
+
+class BackgroundExport:
+    """
+    Export of a snapshot of the blur regions in a separate process, so the GUI stays responsive.
+    - start(handler, cams): snapshots the regions and starts the export
+    - poll(): reads the progress sent by the export, true when the status line changed
+    - status_line(): progress text drawn in the windows
+    - cancel(): stops the export at its next progress update, it resumes from its checkpoint
+    The process is spawned, not forked, so it does not inherit the GUI state.
+    """
+
+    def __init__(self):
+        self.context = multiprocessing.get_context('spawn')
+        self.process = None
+        self.status_queue = None
+        self.cancel_event = None
+        self.state = None
+        self.messages = 0
+        self.total_messages = 0
+        self.elapsed = 0.0
+        self.finished_time = None
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self, handler, cams):
+        if self.running:
+            print('An export is already running, press K to cancel it.')
+            return False
+
+        # the export works on a copy of the regions, editing goes on meanwhile
+        snapshot = [cam.snapshot() for cam in cams]
+
+        self.status_queue = self.context.Queue()
+        self.cancel_event = self.context.Event()
+        self.process = self.context.Process(target=run_export, args=(handler, snapshot, self.status_queue, self.cancel_event))
+        self.process.start()
+        self.state = 'starting'
+        self.messages = 0
+        self.total_messages = 0
+        self.elapsed = 0.0
+        self.finished_time = None
+        print(f'Export started in the background (pid {self.process.pid}), press K to cancel.')
+        return True
+
+    def cancel(self):
+        if not self.running:
+            print('No export is running.')
+            return
+        self.cancel_event.set()
+        self.state = 'cancelling'
+        print('Cancelling the export, export again to resume it.')
+
+    def poll(self):
+        # hide the final status after a while
+        if self.process is None:
+            if self.finished_time is not None and time.time() - self.finished_time > STATUS_LINGER:
+                self.state = None
+                self.finished_time = None
+                return True
+            return False
+
+        # checked before reading, so the last status of an ended process is read
+        alive = self.process.is_alive()
+        changed = False
+        while True:
+            try:
+                status = self.status_queue.get_nowait()
+            except queue.Empty:
+                break
+            if status[0] == 'progress':
+                if self.state != 'cancelling':
+                    self.state = 'running'
+                _, self.messages, self.total_messages, self.elapsed = status
+            else:
+                self.state = status[0]
+            changed = True
+
+        # the export process ended
+        if not alive:
+            if self.state not in ('done', 'cancelled', 'failed'):
+                self.state = 'failed'
+            self.process.join()
+            self.process = None
+            self.finished_time = time.time()
+            changed = True
+        return changed
+
+    def status_line(self):
+        if self.state is None:
+            return None
+        if self.state == 'starting':
+            return 'export: starting'
+        if self.state in ('running', 'cancelling'):
+            line = f'export: {self.messages}'
+            if self.total_messages:
+                line += f'/{self.total_messages} msgs ({100.0 * self.messages / self.total_messages:.1f}%)'
+            else:
+                line += ' msgs'
+            if self.total_messages and self.messages and self.elapsed > 0:
+                remaining = max(0, self.total_messages - self.messages) * self.elapsed / self.messages
+                line += f' ETA {format_duration(remaining)}'
+            return line + (' cancelling' if self.state == 'cancelling' else '')
+        return f'export: {self.state}'
+
+    def close(self):
+        # quitting cancels a running export, the next session resumes it from its checkpoint
+        if self.running:
+            self.cancel()
+            self.process.join()
+            self.poll()
@@ -1,23 +1,235 @@
 # numpy
 import numpy as np
 
+# os
+import os
+
+# heapq
+import heapq
+
+# time
+import time
+
+# scratch bags of the export planner
+import tempfile
+from contextlib import nullcontext
+
+# io
+from io import BytesIO
+
+# collections
+from collections import defaultdict
+
+# concurrency
+from concurrent.futures import ProcessPoolExecutor
+
 # OpenCV
 import cv2
 
 # rosbags
 from rosbags.typesys import get_typestore, Stores
 from rosbags.highlevel import AnyReader, AnyReaderError
-from rosbags.rosbag1 import Writer, WriterError
+from rosbags.interfaces import Connection, ConnectionExtRosbag1, MessageDefinition, MessageDefinitionFormat
+from rosbags.rosbag1 import Writer, WriterError, ReaderError
+from rosbags.rosbag1.reader import Header, RecordType, decompressors, read_bytes, read_uint32
+from rosbags.rosbag1.writer import WriteChunk, MAXSIZE
 from rosbags.typesys.stores.ros1_noetic import sensor_msgs__msg__CompressedImage as CompressedImage
 
+# path
+from pathlib import Path
+
 # blur_face_manual
-from blur_face_manual.Cam import Cam
+from blur_face_manual.Cam import Cam, decode_compressed
+from blur_face_manual.BlurRegion import blur_image
+from blur_face_manual.ExportStats import ExportStats
+from blur_face_manual.BagSet import expand_bag_paths, session_stem
+from blur_face_manual.FrameIndex import FrameIndex, FrameIndexFile
+from blur_face_manual.ExportConfig import ExportConfig
+from blur_face_manual.ExportCheckpoint import ExportCheckpoint, StreamPosition, partial_path
+from blur_face_manual.Overlay import write_manifest
+from blur_face_manual.OutputSplits import OutputSplitter
+from blur_face_manual.FrameArena import FrameArena, SplitArenas, ros1_compressed_payload
+from blur_face_manual.ExportPlanner import ExportPlan, PLAN_SAMPLE_MESSAGES, add_sample_message, add_sample_topic, new_sample, sample_starts, time_frame_costs
+from blur_face_manual.ExportVerifier import StreamComparer, finish_verification, shard_bounds
+from blur_face_manual.IncrementalExport import FrameFingerprints, PreviousOutput, PREVIOUS_SUFFIX, region_fingerprint, previous_path, remove_output
+
+class Ros1FrameReader:
+    """
+    Reads single messages of ROS1 bags by (split, chunk_pos, offset) locator, as stored in
+    the frame index, without parsing the bag index. The last decompressed chunk is cached.
+    """
+
+    def __init__(self, paths, msgtype):
+        self.paths = paths
+        self.msgtype = msgtype
+        self.files = {}
+        self.current_chunk = (None, None)
+
+    def read_raw(self, locator):
+        split, chunk_pos, offset = (int(x) for x in locator)
+
+        # read and decompress chunk
+        if self.current_chunk[0] != (split, chunk_pos):
+            if split not in self.files:
+                self.files[split] = open(self.paths[split], 'rb')
+            bio = self.files[split]
+            bio.seek(chunk_pos)
+            header = Header.read(bio, RecordType.CHUNK)
+            decompressor = decompressors[header.get_string('compression')]
+            rawbytes = decompressor(read_bytes(bio, read_uint32(bio)))
+            self.current_chunk = ((split, chunk_pos), BytesIO(rawbytes))
+
+        # skip connection records and read message data
+        chunk = self.current_chunk[1]
+        chunk.seek(offset)
+        while True:
+            header = Header.read(chunk)
+            if header.get_uint8('op') != RecordType.CONNECTION:
+                break
+            chunk.seek(read_uint32(chunk), os.SEEK_CUR)
+        return read_bytes(chunk, read_uint32(chunk))
+
+    def payload(self, locator):
+        # compressed image of the message, a view of the serialized message (no deserialization)
+        rawdata = self.read_raw(locator)
+        offset, length = ros1_compressed_payload(rawdata)
+        return memoryview(rawdata)[offset:offset + length]
+
+    def clone(self):
+        # reader with its own files, for another thread
+        return Ros1FrameReader(self.paths, self.msgtype)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.current_chunk = (None, None)
+
+class CheckpointWriter(Writer):
+    """
+    rosbags Writer whose state after a flushed chunk can be checkpointed, and restored from a
+    partial bag: the file is truncated after the last checkpointed chunk and writing continues.
+    Relies on the Writer internals of the pinned rosbags version.
+    """
+
+    def checkpoint_state(self):
+        # everything up to the last flushed chunk is on disk
+        self.bio.flush()
+        os.fsync(self.bio.fileno())
+        return {
+            'position': self.bio.tell(),
+            'compression': self.compression_format,
+            'chunk_threshold': self.chunk_threshold,
+            'connections': [[c.id, c.topic, c.msgtype, c.msgdef.data, c.digest, c.ext.callerid, c.ext.latching] for c in self.connections],
+            'chunks': [[c.pos, c.start, c.end, [[cid, len(items)] for cid, items in c.connections.items()]] for c in self.chunks if c.pos != -1],
+        }
+
+    @classmethod
+    def resume(cls, path, state):
+        path = Path(path)
+        if not path.exists() or path.stat().st_size < state['position']:
+            raise WriterError(f'{path} is shorter than its checkpoint.')
+
+        # same attributes as Writer.__init__, which refuses existing paths
+        writer = cls.__new__(cls)
+        writer.path = path
+        writer.bio = None
+        writer.compressor = lambda x: x
+        writer.compression_format = 'none'
+        writer.chunk_threshold = state['chunk_threshold']
+        if state['compression'] != 'none':
+            writer.set_compression(Writer.CompressionFormat[state['compression'].upper()])
+
+        # validate the partial bag: magic and the last checkpointed chunk
+        bio = path.open('r+b')
+        try:
+            if bio.read(13) != b'#ROSBAG V2.0\n':
+                raise WriterError(f'{path} is not a rosbag.')
+            if state['chunks']:
+                bio.seek(state['chunks'][-1][0])
+                Header.read(bio, RecordType.CHUNK)
+        except (WriterError, ReaderError) as e:
+            bio.close()
+            raise WriterError(f'{path} does not match its checkpoint: {e}') from None
+
+        # truncate after the last checkpointed chunk
+        bio.truncate(state['position'])
+        bio.seek(state['position'])
+        writer.bio = bio
+
+        # restore connections and flushed chunks (close() only needs their counts)
+        writer.connections = [
+            Connection(cid, topic, msgtype, MessageDefinition(MessageDefinitionFormat.MSG, msgdef), digest, -1, ConnectionExtRosbag1(callerid, latching), writer)
+            for cid, topic, msgtype, msgdef, digest, callerid, latching in state['connections']
+        ]
+        writer.chunks = [WriteChunk(BytesIO(), pos, start, end, {cid: range(count) for cid, count in counts}) for pos, start, end, counts in state['chunks']]
+        writer.chunks.append(WriteChunk(BytesIO(), -1, MAXSIZE, 0, defaultdict(list)))
+        return writer
+
+class MemoryFile(BytesIO):
+    # bag file of a MemoryWriter, keeps its size once the writer closes it
+    size = 0
+
+    def close(self):
+        self.size = self.seek(0, os.SEEK_END)
+        super().close()
+
+class MemoryPath:
+    # path of a MemoryWriter, Writer.open opens it with path.open('xb')
+    def __init__(self):
+        self.file = MemoryFile()
+
+    def open(self, mode):
+        return self.file
+
+class MemoryWriter(Writer):
+    """
+    rosbags Writer writing the bag into memory instead of a file, for the timed samples of the export planner.
+    size is the size of the bag once closed. Relies on the Writer internals of the pinned rosbags version.
+    """
+
+    def __init__(self):
+        # same attributes as Writer.__init__, which takes a path that does not exist yet
+        self.path = MemoryPath()
+        self.bio = None
+        self.compressor = lambda x: x
+        self.compression_format = 'none'
+        self.connections = []
+        self.chunks = [WriteChunk(BytesIO(), -1, MAXSIZE, 0, defaultdict(list))]
+        self.chunk_threshold = 1 * (1 << 20)
+
+    @property
+    def size(self):
+        return self.path.file.size
+
+# rosbag1 chunk compression formats
+ROS1_COMPRESSIONS = ['none', 'lz4', 'bz2']
 
 class BagFileHandler_ros1:
-    def __init__(self, path, export_folder, camera_topics, passthrough_topics):
-        # input and output bag path
-        self.input_bag_path = path
-        self.output_bag_name = export_folder + self.input_bag_path.stem + '_blurred.bag'
+    def __init__(self, path, export_folder, camera_topics, passthrough_topics, export_config = None, time_window = None):
+        # input bag paths, a single bag or a set of splits forming one timeline
+        self.input_bag_paths = expand_bag_paths(path)
+        self.input_bag_path = self.input_bag_paths[0] if self.input_bag_paths else Path(path)
+        self.session_stem = session_stem(self.input_bag_paths) if self.input_bag_paths else self.input_bag_path.stem
+
+        # export settings
+        self.export_config = export_config or ExportConfig()
+        if self.export_config.compression not in ROS1_COMPRESSIONS:
+            raise ValueError(f'ROS1 bags support compression {ROS1_COMPRESSIONS}, not "{self.export_config.compression}"')
+        suffix = '_blurred_overlay' if self.export_config.mode == 'overlay' else '_blurred'
+
+        # output bag paths, one per input split
+        self.output_bag_names = [export_folder + p.stem + suffix + '.bag' for p in self.input_bag_paths]
+        self.output_bag_name = self.output_bag_names[0] if self.output_bag_names else export_folder + self.session_stem + suffix + '.bag'
+        self.stats_file_name = export_folder + self.session_stem + suffix + '_stats.json'
+        self.checkpoint_file_name = export_folder + self.session_stem + suffix + '_checkpoint.json'
+        self.frames_file_name = export_folder + self.session_stem + suffix + '_frames.json'
+        self.verify_file_name = export_folder + self.session_stem + suffix + '_verify.json'
+        self.plan_file_name = export_folder + self.session_stem + suffix + '_plan.json'
+        self.manifest_file_name = export_folder + self.session_stem + '_blurred_overlay.json'
+
+        # sidecar frame index next to the bags
+        self.frame_index_file = FrameIndexFile(self.input_bag_path.parent / (self.session_stem + '_frameindex.npz'))
 
         # cam topics
         self.camera_topics = camera_topics
@@ -25,10 +237,14 @@ class BagFileHandler_ros1:
         # passthrough topics
         self.passthrough_topics = passthrough_topics
 
+        # (start, end) seconds from the start of the bag to load, None for the whole bag
+        self.time_window = time_window
+
     def create_reader(self, path):
         typestore = get_typestore(Stores.ROS1_NOETIC)
+        paths = list(path) if isinstance(path, (list, tuple)) else [path]
         try:
-            reader = AnyReader([path], default_typestore = typestore)
+            reader = AnyReader(paths, default_typestore = typestore)
             return reader
         except AnyReaderError as e:
             print(f'Cannot open bag file "{path}".')
@@ -38,10 +254,22 @@ class BagFileHandler_ros1:
             print (e)
             return None
 
-    def create_writer(self, path):
-        # create bag file
+    def create_writer(self, path, checkpoint_state = None):
+        # continue a partial bag from its checkpoint
+        if checkpoint_state is not None:
+            try:
+                return CheckpointWriter.resume(path, checkpoint_state)
+            except (WriterError, OSError) as e:
+                print(f'Cannot resume partial bag: {e}')
+                return None
+
+        # create bag file, or a bag in memory without a path
         try:
-            writer = Writer(path)
+            writer = CheckpointWriter(path) if path is not None else MemoryWriter()
+            if self.export_config.compression != 'none':
+                writer.set_compression(Writer.CompressionFormat[self.export_config.compression.upper()])
+            if self.export_config.chunk_size is not None:
+                writer.chunk_threshold = self.export_config.chunk_size
             return writer
         except WriterError as e:
             print('Bag already exists, please rename or delete the existing bag and try again.')
@@ -49,49 +277,115 @@ class BagFileHandler_ros1:
         except Exception as e:
             print('An error occurred while opening the bag file.')
             return None
-        
-    # read bag and output cam object
-    def get_cams(self):
-        # typestore to deserialize messages
-        typestore = get_typestore(Stores.ROS1_NOETIC)
-        
-        # reader to read bag
-        reader = self.create_reader(self.input_bag_path)
 
-        # error check
+    # splits of an output bag, by the configured maximum size or duration (or kept shards)
+    def create_splitter(self, output_path, state = None):
+        config = self.export_config
+        numbered = config.shards > 1 and config.keep_shards
+        return OutputSplitter(output_path[:-len('.bag')], '.bag', config.split_size, config.split_duration, state, numbered)
+
+    # time window of the session in nanoseconds, (None, None) for the whole bag
+    def time_window_ns(self):
+        if self.time_window is None:
+            return (None, None)
+        reader = self.create_reader(self.input_bag_paths)
         if reader is None:
             exit()
+        with reader:
+            start_time = reader.start_time
+        start, end = self.time_window
+        return (start_time + int(start * 1e9), None if end is None else start_time + int(end * 1e9))
+
+    # read one split and return the serialized cam messages in the time window, runs in a worker process
+    # frames: (arena, [(timestamp, frame in the arena, locator)]) per cam
+    def scan_split(self, job):
+        split, path, window = job
+
+        # reader to read bag
+        reader = self.create_reader(path)
+        if reader is None:
+            return None, None, None
 
         # open
-        reader.open()
+        try:
+            reader.open()
+        except AnyReaderError as e:
+            print(f'Cannot open bag file "{path}": {e}')
+            return None, None, None
 
-        # initialize cam
-        cams = [Cam() for _ in range(len(self.camera_topics))]
+        # only read cam connections
+        connections = [x for x in reader.connections if x.topic in self.camera_topics]
+        frames = [(FrameArena(), []) for _ in range(len(self.camera_topics))]
+        msgtypes = [None] * len(self.camera_topics)
 
-        # for each image connection, store compressed image messages
-        for connection, timestamp, rawdata in reader.messages():
-            # skip if not cam topics
-            if connection.topic not in self.camera_topics:
-                continue
+        # a split without cam topics has no frames (an empty connection list would read every message)
+        if not connections:
+            reader.close()
+            return frames, msgtypes, ExportStats('load', 0, progress_interval=None)
 
-            # log
-            # print(f'Reading message of timestamp {timestamp} for topic {connection.topic}')
+        # storage locators from the bag index in the time window, in the same order as the messages of each topic
+        start, stop = window
+        locators = []
+        for topic in self.camera_topics:
+            indexes = [reader.readers[0].indexes[x.id] for x in connections if x.topic == topic]
+            locators.append([entry for entry in heapq.merge(*indexes) if (start is None or entry.time >= start) and (stop is None or entry.time < stop)])
+        stats = ExportStats('load', sum(len(x) for x in locators), progress_interval=None)
+        locators = [iter(x) for x in locators]
 
+        # for each image connection, store the serialized messages, the bag is read from the start of the window
+        for connection, timestamp, rawdata in stats.timed_iter('read', reader.messages(connections=connections, start=start, stop=stop)):
             # get ith
             ith = self.camera_topics.index(connection.topic)
+            entry = next(locators[ith])
 
-            # deserialize message
-            msg = typestore.deserialize_ros1(rawdata, connection.msgtype)
+            # locate the compressed image in the message, without deserializing it
+            with stats.stage('payload'):
+                try:
+                    payload = ros1_compressed_payload(rawdata)
+                except ValueError as e:
+                    print(f'Failed to read the image of message on topic {connection.topic} at {timestamp}: {e}')
+                    stats.count('failed')
+                    continue
 
             # store data
-            cams[ith].compressed_imgmsg_list.append(msg)
-            cams[ith].timestamp_list.append(timestamp)
-            cams[ith].total_frames += 1
-            cams[ith].blur_regions.append([])
+            arena, entries = frames[ith]
+            entries.append((timestamp, len(arena), (split, entry.chunk_pos, entry.offset)))
+            arena.append(rawdata, payload)
+            msgtypes[ith] = connection.msgtype
+            stats.add_message(connection.topic, len(rawdata))
 
         # close reader
         reader.close()
 
+        return frames, msgtypes, stats
+
+    # build lazy cams from a frame index, frames are read from the bag on demand
+    def get_cams_from_index(self, index):
+        cams = [Cam() for _ in range(len(self.camera_topics))]
+        for ith in range(len(cams)):
+            frame_reader = Ros1FrameReader(self.input_bag_paths, index.msgtypes[ith])
+            cams[ith].set_lazy_frames(frame_reader, index.timestamps[ith], index.locators[ith])
+        return cams
+
+    # read bag and output cam object
+    def get_cams(self):
+        # error check
+        if not self.input_bag_paths:
+            print('No bag files to open.')
+            exit()
+
+        # only the frames in the time window are loaded
+        window = self.time_window_ns()
+        if self.time_window is not None:
+            print(f'Loading the frames from {self.time_window[0]} s to {"the end" if self.time_window[1] is None else f"{self.time_window[1]} s"}')
+
+        # reuse the frame index of a previous session, skips the scan
+        index = self.frame_index_file.read(self.input_bag_paths, self.camera_topics, window)
+        if index is not None:
+            cams = self.get_cams_from_index(index)
+        else:
+            cams = self.scan_cams(window)
+
         # log
         for i in range(len(cams)):
             print(f'loaded {cams[i].total_frames} frames for {self.camera_topics[i]}')
@@ -99,19 +393,257 @@ class BagFileHandler_ros1:
         # return
         return cams
 
-    # write both cam and other topics to bag
-    def export_cams(self, cams):
+    # scan the bags, load the cam messages in the time window and write the frame index
+    def scan_cams(self, window = (None, None)):
+        # initialize cam
+        cams = [Cam() for _ in range(len(self.camera_topics))]
+        stats = ExportStats('load', 0)
+
+        # scan the splits in parallel
+        jobs = [(split, path, window) for split, path in enumerate(self.input_bag_paths)]
+        workers = min(len(jobs), os.cpu_count() or 1)
+        if workers > 1:
+            print(f'Scanning {len(jobs)} bag files with {workers} workers')
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.scan_split, jobs))
+        else:
+            results = [self.scan_split(job) for job in jobs]
+
+        # error check
+        if any(frames is None for frames, _, _ in results):
+            exit()
+
+        # merge the splits into one timeline per camera
+        index = FrameIndex(list(self.camera_topics), ['sensor_msgs/msg/CompressedImage'] * len(cams))
+        for _, msgtypes, split_stats in results:
+            stats.merge(split_stats)
+            stats.total_messages += split_stats.total_messages
+            for ith, msgtype in enumerate(msgtypes):
+                if msgtype is not None:
+                    index.msgtypes[ith] = msgtype
+        for ith in range(len(cams)):
+            if len(results) == 1:
+                # the arena of a single split is used as is
+                arena, entries = results[0][0][ith]
+                cams[ith].set_frames(arena, [timestamp for timestamp, _, _ in entries])
+                locators = [locator for _, _, locator in entries]
+            else:
+                # the arenas of the splits are kept, frames are located by split (no copy into one arena)
+                arenas = SplitArenas(frames[ith][0] for frames, _, _ in results)
+                timestamps = []
+                locators = []
+                split_frames = [[(timestamp, split, frame, locator) for timestamp, frame, locator in frames[ith][1]] for split, (frames, _, _) in enumerate(results)]
+                for timestamp, split, frame, locator in heapq.merge(*split_frames, key=lambda x: x[0]):
+                    arenas.append(split, frame)
+                    timestamps.append(timestamp)
+                    locators.append(locator)
+                cams[ith].set_frames(arenas, timestamps)
+            index.timestamps.append(cams[ith].timestamp_list)
+            index.locators.append(np.array(locators, dtype=np.int64).reshape(-1, 3))
+        stats.finish()
+
+        # persist the frame index for the next session
+        self.frame_index_file.write(index, self.input_bag_paths, self.camera_topics, window)
+
+        return cams
+
+    # write both cam and other topics to bag, one output bag per input split, true once every output is written
+    # listener is called with the stats at every progress line (background export)
+    def export_cams(self, cams, listener = None):
+        # frames blurred by the previous export of these bags
+        frame_fingerprints = FrameFingerprints(self.frames_file_name)
+        frame_fingerprints.load(self.input_bag_paths, self.export_config.blur_method)
+
+        # resume from the checkpoint of an interrupted export, or start over
+        checkpoint = ExportCheckpoint(self.checkpoint_file_name)
+        if self.export_config.resume and checkpoint.load(self.input_bag_paths, cams):
+            print(f'Resuming export from checkpoint "{checkpoint.path}"')
+        else:
+            for output_path in self.output_bag_names:
+                paths = self.create_splitter(output_path).split_paths()
+                if paths and frame_fingerprints.owns(output_path, paths):
+                    # exported before, the unchanged frames are copied from the previous output
+                    for path in paths:
+                        remove_output(previous_path(path))
+                        os.replace(path, previous_path(path))
+                elif paths:
+                    print(f'Bag {output_path} already exists, please rename or delete the existing bag and try again.')
+                    return
+                Path(partial_path(output_path)).unlink(missing_ok=True)
+            checkpoint.start(self.input_bag_paths, cams)
+
+        # stats
+        stats = ExportStats('export', 0)
+        stats.settings = self.export_config.storage_settings()
+        stats.listener = listener
+
+        # blur regions by timestamp
+        regions = [cam.regions_by_timestamp() for cam in cams]
+
+        # previous outputs of each output bag, with the fingerprints of their blurred frames
+        previous_frames = {topic: frame_fingerprints.frames(topic) for topic in self.camera_topics}
+        previous = {}
+        for output_path in self.output_bag_names:
+            paths = frame_fingerprints.previous_outputs(output_path)
+            if paths:
+                print(f'Reusing the unchanged blurred frames of the previous {output_path} ({len(paths)} bags)')
+                previous[output_path] = (paths, previous_frames)
+
+        # write splits to partial bags
+        try:
+            for input_path, output_path in zip(self.input_bag_paths, self.output_bag_names):
+                if checkpoint.is_completed(output_path):
+                    continue
+                if self.export_config.shards > 1:
+                    done = self.export_split_sharded(cams, input_path, output_path, stats, checkpoint, previous.get(output_path))
+                else:
+                    done = self.export_split(regions, input_path, output_path, stats, checkpoint, previous=previous.get(output_path))
+                if not done:
+                    return
+                checkpoint.complete_split(output_path)
+        except KeyboardInterrupt:
+            print(f'\nExport interrupted, export again to resume from checkpoint "{checkpoint.path}".')
+            raise
+
+        # all splits are complete, publish them (split outputs are published while writing)
+        for output_path in self.output_bag_names:
+            if not self.create_splitter(output_path).numbered:
+                os.replace(partial_path(output_path), output_path)
+                stats.add_output(output_path)
+        outputs = [self.create_splitter(output_path).split_paths() for output_path in self.output_bag_names]
+
+        # fingerprints of the blurred frames for the next export
+        frame_fingerprints.write(self.input_bag_paths, self.export_config.blur_method, self.camera_topics, regions,
+                                 dict(zip(self.output_bag_names, outputs)))
+
+        # drop the previous outputs, and the metadata of previous splits that were not written again
+        for output_path, new_paths in zip(self.output_bag_names, outputs):
+            if output_path not in previous:
+                continue
+            splitter = self.create_splitter(output_path)
+            for path in previous[output_path][0]:
+                remove_output(path)
+                path = path[:-len(PREVIOUS_SUFFIX)]
+                if splitter.numbered and path not in new_paths:
+                    Path(path[:-len('.bag')] + '.json').unlink(missing_ok=True)
+        checkpoint.remove()
+
+        # overlay bags are linked to the original bags by a manifest
+        if self.export_config.mode == 'overlay':
+            write_manifest(self.manifest_file_name, 1, self.input_bag_paths, outputs, self.camera_topics,
+                           self.passthrough_topics, stats.counters['blurred'])
+
+        # log
+        stats.finish(self.stats_file_name)
+        for output_path in sum(outputs, []):
+            print(f'Bag file written to {output_path}')
+        return True
+
+    # check if topic is written to the output, overlays only contain the cam topics
+    def is_output_topic(self, topic):
+        if topic in self.camera_topics:
+            return True
+        return self.export_config.mode == 'full' and topic in self.passthrough_topics
+
+    # merge overlay bags with the passthrough topics of the original bags into full bags
+    def merge_overlay(self, manifest):
+        # typestore
+        typestore = get_typestore(Stores.ROS1_NOETIC)
+        stats = ExportStats('merge', 0)
+        stats.settings = self.export_config.storage_settings()
+
+        for input_path, overlay_paths, output_path in zip(self.input_bag_paths, manifest['overlays'], self.output_bag_names):
+            if Path(output_path).exists():
+                print(f'Bag {output_path} already exists, please rename or delete the existing bag and try again.')
+                return
+            Path(partial_path(output_path)).unlink(missing_ok=True)
+
+            # one timeline over the original and its overlay splits
+            reader = self.create_reader([input_path] + [Path(p) for p in overlay_paths])
+            writer = self.create_writer(partial_path(output_path))
+            if reader is None or writer is None:
+                return
+            reader.open()
+            writer.open()
+            original = reader.readers[0]
+
+            # passthrough topics from the original, cam topics from the overlay
+            # (overlay splits share their connections)
+            reader_connections = []
+            output_connections = []
+            added = {}
+            for connection in reader.connections:
+                if connection.owner is original and connection.topic not in self.passthrough_topics:
+                    continue
+                if connection.owner is not original and connection.topic not in self.camera_topics:
+                    continue
+                key = (connection.topic, connection.msgtype, connection.digest)
+                if key not in added:
+                    added[key] = writer.add_connection(connection.topic, connection.msgtype, msgdef=connection.msgdef, typestore=typestore)
+                reader_connections.append(connection)
+                output_connections.append(added[key])
+            stats.total_messages += sum(x.msgcount for x in reader_connections)
+
+            # copy (an empty connection list would read every message)
+            messages = reader.messages(connections=reader_connections) if reader_connections else []
+            for connection, timestamp, rawdata in stats.timed_iter('read', messages):
+                with stats.stage('write'):
+                    writer.write(output_connections[reader_connections.index(connection)], timestamp, rawdata)
+                stats.add_message(connection.topic, len(rawdata), len(rawdata))
+                stats.progress()
+
+            # close and publish
+            reader.close()
+            writer.close()
+            os.replace(partial_path(output_path), output_path)
+            stats.add_output(output_path)
+
+        # log
+        stats.finish()
+        for output_path in self.output_bag_names:
+            print(f'Bag file written to {output_path}')
+
+    # write the messages of one input bag in [start, stop) of window (the whole bag by default), blurring the frames with regions
+    # previous: (paths, frame fingerprints) of the previous output, whose unchanged blurred frames are copied
+    def export_split(self, regions, input_path, output_path, stats, checkpoint = None, window = (None, None), previous = None):
+        # committed state of this split, if resuming
+        split_state = checkpoint.split_state(output_path) if checkpoint else None
+        if window == (None, None):
+            splitter = self.create_splitter(output_path, split_state['splits'] if split_state else None)
+        else:
+            splitter = OutputSplitter(output_path[:-len('.bag')], '.bag')
+        writer_state = split_state['writer'] if split_state else None
+        position_state = split_state['position'] if split_state else None
+
+        # output splits closed before the interruption
+        for path in splitter.publish():
+            stats.add_output(path)
+
         # reader and writer
-        reader = self.create_reader(self.input_bag_path)
-        writer = self.create_writer(self.output_bag_name)
+        reader = self.create_reader(input_path)
+        writer = None
+        if writer_state is not None:
+            writer = self.create_writer(partial_path(splitter.split_path()), writer_state)
+
+            # a partial bag that does not match its checkpoint is written again
+            if writer is None:
+                print(f'Writing {splitter.split_path()} from the start.')
+                writer_state = None
+                position_state = splitter.start_position
+
+        # otherwise drop any uncommitted partial bag
+        if writer_state is None:
+            Path(partial_path(splitter.split_path())).unlink(missing_ok=True)
+            writer = self.create_writer(partial_path(splitter.split_path()))
 
         # error check
         if reader is None or writer is None:
-            return
+            return False
 
         # open
         reader.open()
-        writer.open()
+        if writer_state is None:
+            writer.open()
         
         # typestore
         typestore = get_typestore(Stores.ROS1_NOETIC)
@@ -121,58 +653,401 @@ class BagFileHandler_ros1:
         output_connections = []
         for connection in reader.connections:
             # skip if not in recognized topics
-            if connection.topic not in self.passthrough_topics and connection.topic not in self.camera_topics:
+            if not self.is_output_topic(connection.topic):
                 continue
-            
-            # add connection
-            output_connection = writer.add_connection(connection.topic, connection.msgtype, msgdef=connection.msgdef, typestore=typestore)
 
             # store connections
             reader_connections.append(connection) # this is stored to provide indexing later
+
+            # a resumed writer already has the connections, in the same order
+            if writer_state is not None:
+                continue
+
+            # add connection
+            output_connection = writer.add_connection(connection.topic, connection.msgtype, msgdef=connection.msgdef, typestore=typestore)
             output_connections.append(output_connection)
 
             # log
             print(f'Added connection {connection.topic}')
+        if writer_state is not None:
+            output_connections = list(writer.connections)
+        topic_types = {x.topic: x.msgtype for x in reader_connections}
+
+        # position in the input stream, continues after the committed messages when resuming
+        position = StreamPosition(position_state)
+        if position.last_timestamp is not None:
+            print(f'Resuming {output_path} after {position.messages} messages (timestamp {position.last_timestamp})')
+
+        # stats
+        stats.total_messages += sum(x.msgcount for x in reader_connections) - position.messages
+        last_checkpoint_time = time.perf_counter()
 
         # for each message
-        for connection, timestamp, rawdata in reader.messages():
-            # skip if not in recognized topics
-            if connection.topic not in self.passthrough_topics and connection.topic not in self.camera_topics:
+        start = position.last_timestamp if position.last_timestamp is not None else window[0]
+        # a split without output topics (e.g. no cam topic in overlay mode) has nothing to copy,
+        # an empty connection list would read every message
+        messages = reader.messages(connections=reader_connections, start=start, stop=window[1]) if reader_connections else []
+        previous_output = self.open_previous(previous, start) if previous else None
+        for connection, timestamp, rawdata in stats.timed_iter('read', messages):
+            # skip messages committed before the checkpoint
+            if position.skip(timestamp):
                 continue
-            
-            # log
-            print(f'Writing message of timestamp {timestamp} for topic {connection.topic}')
-            
+
+            # start the next output split once the current one is full
+            if splitter.should_roll(timestamp, writer.bio.tell() + writer.chunks[-1].data.tell()):
+                with stats.stage('split'):
+                    writer = self.roll_split(writer, splitter, input_path, output_path, topic_types, position, checkpoint, stats)
+                if writer is None:
+                    reader.close()
+                    return False
+                output_connections = list(writer.connections)
+                last_checkpoint_time = time.perf_counter()
+
             # find output connection
             output_connection = output_connections[reader_connections.index(connection)]
 
             # check if connection is in cam topics
+            new_rawdata = rawdata
             if connection.topic in self.camera_topics:
 
                 # check if blur regions are added
-                ith = self.camera_topics.index(connection.topic)
-                frame = cams[ith].timestamp_list.index(timestamp)
-                if cams[ith].blur_regions[frame]:
-                    # create new rawdata
-                    new_image = cams[ith].get_image_with_blur(frame)
-                    new_msg = self.image_to_compressed_msg(new_image, cams[ith].compressed_imgmsg_list[frame].header)
-                    new_rawdata = typestore.serialize_ros1(new_msg, connection.msgtype)
-
-                    # use the new rawdata
-                    writer.write(output_connection, timestamp, new_rawdata)
+                frame_regions = regions[self.camera_topics.index(connection.topic)].get(timestamp)
+                payload = None
+                if frame_regions and previous_output is not None:
+                    # same regions as in the previous export, its payload is copied
+                    with stats.stage('reuse'):
+                        payload = previous_output.payload(connection.topic, timestamp, region_fingerprint(frame_regions, self.export_config.blur_method))
+                if payload is not None:
+                    new_rawdata = payload
+                    stats.count('reused')
+                elif frame_regions:
+                    # create new rawdata, the image is decoded from the message being exported
+                    with stats.stage('deserialize'):
+                        msg = typestore.deserialize_ros1(rawdata, connection.msgtype)
+                    with stats.stage('decode'):
+                        new_image = decode_compressed(msg.data)
+                    with stats.stage('blur'):
+                        blur_image(new_image, frame_regions, self.export_config.blur_method)
+                    with stats.stage('encode'):
+                        new_msg = self.image_to_compressed_msg(new_image, msg.header)
+                    with stats.stage('serialize'):
+                        new_rawdata = typestore.serialize_ros1(new_msg, connection.msgtype)
+                    stats.count('blurred')
                 else:
-                    # use the same rawdata
-                    writer.write(output_connection, timestamp, rawdata)
+                    stats.count('unchanged')
             else:
-                # write other topics using the same rawdata
-                writer.write(output_connection, timestamp, rawdata)
+                stats.count('passthrough')
+
+            # write the new rawdata, or the same rawdata if untouched
+            flushed_chunks = len(writer.chunks)
+            with stats.stage('write'):
+                writer.write(output_connection, timestamp, new_rawdata)
+            position.record(connection.topic, timestamp)
+            splitter.record(connection.topic, timestamp, len(new_rawdata))
+
+            # checkpoint right after a chunk was flushed, everything written is then on disk
+            interval = self.export_config.checkpoint_interval
+            if checkpoint is not None and interval is not None and len(writer.chunks) != flushed_chunks and time.perf_counter() - last_checkpoint_time >= interval:
+                with stats.stage('checkpoint'):
+                    checkpoint.save_split(output_path, position, writer.checkpoint_state(), splitter.to_dict())
+                last_checkpoint_time = time.perf_counter()
+
+            # progress
+            stats.add_message(connection.topic, len(rawdata), len(new_rawdata))
+            stats.progress()
 
         # close
         reader.close()
         writer.close()
+        if previous_output is not None:
+            previous_output.close()
 
-        # log
-        print(f'Bag file written to {writer.path}')
+        # the last output split is published right away
+        if splitter.enabled:
+            splitter.finish_split(input_path, topic_types, position)
+            checkpoint.save_split(output_path, position, None, splitter.to_dict())
+            for path in splitter.publish():
+                stats.add_output(path)
+        return True
+
+    # export one input bag as time shards written by parallel processes, merged (or kept as splits) at the end
+    def export_split_sharded(self, cams, input_path, output_path, stats, checkpoint, previous = None):
+        # time range of the bag
+        reader = self.create_reader(input_path)
+        if reader is None:
+            return False
+        reader.open()
+        start_time, end_time = reader.start_time, reader.end_time
+        stats.total_messages += sum(x.msgcount for x in reader.connections if self.is_output_topic(x.topic))
+        reader.close()
+
+        # shard windows, the first and the last one are open so every message falls in exactly one shard
+        shards = self.export_config.shards
+        bounds = [None] + [start_time + (end_time - start_time) * k // shards for k in range(1, shards)] + [None]
+        shard_paths = [OutputSplitter(output_path[:-len('.bag')], '.bag', numbered=True).split_path(k) for k in range(shards)]
+
+        # jobs of the shards not finished before an interruption
+        jobs = []
+        for k, shard_path in enumerate(shard_paths):
+            if checkpoint.is_completed(shard_path) and Path(partial_path(shard_path)).exists():
+                continue
+            window = (bounds[k], bounds[k + 1])
+            jobs.append((k, input_path, shard_path, window, [cam.regions_by_timestamp(*window) for cam in cams], previous))
+
+        # export the shards in parallel
+        workers = min(len(jobs), os.cpu_count() or 1)
+        print(f'Exporting {input_path} in {shards} shards with {workers} workers')
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for k, shard_stats in executor.map(self.export_shard, jobs):
+                    if shard_stats is None:
+                        return False
+                    stats.merge(shard_stats)
+                    checkpoint.complete_split(shard_paths[k])
+                    stats.progress(force=True)
+
+        # publish the shards as splits, or merge them in order into the output
+        if self.export_config.keep_shards:
+            splitter = self.create_splitter(output_path)
+            splitter.pending = [self.shard_metadata(shard_path, k, input_path) for k, shard_path in enumerate(shard_paths)]
+            for path in splitter.publish():
+                stats.add_output(path)
+        else:
+            with stats.stage('merge'):
+                if not self.merge_shards(shard_paths, output_path):
+                    return False
+        return True
+
+    # export one shard into its partial bag, runs in a worker process
+    def export_shard(self, job):
+        k, input_path, shard_path, window, regions, previous = job
+        stats = ExportStats('shard', 0, progress_interval=None)
+        if not self.export_split(regions, input_path, shard_path, stats, window=window, previous=previous):
+            return k, None
+        return k, stats
+
+    # dry run of export_cams: the frames to re-encode, the bytes copied per topic, the expected output size and runtime,
+    # from the frame index and the regions with timed samples. No bag is written, only the plan json
+    # write_sample: time the writes of the samples on disk, in a scratch bag in the system temp folder, instead of in memory
+    def plan_export(self, cams, write_sample = False):
+        frame_fingerprints = FrameFingerprints(self.frames_file_name)
+        frame_fingerprints.load(self.input_bag_paths, self.export_config.blur_method)
+        regions = [cam.regions_by_timestamp() for cam in cams]
+        plan = ExportPlan(self.export_config, self.camera_topics, time_frame_costs(cams, self.export_config.blur_method))
+        for input_path, output_path in zip(self.input_bag_paths, self.output_bag_names):
+            sample = self.sample_bag(input_path, write_sample)
+            if sample is None:
+                return None
+
+            # an export of the same bags again copies the unchanged frames of the previous outputs
+            paths = self.create_splitter(output_path).split_paths()
+            previous_frames = None
+            if paths and frame_fingerprints.owns(output_path, paths):
+                previous_frames = {topic: frame_fingerprints.frames(topic) for topic in self.camera_topics}
+            elif paths:
+                print(f'Bag {output_path} already exists, the export would refuse to overwrite it.')
+            plan.add_bag(input_path, output_path, sample, regions, previous_frames)
+        return plan.finish(self.plan_file_name)
+
+    # message counts of the output topics of a bag, and a few windows of its messages read and written again with the output
+    # compression (into memory, or a scratch bag in the system temp folder with write_sample), for the export planner
+    def sample_bag(self, input_path, write_sample = False):
+        reader = self.create_reader(input_path)
+        if reader is None:
+            return None
+        reader.open()
+        connections = [x for x in reader.connections if self.is_output_topic(x.topic)]
+        sample = new_sample(reader.start_time, reader.end_time)
+        for connection in connections:
+            add_sample_topic(sample, connection.topic, connection.msgcount)
+
+        # windows spread over the bag, each starting after the previous one
+        messages = []
+        next_start = reader.start_time
+        for start in sample_starts(reader.start_time, reader.end_time):
+            if not connections:
+                break
+            read_start = time.perf_counter()
+            for k, (connection, timestamp, rawdata) in enumerate(reader.messages(connections=connections, start=max(start, next_start))):
+                if k == PLAN_SAMPLE_MESSAGES:
+                    break
+                messages.append((connection, timestamp, rawdata))
+                add_sample_message(sample, connection.topic, len(rawdata))
+                next_start = timestamp + 1
+            sample['read_seconds'] += time.perf_counter() - read_start
+        reader.close()
+
+        # write the sample as the export would
+        typestore = get_typestore(Stores.ROS1_NOETIC)
+        with tempfile.TemporaryDirectory() if write_sample else nullcontext() as folder:
+            path = Path(folder) / 'sample.bag' if write_sample else None
+            writer = self.create_writer(path)
+            if writer is None:
+                return None
+            write_start = time.perf_counter()
+            writer.open()
+            output_connections = {}
+            for connection, timestamp, rawdata in messages:
+                if connection.id not in output_connections:
+                    output_connections[connection.id] = writer.add_connection(connection.topic, connection.msgtype, msgdef=connection.msgdef, typestore=typestore)
+                writer.write(output_connections[connection.id], timestamp, rawdata)
+                sample['written_bytes'] += len(rawdata)
+            writer.close()
+            sample['write_seconds'] = time.perf_counter() - write_start
+            sample['bytes_on_disk'] = path.stat().st_size if write_sample else writer.size
+        return sample
+
+    # compare the exported bags with the input bags in time windows checked by parallel processes, true when they match:
+    # same messages and timestamps, bytes copied as they are, except the frames with regions which must be blurred inside them
+    def verify_export(self, cams):
+        stats = ExportStats('verify', 0)
+        jobs = []
+        shards = os.cpu_count() or 1
+        for input_path, output_path in zip(self.input_bag_paths, self.output_bag_names):
+            output_paths = self.create_splitter(output_path).split_paths()
+            if not output_paths:
+                print(f'Bag {output_path} does not exist, export it first.')
+                return False
+
+            # time windows of the input bag
+            reader = self.create_reader(input_path)
+            if reader is None:
+                return False
+            reader.open()
+            start_time, end_time = reader.start_time, reader.end_time
+            stats.total_messages += sum(x.msgcount for x in reader.connections if self.is_output_topic(x.topic))
+            reader.close()
+            bounds = shard_bounds(start_time, end_time, shards)
+            for k in range(shards):
+                window = (bounds[k], bounds[k + 1])
+                jobs.append((input_path, output_paths, window, [cam.regions_by_timestamp(*window) for cam in cams]))
+
+        # check the windows in parallel
+        problems = []
+        workers = min(len(jobs), os.cpu_count() or 1)
+        print(f'Verifying {len(self.output_bag_names)} exported bags in {len(jobs)} windows with {workers} workers')
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for window_stats, window_problems in executor.map(self.verify_window, jobs):
+                stats.merge(window_stats)
+                problems += window_problems
+                stats.progress()
+        return finish_verification(stats, problems, self.verify_file_name)
+
+    # (timestamp, side, topic, rawdata) of the output topics of a reader in [start, stop)
+    def window_messages(self, reader, start, stop, side):
+        connections = [x for x in reader.connections if self.is_output_topic(x.topic)]
+        if not connections:
+            return
+        for connection, timestamp, rawdata in reader.messages(connections=connections, start=start, stop=stop):
+            yield timestamp, side, connection.topic, rawdata
+
+    # compare the messages of one time window of an input bag and its exported bags, runs in a worker process
+    def verify_window(self, job):
+        input_path, output_paths, (start, stop), regions = job
+        stats = ExportStats('verify', 0, progress_interval=None)
+        comparer = StreamComparer(self.camera_topics, regions, self.export_config.blur_method, ros1_compressed_payload, stats)
+
+        input_reader = self.create_reader(input_path)
+        output_reader = self.create_reader([Path(p) for p in output_paths])
+        input_reader.open()
+        output_reader.open()
+
+        # both streams side by side, in timestamp order
+        streams = [self.window_messages(reader, start, stop, side) for side, reader in enumerate((input_reader, output_reader))]
+        for timestamp, side, topic, rawdata in stats.timed_iter('read', heapq.merge(*streams, key=lambda x: (x[0], x[1]))):
+            comparer.add(side, topic, timestamp, rawdata)
+        problems = comparer.finish()
+
+        input_reader.close()
+        output_reader.close()
+        return stats, problems
+
+    # metadata of a shard bag, as written for splits
+    def shard_metadata(self, shard_path, index, input_path):
+        reader = self.create_reader(Path(partial_path(shard_path)))
+        reader.open()
+        topics = {}
+        for connection in reader.connections:
+            if connection.msgcount:
+                topic = topics.setdefault(connection.topic, {'type': connection.msgtype, 'message_count': 0})
+                topic['message_count'] += connection.msgcount
+        metadata = {
+            'path': os.path.basename(shard_path),
+            'index': index,
+            'source': str(input_path),
+            'start_time': reader.start_time if reader.message_count else None,
+            'end_time': reader.end_time - 1 if reader.message_count else None,
+            'message_count': reader.message_count,
+            'topics': topics,
+        }
+        reader.close()
+        return metadata
+
+    # camera messages of the previous output from start on, read in step with the export
+    def open_previous(self, previous, start):
+        paths, frames = previous
+        reader = self.create_reader([Path(p) for p in paths])
+        if reader is None:
+            return None
+        reader.open()
+        connections = [x for x in reader.connections if x.topic in self.camera_topics]
+
+        def messages():
+            try:
+                if connections:
+                    for connection, timestamp, rawdata in reader.messages(connections=connections, start=start):
+                        yield connection.topic, timestamp, rawdata
+            finally:
+                reader.close()
+        return PreviousOutput(frames, messages())
+
+    # concatenate the time ordered shard bags into the partial output bag
+    def merge_shards(self, shard_paths, output_path):
+        Path(partial_path(output_path)).unlink(missing_ok=True)
+        writer = self.create_writer(partial_path(output_path))
+        if writer is None:
+            return False
+        writer.open()
+
+        # shards have the same connections, in the same order
+        output_connections = None
+        for shard_path in shard_paths:
+            reader = self.create_reader(Path(partial_path(shard_path)))
+            if reader is None:
+                return False
+            reader.open()
+            if output_connections is None:
+                output_connections = [writer.add_connection(c.topic, c.msgtype, msgdef=c.msgdef.data, md5sum=c.digest, callerid=c.ext.callerid, latching=c.ext.latching)
+                                      for c in reader.connections]
+            for connection, timestamp, rawdata in reader.messages():
+                writer.write(output_connections[reader.connections.index(connection)], timestamp, rawdata)
+            reader.close()
+
+        # close and drop the shards
+        writer.close()
+        for shard_path in shard_paths:
+            Path(partial_path(shard_path)).unlink()
+        return True
+
+    # close the current output split, publish it and open the next one with the same connections
+    def roll_split(self, writer, splitter, input_path, output_path, topic_types, position, checkpoint, stats):
+        writer.close()
+        splitter.finish_split(input_path, topic_types, position)
+
+        # the next split starts empty at the current position
+        checkpoint.save_split(output_path, position, None, splitter.to_dict())
+        for path in splitter.publish():
+            stats.add_output(path)
+
+        # open
+        Path(partial_path(splitter.split_path())).unlink(missing_ok=True)
+        next_writer = self.create_writer(partial_path(splitter.split_path()))
+        if next_writer is None:
+            return None
+        next_writer.open()
+        for c in writer.connections:
+            next_writer.add_connection(c.topic, c.msgtype, msgdef=c.msgdef.data, md5sum=c.digest, callerid=c.ext.callerid, latching=c.ext.latching)
+        return next_writer
 
     def image_to_compressed_msg(self, image, header):
         _, compressed_image = cv2.imencode('.jpg', image)
@@ -1,7 +1,12 @@
 # BagFileHnadler_ros2.py
 import os
+import time
+import heapq
+import shutil
+import tempfile
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 # numpy / opencv
 import numpy as np
@@ -15,11 +20,70 @@ from rosidl_runtime_py.utilities import get_message
 from sensor_msgs.msg import CompressedImage
 
 # blur_face_manual Cam (keeps your existing Cam API)
-from blur_face_manual.Cam import Cam
+from blur_face_manual.Cam import Cam, decode_compressed
+from blur_face_manual.BlurRegion import blur_image
+from blur_face_manual.ExportStats import ExportStats
+from blur_face_manual.BagSet import expand_bag_paths, session_stem
+from blur_face_manual.FrameIndex import FrameIndex, FrameIndexFile
+from blur_face_manual.ExportConfig import ExportConfig
+from blur_face_manual.ExportCheckpoint import ExportCheckpoint, StreamPosition, partial_path
+from blur_face_manual.Overlay import write_manifest
+from blur_face_manual.OutputSplits import OutputSplitter
+from blur_face_manual.FrameArena import FrameArena, SplitArenas, cdr_compressed_payload
+from blur_face_manual.ExportPlanner import ExportPlan, PLAN_SAMPLE_MESSAGES, add_sample_message, add_sample_topic, new_sample, sample_starts, time_frame_costs
+from blur_face_manual.ExportVerifier import StreamComparer, finish_verification, shard_bounds
+from blur_face_manual.IncrementalExport import FrameFingerprints, PreviousOutput, PREVIOUS_SUFFIX, region_fingerprint, previous_path, remove_output
 
-ros_distro = os.environ.get('ROS_DISTRO')
-assert ros_distro in ['humble', "jazzy"], f'Unsupported ROS_DISTRO: {ros_distro}'
-print(f'ROS_DISTRO: {ros_distro}')
+# ROS 2 distributions the handler is tested with, checked when a handler is created
+SUPPORTED_ROS_DISTROS = ['humble', 'jazzy']
+
+
+# Output compression per storage plugin: mcap compresses chunks, sqlite3 compresses messages (zstd plugin)
+ROS2_COMPRESSIONS = {'mcap': ['none', 'lz4', 'zstd'], 'sqlite3': ['none', 'zstd']}
+MCAP_COMPRESSION = {'none': 'None', 'lz4': 'Lz4', 'zstd': 'Zstd'}
+
+
+class Ros2FrameReader:
+    """
+    Reads single messages of rosbag2 bags by (bag, timestamp) locator, as stored in the
+    frame index, using seek on a SequentialReader filtered to one topic.
+    """
+
+    def __init__(self, handler, topic, msg_type):
+        self.handler = handler
+        self.topic = topic
+        self.msg_type = msg_type
+        self.readers = {}
+
+    def read_raw(self, locator):
+        bag, timestamp = (int(x) for x in locator)
+        if bag not in self.readers:
+            reader = self.handler.create_reader(self.handler.input_bag_paths[bag])
+            reader.set_filter(rosbag2_py.StorageFilter(topics=[self.topic]))
+            self.readers[bag] = reader
+        reader = self.readers[bag]
+        reader.seek(timestamp)
+        if not reader.has_next():
+            raise RuntimeError(f'No message on {self.topic} at {timestamp}')
+        _, data, _ = reader.read_next()
+        return data
+
+    def payload(self, locator):
+        """
+        Compressed image of the message, a view of the serialized message (no deserialization).
+        """
+        data = self.read_raw(locator)
+        offset, length = cdr_compressed_payload(data)
+        return memoryview(data)[offset:offset + length]
+
+    def clone(self):
+        """
+        Reader with its own bag readers, for another thread.
+        """
+        return Ros2FrameReader(self.handler, self.topic, self.msg_type)
+
+    def close(self):
+        self.readers = {}
 
 
 class BagFileHandler_ros2:
@@ -30,9 +94,18 @@ class BagFileHandler_ros2:
         create_reader(path), create_writer(path), get_cams(), export_cams(cams), image_to_compressed_msg(image, header)
     """
 
-    def __init__(self, path, export_folder, camera_topics, passthrough_topics):
-        # input bag path (string)
-        self.input_bag_path = str(path)
+    def __init__(self, path, export_folder, camera_topics, passthrough_topics, export_config = None, time_window = None):
+        # the TopicMetadata signature differs between distributions
+        self.ros_distro = os.environ.get('ROS_DISTRO')
+        if self.ros_distro not in SUPPORTED_ROS_DISTROS:
+            raise RuntimeError(f'Unsupported ROS_DISTRO: {self.ros_distro}, expected one of {SUPPORTED_ROS_DISTROS}')
+        print(f'ROS_DISTRO: {self.ros_distro}')
+
+        # input bag paths (strings): a single bag (possibly a multi-file rosbag2 directory)
+        # or a set of bags forming one logical timeline
+        self.input_bag_paths = [str(p) for p in expand_bag_paths(path)] or [str(path)]
+        self.input_bag_path = self.input_bag_paths[0]
+        self.session_stem = session_stem(self.input_bag_paths)
 
         # Robust handling for empty export_folder: default to current working directory
         if not export_folder:
@@ -40,17 +113,41 @@ class BagFileHandler_ros2:
         export_folder = os.path.expanduser(str(export_folder))
         os.makedirs(export_folder, exist_ok=True)
 
+        # export settings
+        self.export_config = export_config or ExportConfig()
+        suffix = '_blurred_overlay' if self.export_config.mode == 'overlay' else '_blurred'
+
         # Build output bag URI / folder name in same scheme as original: <export_folder>/<input_stem>_blurred
-        self.output_bag_name = os.path.join(export_folder, Path(self.input_bag_path).stem + '_blurred')
+        # (one output bag per input bag; <input_stem>_blurred_overlay in overlay mode)
+        self.output_bag_names = [os.path.join(export_folder, Path(p).stem + suffix) for p in self.input_bag_paths]
+        self.output_bag_name = self.output_bag_names[0]
+        self.stats_file_name = os.path.join(export_folder, self.session_stem + suffix + '_stats.json')
+        self.checkpoint_file_name = os.path.join(export_folder, self.session_stem + suffix + '_checkpoint.json')
+        self.frames_file_name = os.path.join(export_folder, self.session_stem + suffix + '_frames.json')
+        self.verify_file_name = os.path.join(export_folder, self.session_stem + suffix + '_verify.json')
+        self.plan_file_name = os.path.join(export_folder, self.session_stem + suffix + '_plan.json')
+        self.manifest_file_name = os.path.join(export_folder, self.session_stem + '_blurred_overlay.json')
 
         # camera topics and passthrough topics (keeps API)
         self.camera_topics = camera_topics or []
         self.passthrough_topics = passthrough_topics or []
 
+        # (start, end) seconds from the start of the bag(s) to load, None for the whole bag
+        self.time_window = time_window
+
+        # Sidecar frame index next to the bag(s)
+        self.frame_index_file = FrameIndexFile(Path(self.input_bag_path).parent / (self.session_stem + '_frameindex.npz'))
+
         # Detect storage plugin from input bag (sqlite3 vs mcap)
         self.storage_id = self._detect_storage_id(self.input_bag_path)
         print(f'Using storage plugin: {self.storage_id}')
 
+        # Output storage tuning: mcap chunking/compression go through a storage config file
+        compression = self.export_config.compression
+        if compression not in ROS2_COMPRESSIONS[self.storage_id]:
+            raise ValueError(f'{self.storage_id} bags support compression {ROS2_COMPRESSIONS[self.storage_id]}, not "{compression}"')
+        self.storage_config_file = os.path.join(export_folder, self.session_stem + '_storage_config.yaml')
+
     # ----------------- storage detection -----------------
     def _detect_storage_id(self, uri: str) -> str:
         p = Path(uri)
@@ -76,9 +173,22 @@ class BagFileHandler_ros2:
         return 'sqlite3'
 
     # ----------------- Reader / Writer creation -----------------
+    def _compression_format(self, uri):
+        """
+        Message compression of a bag from its metadata ('' for none), e.g. zstd for the sqlite3 outputs of the tool.
+        """
+        try:
+            return rosbag2_py.Info().read_metadata(uri, self.storage_id).compression_format
+        except Exception:
+            return ''
+
     def create_reader(self, path):
+        # Compressed messages are decompressed, so they are not compressed twice when copied to a compressing writer
         uri = str(path)
-        reader = rosbag2_py.SequentialReader()
+        if self._compression_format(uri):
+            reader = rosbag2_py.SequentialCompressionReader()
+        else:
+            reader = rosbag2_py.SequentialReader()
         storage_options = StorageOptions(uri=uri, storage_id=self.storage_id)
         converter_options = ConverterOptions(
             input_serialization_format='cdr',
@@ -90,10 +200,45 @@ class BagFileHandler_ros2:
             raise RuntimeError(f'Failed to open reader for uri="{uri}" with storage_id="{self.storage_id}": {e}')
         return reader
 
+    def _storage_config_uri(self):
+        """
+        Writes the mcap storage config (chunk size, chunk compression) used by the writers,
+        returns '' when the backend defaults apply.
+        """
+        config = self.export_config
+        if self.storage_id != 'mcap' or (config.chunk_size is None and config.compression == 'none'):
+            return ''
+        lines = []
+        if config.chunk_size is not None:
+            lines.append(f'chunkSize: {int(config.chunk_size)}')
+        if config.compression != 'none':
+            lines.append(f'compression: "{MCAP_COMPRESSION[config.compression]}"')
+        with open(self.storage_config_file, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return self.storage_config_file
+
     def create_writer(self, path):
         uri = str(path)
-        writer = rosbag2_py.SequentialWriter()
+        config = self.export_config
         storage_options = StorageOptions(uri=uri, storage_id=self.storage_id)
+        if config.storage_preset:
+            storage_options.storage_preset_profile = config.storage_preset
+        if config.cache_size is not None:
+            storage_options.max_cache_size = int(config.cache_size)
+        storage_options.storage_config_uri = self._storage_config_uri()
+        if config.chunk_size is not None and self.storage_id != 'mcap':
+            print(f'Warning: chunk_size is ignored by the {self.storage_id} storage plugin')
+
+        # sqlite3 has no chunks: compress each message with the zstd compression plugin
+        if config.compression == 'zstd' and self.storage_id == 'sqlite3':
+            compression_options = rosbag2_py.CompressionOptions(
+                compression_format='zstd',
+                compression_mode=rosbag2_py.CompressionMode.MESSAGE
+            )
+            writer = rosbag2_py.SequentialCompressionWriter(compression_options)
+        else:
+            writer = rosbag2_py.SequentialWriter()
+
         converter_options = ConverterOptions(
             input_serialization_format='cdr',
             output_serialization_format='cdr'
@@ -104,6 +249,14 @@ class BagFileHandler_ros2:
             raise RuntimeError(f'Failed to open writer for uri="{uri}" with storage_id="{self.storage_id}": {e}')
         return writer
 
+    def _create_splitter(self, output_uri, state=None):
+        """
+        Splits of an output bag by the configured maximum size or duration (or kept shards), each its own bag folder.
+        """
+        config = self.export_config
+        numbered = config.shards > 1 and config.keep_shards
+        return OutputSplitter(output_uri, '', config.split_size, config.split_duration, state, numbered)
+
     # ----------------- helper diagnostics -----------------
     def _summarize_bag_topics(self, reader):
         """
@@ -120,22 +273,133 @@ class BagFileHandler_ros2:
             counts[topic] += 1
         return topic_type_map, counts
 
+    def _metadata_message_counts(self, reader):
+        """
+        Returns {topic_name: message_count} from the bag metadata without iterating the bag.
+        """
+        try:
+            metadata = reader.get_metadata()
+            return {t.topic_metadata.name: t.message_count for t in metadata.topics_with_message_count}
+        except Exception:
+            return {}
+
     # ----------------- Read bag and output cam object -----------------
+    def _scan_bag(self, args):
+        """
+        Read the camera topics of one input bag in the time window [start, stop), seeking to its start.
+        The serialized messages are kept as they are, one arena per topic, without deserializing them.
+        Runs in a worker process when several bags are opened.
+        Returns ({topic: (arena, [timestamp of each frame])}, stats).
+        """
+        uri, topics, (start, stop) = args
+        reader = self.create_reader(uri)
+        stats = ExportStats('load', 0, progress_interval=None)
+        frames = {t: (FrameArena(), []) for t in topics}
+        if start is not None:
+            reader.seek(start)
+
+        while reader.has_next():
+            with stats.stage('read'):
+                topic, data, timestamp = reader.read_next()
+            if stop is not None and timestamp >= stop:
+                break
+
+            if topic not in frames:
+                continue
+
+            # Locate the compressed image in the message
+            with stats.stage('payload'):
+                try:
+                    payload = cdr_compressed_payload(data)
+                except ValueError as e:
+                    print(f'Failed to read the image of message on topic {topic} at {timestamp}: {e}')
+                    stats.count('failed')
+                    continue
+
+            arena, timestamps = frames[topic]
+            arena.append(data, payload)
+            timestamps.append(timestamp)
+            stats.add_message(topic, len(data))
+
+        del reader
+        return frames, stats
+
+    def _msg_type(self, msg_type_str):
+        try:
+            return get_message(msg_type_str)
+        except Exception:
+            return CompressedImage
+
     def get_cams(self):
         """
-        Read camera topics from the input bag and return a list of Cam objects,
-        preserving stored compressed image messages and timestamps.
+        Read camera topics from the input bag(s) and return a list of Cam objects.
+        A valid sidecar frame index skips the scan: frames are then read from the bag on demand.
+        With a time window only the frames of the window are loaded.
         Signature preserved: get_cams(self)
         """
-        # First, open a reader to fetch topic metadata and counts
-        reader_for_meta = self.create_reader(self.input_bag_path)
-        all_topic_types = reader_for_meta.get_all_topics_and_types()
-        topic_type_map = {t.name: t.type for t in all_topic_types}
+        window = self.time_window_ns()
+        if self.time_window is not None:
+            print(f'Loading the frames from {self.time_window[0]} s to {"the end" if self.time_window[1] is None else f"{self.time_window[1]} s"}')
 
-        # Create a second reader to count message counts
-        reader_for_count = self.create_reader(self.input_bag_path)
-        _, counts = self._summarize_bag_topics(reader_for_count)
-        del reader_for_count
+        index = self.frame_index_file.read(self.input_bag_paths, self.camera_topics, window)
+        if index is not None:
+            cams = self._get_cams_from_index(index)
+        else:
+            cams = self._scan_cams(window)
+
+        # Print loaded frame counts
+        for i, topic in enumerate(self.camera_topics):
+            print(f'loaded {cams[i].total_frames} frames for {topic}')
+
+        return cams
+
+    def time_window_ns(self):
+        """
+        Time window of the session in nanoseconds, (None, None) for the whole bag.
+        """
+        if self.time_window is None:
+            return (None, None)
+        start_time = min(self._time_range(uri)[0] for uri in self.input_bag_paths)
+        start, end = self.time_window
+        return (start_time + int(start * 1e9), None if end is None else start_time + int(end * 1e9))
+
+    def _get_cams_from_index(self, index):
+        """
+        Build lazy Cam objects from a frame index.
+        """
+        self.camera_topics = list(index.topics)
+        cams = [Cam() for _ in range(len(index.topics))]
+        for ith, topic in enumerate(index.topics):
+            frame_reader = Ros2FrameReader(self, topic, self._msg_type(index.msgtypes[ith]))
+            cams[ith].set_lazy_frames(frame_reader, index.timestamps[ith], index.locators[ith])
+        return cams
+
+    def _scan_cams(self, window=(None, None)):
+        """
+        Read camera topics from the input bag(s) in the time window, keeping the serialized compressed
+        image messages (one arena per camera) and timestamps, and write the frame index for later sessions.
+        Several input bags are merged into one timeline per camera.
+        """
+        # First, open a reader per bag to fetch topic metadata and counts
+        all_topic_types = []
+        topic_type_map = {}
+        counts = defaultdict(int)
+        for uri in self.input_bag_paths:
+            reader_for_meta = self.create_reader(uri)
+            for t in reader_for_meta.get_all_topics_and_types():
+                if t.name not in topic_type_map:
+                    all_topic_types.append(t)
+                    topic_type_map[t.name] = t.type
+            bag_counts = self._metadata_message_counts(reader_for_meta)
+            del reader_for_meta
+
+            # Fall back to counting by iterating the bag when metadata has no counts
+            if not bag_counts:
+                reader_for_count = self.create_reader(uri)
+                _, bag_counts = self._summarize_bag_topics(reader_for_count)
+                del reader_for_count
+            for topic, cnt in bag_counts.items():
+                counts[topic] += cnt
 
         # Print available topics and their types & counts
         print('Available topics in bag (topic : type) and message counts:')
@@ -176,39 +440,49 @@ class BagFileHandler_ros2:
 
         # Prepare Cam objects in the same order as effective_camera_topics
         cams = [Cam() for _ in range(len(effective_camera_topics))]
+        # (the message count of a time window is not known before the scan)
+        stats = ExportStats('load', sum(counts.get(t, 0) for t in effective_camera_topics) if window == (None, None) else 0)
 
-        # Iterate the bag and populate cams (open a fresh reader)
-        reader = self.create_reader(self.input_bag_path)
-
-        while reader.has_next():
-            topic, data, timestamp = reader.read_next()
-
-            if topic not in effective_camera_topics:
-                continue
+        # Scan the bags (in parallel when there are several)
+        jobs = [(uri, effective_camera_topics, window) for uri in self.input_bag_paths]
+        workers = min(len(jobs), os.cpu_count() or 1)
+        if workers > 1:
+            print(f'Scanning {len(jobs)} bags with {workers} workers')
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._scan_bag, jobs))
+        else:
+            results = [self._scan_bag(job) for job in jobs]
+        for _, bag_stats in results:
+            stats.merge(bag_stats)
 
-            ith = effective_camera_topics.index(topic)
-            msg_type_str = topic_type_map.get(topic, 'sensor_msgs/msg/CompressedImage')
-            try:
-                msg_type = get_message(msg_type_str)
-                msg = deserialize_message(data, msg_type)
-            except Exception:
-                try:
-                    msg = deserialize_message(data, CompressedImage)
-                except Exception as e:
-                    print(f'Failed to deserialize message on topic {topic} at {timestamp}: {e}')
-                    continue
+        # Populate cams with the serialized messages, merging the bags into one timeline per camera
+        msgtypes = [topic_type_map.get(t, 'sensor_msgs/msg/CompressedImage') for t in effective_camera_topics]
+        index = FrameIndex(list(effective_camera_topics), msgtypes)
+        for ith, topic in enumerate(effective_camera_topics):
+            if len(results) == 1:
+                # The arena of a single bag is used as is
+                arena, timestamps = results[0][0][topic]
+                cams[ith].set_frames(arena, timestamps)
+                locators = [(0, timestamp) for timestamp in timestamps]
+            else:
+                # The arenas of the bags are kept, frames are located by bag (no copy into one arena)
+                arenas = SplitArenas(frames[topic][0] for frames, _ in results)
+                timestamps = []
+                locators = []
+                bag_frames = [[(timestamp, frame, bag) for frame, timestamp in enumerate(frames[topic][1])] for bag, (frames, _) in enumerate(results)]
+                for timestamp, frame, bag in heapq.merge(*bag_frames, key=lambda x: x[0]):
+                    arenas.append(bag, frame)
+                    timestamps.append(timestamp)
+                    locators.append((bag, timestamp))
+                cams[ith].set_frames(arenas, timestamps)
 
-            cams[ith].compressed_imgmsg_list.append(msg)
-            cams[ith].timestamp_list.append(timestamp)
-            cams[ith].total_frames += 1
-            cams[ith].blur_regions.append([])
+            index.timestamps.append(cams[ith].timestamp_list)
+            index.locators.append(np.array(locators, dtype=np.int64).reshape(-1, 2))
 
-        # close reader
-        del reader
+        stats.finish()
 
-        # Print loaded frame counts; map back to original requested order if necessary
-        for i, topic in enumerate(effective_camera_topics):
-            print(f'loaded {cams[i].total_frames} frames for {topic}')
+        # Persist the frame index (keyed on the requested topics) for the next session
+        self.frame_index_file.write(index, self.input_bag_paths, self.camera_topics, window)
 
         # Update internal camera_topics to effective list so export uses same topics
         self.camera_topics = effective_camera_topics
@@ -216,31 +490,256 @@ class BagFileHandler_ros2:
         return cams
 
     # ----------------- write both cam and other topics to bag -----------------
-    def export_cams(self, cams):
+    def _create_topics(self, writer, topics, topic_type_map, log=False):
+        # Create these topics in the writer USING CORRECT TopicMetadata SIGNATURE
+        # rosbag2_py.TopicMetadata constructor in some bindings expects (id:int, name:str, type:str, serialization_format:str, ...)
+        for topic in topics:
+            typ = topic_type_map.get(topic, 'sensor_msgs/msg/CompressedImage')
+            # set id to 0 (rosbag2_py will manage internal ids)
+            metadata = TopicMetadata(topic, typ, 'cdr') if self.ros_distro == "humble" else TopicMetadata(0, topic, typ, 'cdr')
+            writer.create_topic(metadata)
+            if log:
+                print(f'Added connection {topic} ({typ})')
+
+    def _merge_bags(self, input_uris, output_uri):
+        """
+        Concatenate time-ordered bags (e.g. export segments) into one bag, copying raw data.
+        """
+        writer = self.create_writer(output_uri)
+        created = set()
+        for uri in input_uris:
+            reader = self.create_reader(uri)
+            topic_type_map = {t.name: t.type for t in reader.get_all_topics_and_types()}
+            self._create_topics(writer, [t for t in topic_type_map if t not in created], topic_type_map)
+            created.update(topic_type_map)
+            while reader.has_next():
+                topic, data, timestamp = reader.read_next()
+                writer.write(topic, data, timestamp)
+            del reader
+        del writer
+
+    def export_cams(self, cams, listener = None):
         """
-        Write cams and passthrough topics into a new bag (self.output_bag_name).
+        Write cams and passthrough topics into new bags (self.output_bag_names),
+        streaming each input bag into its matching output bag.
+        Outputs are written as <output>.partial and renamed once every bag is complete
+        (split outputs as soon as each split is closed); an interrupted export resumes
+        from its checkpoint. listener is called with the stats at every progress line
+        (background export). Returns True once every output is written.
+        Outputs of a previous export of the same bags are moved to <output>.previous and the
+        frames whose regions did not change are copied from them instead of blurred again.
         Signature preserved: export_cams(self, cams)
         """
-        reader = self.create_reader(self.input_bag_path)
-        writer = self.create_writer(self.output_bag_name)
+        # Frames blurred by the previous export of these bags
+        frame_fingerprints = FrameFingerprints(self.frames_file_name)
+        frame_fingerprints.load(self.input_bag_paths, self.export_config.blur_method)
+
+        # Resume from the checkpoint of an interrupted export, or start over
+        checkpoint = ExportCheckpoint(self.checkpoint_file_name)
+        if self.export_config.resume and checkpoint.load(self.input_bag_paths, cams):
+            print(f'Resuming export from checkpoint "{checkpoint.path}"')
+        else:
+            for output_uri in self.output_bag_names:
+                paths = self._create_splitter(output_uri).split_paths()
+                if paths and frame_fingerprints.owns(output_uri, paths):
+                    # Exported before, the unchanged frames are copied from the previous output
+                    for path in paths:
+                        remove_output(previous_path(path))
+                        os.replace(path, previous_path(path))
+                elif paths:
+                    print(f'Bag {output_uri} already exists, please rename or delete the existing bag and try again.')
+                    return
+                shutil.rmtree(partial_path(output_uri), ignore_errors=True)
+            checkpoint.start(self.input_bag_paths, cams)
+
+        stats = ExportStats('export', 0)
+        stats.settings = self.export_config.storage_settings()
+        stats.listener = listener
+
+        # Blur regions by timestamp
+        regions = [cam.regions_by_timestamp() for cam in cams]
+
+        # Previous outputs of each output bag, with the fingerprints of their blurred frames
+        previous_frames = {topic: frame_fingerprints.frames(topic) for topic in self.camera_topics}
+        previous = {}
+        for output_uri in self.output_bag_names:
+            paths = frame_fingerprints.previous_outputs(output_uri)
+            if paths:
+                print(f'Reusing the unchanged blurred frames of the previous {output_uri} ({len(paths)} bags)')
+                previous[output_uri] = (paths, previous_frames)
+
+        try:
+            for input_uri, output_uri in zip(self.input_bag_paths, self.output_bag_names):
+                if checkpoint.is_completed(output_uri):
+                    continue
+                if self.export_config.shards > 1:
+                    self._export_bag_sharded(cams, input_uri, output_uri, stats, checkpoint, previous.get(output_uri))
+                else:
+                    self._export_bag(regions, input_uri, output_uri, stats, checkpoint, previous=previous.get(output_uri))
+                checkpoint.complete_split(output_uri)
+        except KeyboardInterrupt:
+            print(f'\nExport interrupted, export again to resume from checkpoint "{checkpoint.path}".')
+            raise
+
+        # All bags are complete, publish them (split outputs are published while writing)
+        for output_uri in self.output_bag_names:
+            if not self._create_splitter(output_uri).numbered:
+                os.replace(os.path.join(partial_path(output_uri), 'result'), output_uri)
+                shutil.rmtree(partial_path(output_uri))
+                stats.add_output(output_uri)
+        outputs = [self._create_splitter(output_uri).split_paths() for output_uri in self.output_bag_names]
+
+        # Fingerprints of the blurred frames for the next export
+        frame_fingerprints.write(self.input_bag_paths, self.export_config.blur_method, self.camera_topics, regions,
+                                 dict(zip(self.output_bag_names, outputs)))
+
+        # Drop the previous outputs, and the metadata of previous splits that were not written again
+        for output_uri, new_paths in zip(self.output_bag_names, outputs):
+            if output_uri not in previous:
+                continue
+            splitter = self._create_splitter(output_uri)
+            for path in previous[output_uri][0]:
+                remove_output(path)
+                path = path[:-len(PREVIOUS_SUFFIX)]
+                if splitter.numbered and path not in new_paths:
+                    Path(path + '.json').unlink(missing_ok=True)
+        checkpoint.remove()
+
+        # Overlay bags are linked to the original bags by a manifest
+        if self.export_config.mode == 'overlay':
+            write_manifest(self.manifest_file_name, 2, self.input_bag_paths, outputs, self.camera_topics,
+                           self.passthrough_topics, stats.counters['blurred'])
+
+        stats.finish(self.stats_file_name)
+        for output_uri in sum(outputs, []):
+            print(f'Bag file written to {output_uri}')
+        return True
+
+    def _is_output_topic(self, topic):
+        """
+        Camera topics are always written, passthrough topics only in full mode.
+        """
+        if topic in self.camera_topics:
+            return True
+        return self.export_config.mode == 'full' and topic in self.passthrough_topics
+
+    def _topic_messages(self, uri, topics):
+        """
+        Yields (timestamp, topic, data) of the given topics of a bag.
+        """
+        if not topics:
+            return
+        reader = self.create_reader(uri)
+        reader.set_filter(rosbag2_py.StorageFilter(topics=list(topics)))
+        while reader.has_next():
+            topic, data, timestamp = reader.read_next()
+            yield timestamp, topic, data
+        del reader
+
+    def merge_overlay(self, manifest):
+        """
+        Merge overlay bags (camera topics, possibly split) with the passthrough topics of their
+        original bags into full bags (self.output_bag_names).
+        """
+        stats = ExportStats('merge', 0)
+        stats.settings = self.export_config.storage_settings()
+
+        for input_uri, overlay_uris, output_uri in zip(self.input_bag_paths, manifest['overlays'], self.output_bag_names):
+            if os.path.exists(output_uri):
+                print(f'Bag {output_uri} already exists, please rename or delete the existing bag and try again.')
+                return
+            shutil.rmtree(partial_path(output_uri), ignore_errors=True)
+
+            # Topic types from both bags
+            topic_type_map = {}
+            for uri in [input_uri] + overlay_uris:
+                reader = self.create_reader(uri)
+                topic_type_map.update({t.name: t.type for t in reader.get_all_topics_and_types()})
+                del reader
+            passthrough = [t for t in self.passthrough_topics if t in topic_type_map]
+            cameras = [t for t in self.camera_topics if t in topic_type_map]
+
+            writer = self.create_writer(partial_path(output_uri))
+            self._create_topics(writer, passthrough + cameras, topic_type_map)
+
+            # One timeline over the original and the overlay splits
+            sources = [self._topic_messages(input_uri, passthrough)] + [self._topic_messages(uri, cameras) for uri in overlay_uris]
+            messages = heapq.merge(*sources, key=lambda x: x[0])
+            for timestamp, topic, data in stats.timed_iter('read', messages):
+                with stats.stage('write'):
+                    writer.write(topic, data, timestamp)
+                stats.add_message(topic, len(data), len(data))
+                stats.progress()
+
+            del writer
+            os.replace(partial_path(output_uri), output_uri)
+            stats.add_output(output_uri)
+
+        stats.finish()
+        for output_uri in self.output_bag_names:
+            print(f'Bag file written to {output_uri}')
+
+    def _export_bag(self, regions, input_uri, output_uri, stats, checkpoint=None, window=(None, None), previous=None):
+        """
+        Write one input bag (its messages in [start, stop) of window) into <output>.partial/result,
+        blurring camera frames with regions (per camera, by timestamp).
+        previous: (uris, frame fingerprints) of the previous output, whose unchanged blurred frames are copied.
+        rosbag2 writers cannot be reopened, so with segment_checkpoints each checkpoint closes the current
+        segment bag and opens the next one; the committed segments are concatenated at the end.
+        Without it a bag is only checkpointed once it is finished.
+        With output splitting each split is its own bag, published as soon as it is closed,
+        and the split boundaries are the checkpoints.
+        """
+        partial = partial_path(output_uri)
+
+        # Committed segments of this bag, if resuming; anything else in the partial folder is dropped
+        split_state = checkpoint.split_state(output_uri) if checkpoint else None
+        if window == (None, None):
+            splitter = self._create_splitter(output_uri, split_state['splits'] if split_state else None)
+        else:
+            splitter = OutputSplitter(output_uri, '')
+        if splitter.enabled:
+            # Splits closed before the interruption; the split being written starts over
+            segments = []
+            for path in splitter.publish():
+                stats.add_output(path)
+            partial = partial_path(splitter.split_path())
+            shutil.rmtree(partial, ignore_errors=True)
+        else:
+            segments = list(split_state['writer']['segments']) if split_state else []
+            if split_state is None:
+                shutil.rmtree(partial, ignore_errors=True)
+            os.makedirs(partial, exist_ok=True)
+            for child in Path(partial).iterdir():
+                if child.name in segments:
+                    continue
+                if child.is_dir():
+                    shutil.rmtree(child)
+                else:
+                    child.unlink()
+
+        reader = self.create_reader(input_uri)
 
         all_topic_types = reader.get_all_topics_and_types()
         topic_type_map = {t.name: t.type for t in all_topic_types}
 
-        # Decide which topics to include: passthrough + camera topics that exist in the bag
+        # Decide which topics to include: passthrough (full mode) + camera topics that exist in the bag
         topics_to_write = []
         for tmeta in all_topic_types:
-            if tmeta.name in self.passthrough_topics or tmeta.name in self.camera_topics:
+            if self._is_output_topic(tmeta.name):
                 topics_to_write.append(tmeta.name)
 
-        # Create these topics in the writer USING CORRECT TopicMetadata SIGNATURE
-        # rosbag2_py.TopicMetadata constructor in some bindings expects (id:int, name:str, type:str, serialization_format:str, ...)
-        for topic in topics_to_write:
-            typ = topic_type_map.get(topic, 'sensor_msgs/msg/CompressedImage')
-            # set id to 0 (rosbag2_py will manage internal ids)
-            metadata = TopicMetadata(topic, typ, 'cdr') if ros_distro == "humble" else TopicMetadata(0, topic, typ, 'cdr')
-            writer.create_topic(metadata)
-            print(f'Added connection {topic} ({typ})')
+        def _open_segment(log=False):
+            if splitter.enabled:
+                name = partial_path(splitter.split_path())
+                segment_writer = self.create_writer(name)
+            else:
+                name = f'segment_{len(segments):04d}'
+                segment_writer = self.create_writer(os.path.join(partial, name))
+            self._create_topics(segment_writer, topics_to_write, topic_type_map, log)
+            return segment_writer, name
+
+        writer, segment_name = _open_segment(log=True)
 
         def _image_to_compressed_msg(image_np: np.ndarray, header):
             ok, enc = cv2.imencode('.jpg', image_np)
@@ -252,54 +751,409 @@ class BagFileHandler_ros2:
             new_msg.data = bytearray(enc.tobytes())
             return new_msg
 
+        # Position in the input stream, continues after the committed messages when resuming
+        position = StreamPosition(split_state['position'] if split_state else None)
+        if position.last_timestamp is not None:
+            print(f'Resuming {output_uri} after {position.messages} messages (timestamp {position.last_timestamp})')
+            reader.seek(position.last_timestamp)
+        elif window[0] is not None:
+            reader.seek(window[0])
+        start = position.last_timestamp if position.last_timestamp is not None else window[0]
+        previous_output = self._open_previous(previous, start) if previous else None
+
+        # Stats: total from metadata, restricted to the topics being written (shards count in the main process)
+        if window == (None, None):
+            counts = self._metadata_message_counts(reader)
+            stats.total_messages += sum(counts.get(t, 0) for t in topics_to_write) - position.messages
+        last_checkpoint_time = time.perf_counter()
+
+        def _write(topic, serialized, timestamp):
+            nonlocal writer, segment_name
+            # Start the next output split once the current one is full: close, commit and publish it
+            if splitter.should_roll(timestamp, splitter.bytes):
+                with stats.stage('split'):
+                    writer = None
+                    splitter.finish_split(input_uri, topic_type_map, position)
+                    checkpoint.save_split(output_uri, position, {'segments': []}, splitter.to_dict())
+                    for path in splitter.publish():
+                        stats.add_output(path)
+                    writer, segment_name = _open_segment()
+
+            with stats.stage('write'):
+                writer.write(topic, serialized, timestamp)
+            position.record(topic, timestamp)
+            splitter.record(topic, timestamp, len(serialized))
+            stats.add_message(topic, len(data), len(serialized))
+            stats.progress()
+
         # Iterate and write messages (modify camera images when blur_regions exist)
         while reader.has_next():
-            topic, data, timestamp = reader.read_next()
+            # Checkpoint (opt-in, the segments are copied again at the end): close the segment so everything
+            # written is committed, then start the next one
+            interval = self.export_config.checkpoint_interval if self.export_config.segment_checkpoints else None
+            if checkpoint is not None and interval is not None and not splitter.enabled and time.perf_counter() - last_checkpoint_time >= interval:
+                with stats.stage('checkpoint'):
+                    del writer
+                    segments.append(segment_name)
+                    checkpoint.save_split(output_uri, position, {'segments': segments}, splitter.to_dict())
+                    writer, segment_name = _open_segment()
+                last_checkpoint_time = time.perf_counter()
 
-            if topic not in topics_to_write:
-                continue
+            with stats.stage('read'):
+                topic, data, timestamp = reader.read_next()
+            if window[1] is not None and timestamp >= window[1]:
+                break
 
-            print(f'Writing message of timestamp {timestamp} for topic {topic}')
+            if topic not in topics_to_write or position.skip(timestamp):
+                continue
 
             if topic in self.camera_topics:
-                ith = self.camera_topics.index(topic)
-                try:
-                    frame_index = cams[ith].timestamp_list.index(timestamp)
-                except ValueError:
-                    writer.write(topic, data, timestamp)
-                    continue
-
-                if cams[ith].blur_regions[frame_index]:
+                frame_regions = regions[self.camera_topics.index(topic)].get(timestamp)
+                payload = None
+                if frame_regions and previous_output is not None:
+                    # Same regions as in the previous export, its serialized message is copied
+                    with stats.stage('reuse'):
+                        payload = previous_output.payload(topic, timestamp, region_fingerprint(frame_regions, self.export_config.blur_method))
+                if payload is not None:
+                    _write(topic, payload, timestamp)
+                    stats.count('reused')
+                elif frame_regions:
                     orig_type_str = topic_type_map.get(topic, 'sensor_msgs/msg/CompressedImage')
-                    try:
-                        orig_type = get_message(orig_type_str)
-                        orig_msg = deserialize_message(data, orig_type)
-                    except Exception:
+                    with stats.stage('deserialize'):
                         try:
-                            orig_msg = deserialize_message(data, CompressedImage)
-                        except Exception as e:
-                            print(f'Failed to deserialize original image msg on {topic}: {e}')
-                            writer.write(topic, data, timestamp)
-                            continue
+                            orig_type = get_message(orig_type_str)
+                            orig_msg = deserialize_message(data, orig_type)
+                        except Exception:
+                            try:
+                                orig_msg = deserialize_message(data, CompressedImage)
+                            except Exception as e:
+                                orig_msg = None
+                                print(f'Failed to deserialize original image msg on {topic}: {e}')
+                    if orig_msg is None:
+                        stats.count('failed')
+                        _write(topic, data, timestamp)
+                        continue
 
-                    new_image = cams[ith].get_image_with_blur(frame_index)
-                    new_msg = _image_to_compressed_msg(new_image, orig_msg.header)
+                    # The image is decoded from the message being exported
+                    with stats.stage('decode'):
+                        new_image = decode_compressed(orig_msg.data)
+                    with stats.stage('blur'):
+                        blur_image(new_image, frame_regions, self.export_config.blur_method)
+                    with stats.stage('encode'):
+                        new_msg = _image_to_compressed_msg(new_image, orig_msg.header)
 
                     try:
-                        serialized = serialize_message(new_msg)
-                        writer.write(topic, serialized, timestamp)
+                        with stats.stage('serialize'):
+                            serialized = serialize_message(new_msg)
+                        _write(topic, serialized, timestamp)
+                        stats.count('blurred')
                     except Exception as e:
                         print(f'Failed to serialize/write modified image for topic {topic} at {timestamp}: {e}')
-                        writer.write(topic, data, timestamp)
+                        stats.count('failed')
+                        _write(topic, data, timestamp)
                 else:
-                    writer.write(topic, data, timestamp)
+                    stats.count('unchanged')
+                    _write(topic, data, timestamp)
             else:
-                writer.write(topic, data, timestamp)
+                stats.count('passthrough')
+                _write(topic, data, timestamp)
 
         del reader
         del writer
+        if previous_output is not None:
+            previous_output.close()
+
+        # The last output split is published right away
+        if splitter.enabled:
+            splitter.finish_split(input_uri, topic_type_map, position)
+            checkpoint.save_split(output_uri, position, {'segments': []}, splitter.to_dict())
+            for path in splitter.publish():
+                stats.add_output(path)
+            return
+        segments.append(segment_name)
+
+        # One bag per input bag: the single segment, or the segments concatenated
+        result = os.path.join(partial, 'result')
+        if len(segments) == 1:
+            os.replace(os.path.join(partial, segments[0]), result)
+        else:
+            print(f'Concatenating {len(segments)} segments of {output_uri}')
+            with stats.stage('merge'):
+                self._merge_bags([os.path.join(partial, name) for name in segments], result)
+            for name in segments:
+                shutil.rmtree(os.path.join(partial, name))
 
-        print(f'Bag file written to {self.output_bag_name}')
+    def _time_range(self, uri):
+        """
+        (start, end) of a bag in nanoseconds from its metadata (duration and time bindings differ between distros).
+        """
+        reader = self.create_reader(uri)
+        metadata = reader.get_metadata()
+        del reader
+
+        def _ns(value):
+            if hasattr(value, 'nanoseconds'):
+                return int(value.nanoseconds)
+            if hasattr(value, 'total_seconds'):
+                return int(round(value.total_seconds() * 1e9))
+            return int(round(value.timestamp() * 1e9))
+
+        start = _ns(metadata.starting_time)
+        return start, start + _ns(metadata.duration)
+
+    def _export_bag_sharded(self, cams, input_uri, output_uri, stats, checkpoint, previous=None):
+        """
+        Export one input bag as time shards, each written by a worker process into its own
+        partial bag, then concatenate them in order into <output>.partial/result
+        (or publish them as splits <output>_NNNN with keep_shards).
+        """
+        start_time, end_time = self._time_range(input_uri)
+        reader = self.create_reader(input_uri)
+        topics_to_write = [t.name for t in reader.get_all_topics_and_types() if self._is_output_topic(t.name)]
+        counts = self._metadata_message_counts(reader)
+        stats.total_messages += sum(counts.get(t, 0) for t in topics_to_write)
+        del reader
+
+        # Shard windows: the first and the last one are open, so every message falls in exactly one shard
+        shards = self.export_config.shards
+        bounds = [None] + [start_time + (end_time - start_time) * k // shards for k in range(1, shards)] + [None]
+        shard_uris = [OutputSplitter(output_uri, '', numbered=True).split_path(k) for k in range(shards)]
+
+        # Shards not finished before an interruption
+        jobs = []
+        for k, shard_uri in enumerate(shard_uris):
+            if checkpoint.is_completed(shard_uri) and os.path.exists(os.path.join(partial_path(shard_uri), 'result')):
+                continue
+            window = (bounds[k], bounds[k + 1])
+            jobs.append((k, input_uri, shard_uri, window, [cam.regions_by_timestamp(*window) for cam in cams], previous))
+
+        workers = min(len(jobs), os.cpu_count() or 1)
+        print(f'Exporting {input_uri} in {shards} shards with {workers} workers')
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for k, shard_stats in executor.map(self._export_shard, jobs):
+                    stats.merge(shard_stats)
+                    checkpoint.complete_split(shard_uris[k])
+                    stats.progress(force=True)
+
+        if self.export_config.keep_shards:
+            # Publish the shards as splits
+            splitter = self._create_splitter(output_uri)
+            for shard_uri in shard_uris:
+                os.replace(os.path.join(partial_path(shard_uri), 'result'), shard_uri)
+                shutil.rmtree(partial_path(shard_uri))
+            splitter.pending = [self._shard_metadata(shard_uri, k, input_uri) for k, shard_uri in enumerate(shard_uris)]
+            for path in splitter.publish():
+                stats.add_output(path)
+        else:
+            # Concatenate the shards in time order
+            partial = partial_path(output_uri)
+            shutil.rmtree(partial, ignore_errors=True)
+            os.makedirs(partial)
+            with stats.stage('merge'):
+                self._merge_bags([os.path.join(partial_path(uri), 'result') for uri in shard_uris], os.path.join(partial, 'result'))
+            for shard_uri in shard_uris:
+                shutil.rmtree(partial_path(shard_uri))
+
+    def _export_shard(self, job):
+        """
+        Export one shard into <shard>.partial/result, runs in a worker process.
+        """
+        k, input_uri, shard_uri, window, regions, previous = job
+        stats = ExportStats('shard', 0, progress_interval=None)
+        self._export_bag(regions, input_uri, shard_uri, stats, window=window, previous=previous)
+        return k, stats
+
+    def _open_previous(self, previous, start):
+        """
+        Camera messages of the previous output (its splits in order) from start on, read in step with the export.
+        """
+        uris, frames = previous
+
+        def _messages():
+            for uri in uris:
+                reader = self.create_reader(uri)
+                topics = [t.name for t in reader.get_all_topics_and_types() if t.name in self.camera_topics]
+                if not topics:
+                    del reader
+                    continue
+                reader.set_filter(rosbag2_py.StorageFilter(topics=topics))
+                if start is not None:
+                    reader.seek(start)
+                try:
+                    while reader.has_next():
+                        topic, data, timestamp = reader.read_next()
+                        yield topic, timestamp, data
+                finally:
+                    del reader
+        return PreviousOutput(frames, _messages())
+
+    def plan_export(self, cams, write_sample=False):
+        """
+        Dry run of export_cams: the frames to re-encode, the bytes copied per topic, the expected output size and runtime,
+        from the frame index and the regions with timed samples. No bag is written, only the plan json.
+        write_sample: also time the writes of the samples, in a scratch bag in the system temp folder
+        (rosbag2 writers only write to disk). Without it the write time and the size on disk are not estimated.
+        """
+        frame_fingerprints = FrameFingerprints(self.frames_file_name)
+        frame_fingerprints.load(self.input_bag_paths, self.export_config.blur_method)
+        regions = [cam.regions_by_timestamp() for cam in cams]
+        plan = ExportPlan(self.export_config, self.camera_topics, time_frame_costs(cams, self.export_config.blur_method))
+        for input_uri, output_uri in zip(self.input_bag_paths, self.output_bag_names):
+            sample = self._sample_bag(input_uri, write_sample)
+
+            # An export of the same bags again copies the unchanged frames of the previous outputs
+            paths = self._create_splitter(output_uri).split_paths()
+            previous_frames = None
+            if paths and frame_fingerprints.owns(output_uri, paths):
+                previous_frames = {topic: frame_fingerprints.frames(topic) for topic in self.camera_topics}
+            elif paths:
+                print(f'Bag {output_uri} already exists, the export would refuse to overwrite it.')
+            plan.add_bag(input_uri, output_uri, sample, regions, previous_frames)
+        return plan.finish(self.plan_file_name)
+
+    def _sample_bag(self, input_uri, write_sample=False):
+        """
+        Message counts of the output topics of a bag, and a few windows of its messages read, and with write_sample
+        written to a scratch bag in the system temp folder (with the output storage settings), for the export planner.
+        """
+        start_time, end_time = self._time_range(input_uri)
+        reader = self.create_reader(input_uri)
+        topic_type_map = {t.name: t.type for t in reader.get_all_topics_and_types()}
+        topics = [t for t in topic_type_map if self._is_output_topic(t)]
+        counts = self._metadata_message_counts(reader)
+        sample = new_sample(start_time, end_time)
+        for topic in topics:
+            add_sample_topic(sample, topic, counts.get(topic, 0))
+
+        # Windows spread over the bag, each starting after the previous one
+        messages = []
+        if topics:
+            reader.set_filter(rosbag2_py.StorageFilter(topics=topics))
+            next_start = start_time
+            for start in sample_starts(start_time, end_time):
+                read_start = time.perf_counter()
+                reader.seek(max(start, next_start))
+                for _ in range(PLAN_SAMPLE_MESSAGES):
+                    if not reader.has_next():
+                        break
+                    topic, data, timestamp = reader.read_next()
+                    messages.append((topic, data, timestamp))
+                    add_sample_message(sample, topic, len(data))
+                    next_start = timestamp + 1
+                sample['read_seconds'] += time.perf_counter() - read_start
+        del reader
+
+        # Write the sample as the export would
+        if not write_sample:
+            return sample
+        with tempfile.TemporaryDirectory() as folder:
+            uri = os.path.join(folder, 'sample')
+            write_start = time.perf_counter()
+            writer = self.create_writer(uri)
+            self._create_topics(writer, topics, topic_type_map)
+            for topic, data, timestamp in messages:
+                writer.write(topic, data, timestamp)
+                sample['written_bytes'] += len(data)
+            del writer
+            sample['write_seconds'] = time.perf_counter() - write_start
+            for root, _, files in os.walk(uri):
+                sample['bytes_on_disk'] += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        return sample
+
+    def verify_export(self, cams):
+        """
+        Compare the exported bags with the input bags in time windows checked by parallel processes,
+        returns True when they match: same messages and timestamps, bytes copied as they are,
+        except the frames with regions which must be blurred inside them.
+        """
+        stats = ExportStats('verify', 0)
+        jobs = []
+        shards = os.cpu_count() or 1
+        for input_uri, output_uri in zip(self.input_bag_paths, self.output_bag_names):
+            output_uris = self._create_splitter(output_uri).split_paths()
+            if not output_uris:
+                print(f'Bag {output_uri} does not exist, export it first.')
+                return False
+
+            # Time windows of the input bag
+            start_time, end_time = self._time_range(input_uri)
+            reader = self.create_reader(input_uri)
+            topics = [t.name for t in reader.get_all_topics_and_types() if self._is_output_topic(t.name)]
+            counts = self._metadata_message_counts(reader)
+            stats.total_messages += sum(counts.get(t, 0) for t in topics)
+            del reader
+            bounds = shard_bounds(start_time, end_time, shards)
+            for k in range(shards):
+                window = (bounds[k], bounds[k + 1])
+                jobs.append((input_uri, output_uris, window, [cam.regions_by_timestamp(*window) for cam in cams]))
+
+        # Check the windows in parallel
+        problems = []
+        workers = min(len(jobs), os.cpu_count() or 1)
+        print(f'Verifying {len(self.output_bag_names)} exported bags in {len(jobs)} windows with {workers} workers')
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for window_stats, window_problems in executor.map(self._verify_window, jobs):
+                stats.merge(window_stats)
+                problems += window_problems
+                stats.progress()
+        return finish_verification(stats, problems, self.verify_file_name)
+
+    def _verify_window(self, job):
+        """
+        Compare the messages of one time window of an input bag and its exported bags, runs in a worker process.
+        """
+        input_uri, output_uris, window, regions = job
+        stats = ExportStats('verify', 0, progress_interval=None)
+        comparer = StreamComparer(self.camera_topics, regions, self.export_config.blur_method, cdr_compressed_payload, stats)
+
+        # Both streams side by side, in timestamp order
+        streams = [self._window_messages([input_uri], window, side=0), self._window_messages(output_uris, window, side=1)]
+        for timestamp, side, topic, data in stats.timed_iter('read', heapq.merge(*streams, key=lambda x: (x[0], x[1]))):
+            comparer.add(side, topic, timestamp, data)
+        return stats, comparer.finish()
+
+    def _window_messages(self, uris, window, side):
+        """
+        Yields (timestamp, side, topic, data) of the output topics of bags read one after the other, in [start, stop) of window.
+        """
+        start, stop = window
+        for uri in uris:
+            reader = self.create_reader(uri)
+            topics = [t.name for t in reader.get_all_topics_and_types() if self._is_output_topic(t.name)]
+            if not topics:
+                del reader
+                continue
+            reader.set_filter(rosbag2_py.StorageFilter(topics=topics))
+            if start is not None:
+                reader.seek(start)
+            try:
+                while reader.has_next():
+                    topic, data, timestamp = reader.read_next()
+                    if stop is not None and timestamp >= stop:
+                        break
+                    yield timestamp, side, topic, data
+            finally:
+                del reader
+
+    def _shard_metadata(self, shard_uri, index, input_uri):
+        """
+        Metadata of a kept shard, as written for splits (times from the bag metadata).
+        """
+        reader = self.create_reader(shard_uri)
+        topic_type_map = {t.name: t.type for t in reader.get_all_topics_and_types()}
+        counts = self._metadata_message_counts(reader)
+        del reader
+        start_time, end_time = self._time_range(shard_uri)
+        return {
+            'path': os.path.basename(shard_uri),
+            'index': index,
+            'source': str(input_uri),
+            'start_time': start_time,
+            'end_time': end_time,
+            'message_count': sum(counts.values()),
+            'topics': {topic: {'type': topic_type_map.get(topic), 'message_count': count} for topic, count in counts.items() if count},
+        }
 
     def image_to_compressed_msg(self, image, header):
         """
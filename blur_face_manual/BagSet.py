@@ -0,0 +1,68 @@
+# path
+from pathlib import Path
+
+# regex
+import re
+
+# glob
+import glob
+
+# trailing split index added by the recorders, e.g. "...-1.bag", "..._3.db3"
+SPLIT_SUFFIX = re.compile(r'[-_]\d+$')
+
+def natural_key(path):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', str(path))]
+
+def is_ros2_bag_dir(path):
+    return path.is_dir() and (path / 'metadata.yaml').exists()
+
+def expand_bag_paths(path):
+    """
+    Expand the bag argument into an ordered list of bag paths forming one logical timeline.
+    Accepts a single bag, a list of bags, a glob pattern, or a folder of split ROS1 bags.
+    A rosbag2 directory (with metadata.yaml) is kept as a single bag.
+    """
+    if isinstance(path, (list, tuple)):
+        paths = []
+        for p in path:
+            paths.extend(expand_bag_paths(p))
+        return paths
+
+    path_str = str(path)
+    if any(c in path_str for c in '*?['):
+        matches = sorted(glob.glob(path_str), key=natural_key)
+        if not matches:
+            print(f'No bag files match "{path_str}".')
+        return [Path(m) for m in matches]
+
+    path = Path(path)
+    if path.is_dir() and not is_ros2_bag_dir(path):
+        ros1_splits = sorted(path.glob('*.bag'), key=natural_key)
+        if ros1_splits:
+            return ros1_splits
+        ros2_bags = sorted([p for p in path.iterdir() if is_ros2_bag_dir(p)], key=natural_key)
+        if ros2_bags:
+            return ros2_bags
+
+    return [path]
+
+def session_stem(paths):
+    """
+    Common stem of a set of split bags, used to name the save file, e.g.
+    [".../rec-1.bag", ".../rec-2.bag"] -> "rec". A single bag keeps its own stem.
+    """
+    stems = [Path(p).stem for p in paths]
+    if len(stems) == 1:
+        return stems[0]
+
+    stripped = [SPLIT_SUFFIX.sub('', s) for s in stems]
+    if len(set(stripped)) == 1:
+        return stripped[0]
+
+    # fall back to the longest common prefix
+    prefix = stems[0]
+    for s in stems[1:]:
+        while not s.startswith(prefix):
+            prefix = prefix[:-1]
+    prefix = prefix.rstrip('-_')
+    return prefix if prefix else stems[0]
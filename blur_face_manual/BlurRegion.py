@@ -1,6 +1,9 @@
 # enum
 from enum import Enum
 
+# collections
+from collections import OrderedDict
+
 # OpenCV
 import cv2
 
@@ -12,6 +15,117 @@ class BorderShape(Enum):
     ELLIPSE = 2
     BOTH = 3
 
+# blur algorithms for elliptical regions
+# gaussian: the original fixed 101x101 gaussian, the others scale with the region size
+BLUR_METHODS = ['gaussian', 'pyramid', 'box', 'pixelate']
+
+# fixed kernel of the gaussian method
+GAUSSIAN_KERNEL_SIZE = 101
+
+# equivalent gaussian sigma of the scaled methods, relative to the larger side of the region
+BLUR_SIGMA_RATIO = 1 / 6
+MIN_BLUR_SIGMA = 2.0
+
+# sigma of the blur at the lowest pyramid level
+PYRAMID_SIGMA = 2.0
+
+# passes of the iterated box blur (3 passes are close to a gaussian)
+BOX_PASSES = 3
+
+# total size of the cached ellipse masks, per process
+MASK_CACHE_BYTES = 64 * 1024 * 1024
+
+def region_blur_sigma(width, height):
+    return max(MIN_BLUR_SIGMA, max(width, height) * BLUR_SIGMA_RATIO)
+
+def gaussian_blur(image, sigma):
+    return cv2.GaussianBlur(image, (GAUSSIAN_KERNEL_SIZE, GAUSSIAN_KERNEL_SIZE), 0)
+
+def pyramid_blur(image, sigma):
+    # downsample so the blur is PYRAMID_SIGMA pixels at the low level, blur, upsample
+    factor = max(1.0, sigma / PYRAMID_SIGMA)
+    height, width = image.shape[:2]
+    small = cv2.resize(image, (max(1, round(width / factor)), max(1, round(height / factor))), interpolation=cv2.INTER_AREA)
+    small = cv2.GaussianBlur(small, (0, 0), sigma / factor)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+def box_blur(image, sigma):
+    # box size with the variance of the gaussian, box blur cost does not depend on its size
+    size = int(np.sqrt(12 * sigma**2 / BOX_PASSES + 1)) | 1
+    for _ in range(BOX_PASSES):
+        image = cv2.blur(image, (size, size))
+    return image
+
+def pixelate(image, sigma):
+    # blocks of 2 sigma, averaged
+    block = max(2.0, 2 * sigma)
+    height, width = image.shape[:2]
+    small = cv2.resize(image, (max(1, round(width / block)), max(1, round(height / block))), interpolation=cv2.INTER_AREA)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST)
+
+BLUR_FUNCTIONS = {'gaussian': gaussian_blur, 'pyramid': pyramid_blur, 'box': box_blur, 'pixelate': pixelate}
+
+def blur_margin(method, sigma):
+    # pixels around the region read by the blur
+    if method == 'gaussian':
+        return GAUSSIAN_KERNEL_SIZE // 2
+    if method == 'pixelate':
+        return 0
+    return int(np.ceil(3 * sigma))
+
+class MaskCache:
+    """
+    Rasterized ellipse masks (boolean, read only) by (center in the crop, axes, crop size), least recently used
+    evicted first once they take more than max_bytes. A region keeps its key when it moves away from the image
+    border, so regions stamped on consecutive frames share their mask.
+    The blur geometry of the last region set is kept too: frames with the same regions skip the lookups.
+    """
+
+    def __init__(self, max_bytes = MASK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.masks = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.frame_key = None
+        self.frame_geometry = None
+
+    def mask(self, center, axes, size):
+        key = (center, axes, size)
+        mask = self.masks.get(key)
+        if mask is not None:
+            self.masks.move_to_end(key)
+            self.hits += 1
+            return mask
+
+        self.misses += 1
+        mask = np.zeros(size, dtype=np.uint8)
+        cv2.ellipse(mask, center, axes, 0, 0, 360, 255, thickness=-1)
+        mask = mask == 255
+        mask.setflags(write=False)
+        self.masks[key] = mask
+        self.bytes += mask.nbytes
+        while self.bytes > self.max_bytes and len(self.masks) > 1:
+            _, evicted = self.masks.popitem(last=False)
+            self.bytes -= evicted.nbytes
+        return mask
+
+    def geometry(self, regions, image_shape, method):
+        # blur geometry of every region of a frame, reused while the regions stay the same
+        key = (tuple((r.shape, r.start_x, r.start_y, r.end_x, r.end_y, r.width, r.height) for r in regions), image_shape[:2], method)
+        if key != self.frame_key:
+            self.frame_geometry = [None if r.shape == BorderShape.RECTANGLE else r.blur_geometry(image_shape, method, self) for r in regions]
+            self.frame_key = key
+        return self.frame_geometry
+
+    def clear(self):
+        self.masks.clear()
+        self.bytes = 0
+        self.frame_key = None
+        self.frame_geometry = None
+
+mask_cache = MaskCache()
+
 def draw_crosshair(image, mouse_location):
     # Draw horizontal and vertical lines to create the crosshair
     line_length = 20
@@ -93,18 +207,36 @@ class BlurRegion:
         crosshair_y = (self.start_y + self.end_y) // 2
         draw_crosshair(image, (crosshair_x, crosshair_y))
     
-    def blur_region(self, image, shape = BorderShape.ELLIPSE):
+    def blur_geometry(self, image_shape, method, cache = mask_cache):
+        # (x0, y0, x1, y1, sigma, mask) of the elliptical blur in an image, None when it is outside
+        # only the bounding box of the ellipse plus the pixels read by the blur is filtered
+        center = ((self.start_x + self.end_x) // 2, (self.start_y + self.end_y) // 2)
+        axes = (self.width // 2, self.height // 2)
+        sigma = region_blur_sigma(self.width, self.height)
+        margin = blur_margin(method, sigma)
+        x0, y0 = max(0, center[0] - axes[0] - margin), max(0, center[1] - axes[1] - margin)
+        x1, y1 = min(image_shape[1], center[0] + axes[0] + margin + 1), min(image_shape[0], center[1] + axes[1] + margin + 1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1, sigma, cache.mask((center[0] - x0, center[1] - y0), axes, (y1 - y0, x1 - x0))
+
+    def blur_region(self, image, shape = BorderShape.ELLIPSE, method = 'gaussian', geometry = None):
         if self.shape == BorderShape.RECTANGLE:
             region = image[self.start_y:self.end_y, self.start_x:self.end_x]
             average_color = region.mean(axis=(0, 1), dtype=int)
             image[self.start_y:self.end_y, self.start_x:self.end_x] = average_color
         elif self.shape == BorderShape.ELLIPSE or self.shape == BorderShape.BOTH:
-            # gaussian elliptical blur
-            blur_strength = 101 # odd number
-            mask = np.zeros(image.shape[:2], dtype=np.uint8)
-            cv2.ellipse(mask, ((self.start_x + self.end_x) // 2, (self.start_y + self.end_y) // 2), (self.width // 2, self.height // 2), 0, 0, 360, 255, thickness=-1)
-            blurred_region = cv2.GaussianBlur(image, (blur_strength, blur_strength), 0)
-            image[mask == 255] = blurred_region[mask == 255]
+            # elliptical blur of the crop around the region, with the cached mask of the ellipse
+            if geometry is None:
+                geometry = self.blur_geometry(image.shape, method)
+            if geometry is None:
+                return
+            x0, y0, x1, y1, sigma, mask = geometry
+
+            # blur the crop and copy it back inside the ellipse
+            crop = image[y0:y1, x0:x1]
+            blurred_region = BLUR_FUNCTIONS[method](crop, sigma)
+            np.copyto(crop, blurred_region, where=mask[..., None] if crop.ndim == 3 else mask)
 
             # # average blur
             # mask = np.zeros(image.shape[:2], dtype=np.uint8)  # Create a single-channel mask
@@ -120,7 +252,7 @@ class BlurRegion:
         return self
 
 
-def blur_image(image, region_list):
-    for region in region_list:
-        region.blur_region(image)
+def blur_image(image, region_list, method = 'gaussian'):
+    for region, geometry in zip(region_list, mask_cache.geometry(region_list, image.shape, method)):
+        region.blur_region(image, method = method, geometry = geometry)
         
\ No newline at end of file
@@ -1,20 +1,38 @@
 # blue_face_manual
 from blur_face_manual.BlurRegion import BlurRegion, blur_image
+from blur_face_manual.FrameArena import FrameArena
+
+# copy
+import copy
+
+# numpy
+import numpy as np
 
 # cv2
-from cv_bridge import CvBridge
+import cv2
+
+# decode the payload of a compressed image message, as CvBridge does with desired_encoding='passthrough'.
+# np.frombuffer is a zero-copy view of the message data (bytes, memoryview, array.array or numpy array)
+def decode_compressed(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
 
 class Cam:
     def __init__(self):
-        # data and blur regions
-        self.compressed_imgmsg_list = []
+        # data and blur regions, the serialized messages of the loaded frames
+        self.arena = FrameArena()
 
-        self.bridge = CvBridge()
+        # lazy frames read from the bag by locator (set when opened from a frame index)
+        self.frame_reader = None
+        self.frame_locators = None
 
         self.blur_regions = []
         self.current_frame = 0
         self.total_frames = 0
         self.timestamp_list = []
+        self.frame_of_timestamp = {}
+
+        # regions of the region file at timestamps outside the loaded frames (time window sessions), kept and exported
+        self.outside_regions = {}
 
         # images
         self.image = None
@@ -45,15 +63,78 @@ class Cam:
     def get_timestamp(self, frame):
         return self.timestamp_list[frame]
 
+    def get_frame(self, timestamp):
+        return self.frame_of_timestamp.get(timestamp)
+
+    def set_lazy_frames(self, frame_reader, timestamps, locators):
+        self.frame_reader = frame_reader
+        self.frame_locators = locators
+        self.timestamp_list = [int(t) for t in timestamps]
+        self.frame_of_timestamp = {}
+        for frame, timestamp in enumerate(self.timestamp_list):
+            self.frame_of_timestamp.setdefault(timestamp, frame)
+        self.total_frames = len(self.timestamp_list)
+        self.blur_regions = [[] for _ in range(self.total_frames)]
+
+    def set_frames(self, arena, timestamps):
+        # frames of an arena loaded in timestamp order
+        self.arena = arena
+        self.timestamp_list = [int(t) for t in timestamps]
+        self.frame_of_timestamp = {}
+        for frame, timestamp in enumerate(self.timestamp_list):
+            self.frame_of_timestamp.setdefault(timestamp, frame)
+        self.total_frames = len(self.timestamp_list)
+        self.blur_regions = [[] for _ in range(self.total_frames)]
+
+    def regions_by_timestamp(self, start = None, stop = None):
+        # blur regions of the frames that have any, by timestamp in [start, stop) (first frame of a timestamp, as get_frame),
+        # and the regions outside the loaded frames
+        regions = {}
+        for timestamp, frame in self.frame_of_timestamp.items():
+            if start is not None and timestamp < start or stop is not None and timestamp >= stop:
+                continue
+            if self.blur_regions[frame]:
+                regions[timestamp] = self.blur_regions[frame]
+        for timestamp, outside in self.outside_regions.items():
+            if start is not None and timestamp < start or stop is not None and timestamp >= stop:
+                continue
+            regions[timestamp] = outside
+        return regions
+
+    def snapshot(self):
+        # frame timestamps and a copy of the blur regions, without the frames (sent to the export process)
+        cam = Cam()
+        cam.total_frames = self.total_frames
+        cam.timestamp_list = list(self.timestamp_list)
+        cam.frame_of_timestamp = dict(self.frame_of_timestamp)
+        cam.blur_regions = copy.deepcopy(self.blur_regions)
+        cam.outside_regions = copy.deepcopy(self.outside_regions)
+        return cam
+
+    def add_frame(self, rawdata, payload, timestamp):
+        # payload: (offset, length) of the compressed image in the serialized message rawdata
+        self.arena.append(rawdata, payload)
+        self.timestamp_list.append(timestamp)
+        self.frame_of_timestamp.setdefault(timestamp, self.total_frames)
+        self.total_frames += 1
+        self.blur_regions.append([])
+
+    def get_compressed_payload(self, frame, frame_reader = None):
+        # frame_reader: a clone of the cam's reader, for threads reading alongside the GUI
+        frame_reader = frame_reader or self.frame_reader
+        if frame_reader is not None:
+            return frame_reader.payload(self.frame_locators[frame])
+        return self.arena.payload(frame)
+
     def get_image(self, frame):
-        return self.bridge.compressed_imgmsg_to_cv2(self.compressed_imgmsg_list[frame], desired_encoding='passthrough')
+        return decode_compressed(self.get_compressed_payload(frame))
 
-    def get_image_with_blur(self, frame):
+    def get_image_with_blur(self, frame, method = 'gaussian'):
         # original image
         image = self.get_image(frame)
 
         # blurred
-        blur_image(image, self.blur_regions[frame])
+        blur_image(image, self.blur_regions[frame], method)
 
         # return
         return image
@@ -0,0 +1,161 @@
+# json
+import json
+
+# hashing
+import hashlib
+
+# os
+import os
+
+# path
+from pathlib import Path
+
+# blur_face_manual
+from blur_face_manual.FrameIndex import bags_fingerprint
+
+# bump when the layout of the checkpoint changes
+CHECKPOINT_VERSION = 1
+
+def regions_digest(cams):
+    digest = hashlib.blake2b(digest_size=16)
+    for ith, cam in enumerate(cams):
+        digest.update(f'cam{ith} {len(cam.blur_regions)}\n{cam}'.encode())
+        for timestamp in sorted(cam.outside_regions):
+            digest.update(f'{timestamp} {" ".join(map(str, cam.outside_regions[timestamp]))}\n'.encode())
+    return digest.hexdigest()
+
+def partial_path(path):
+    return str(path) + '.partial'
+
+
+class StreamPosition:
+    """
+    Position in the filtered input message stream of one split: number of messages
+    written, the last timestamp and how many messages share it, and the last timestamp
+    per topic. Messages are written in timestamp order, so resuming from a position is
+    a seek to last_timestamp followed by skipping at_last_timestamp messages.
+    Skipping is checked against the position the stream resumes from, not the one recorded while writing.
+    """
+
+    def __init__(self, state = None):
+        state = state or {}
+        self.messages = state.get('messages', 0)
+        self.last_timestamp = state.get('last_timestamp')
+        self.at_last_timestamp = state.get('at_last_timestamp', 0)
+        self.topics = dict(state.get('topics', {}))
+
+        # committed position the stream resumes from, and the messages at its timestamp skipped so far
+        self.resume_timestamp = self.last_timestamp
+        self.resume_at_timestamp = self.at_last_timestamp
+        self.skipped = 0
+
+    def record(self, topic, timestamp):
+        if timestamp == self.last_timestamp:
+            self.at_last_timestamp += 1
+        else:
+            self.last_timestamp = timestamp
+            self.at_last_timestamp = 1
+        self.topics[topic] = timestamp
+        self.messages += 1
+
+    def skip(self, timestamp):
+        # true for messages already committed, for a stream starting at the resume timestamp
+        if self.resume_timestamp is None or timestamp > self.resume_timestamp:
+            self.resume_timestamp = None
+            return False
+        if timestamp < self.resume_timestamp:
+            return True
+        if self.skipped < self.resume_at_timestamp:
+            self.skipped += 1
+            return True
+        return False
+
+    def to_dict(self):
+        return {
+            'messages': self.messages,
+            'last_timestamp': self.last_timestamp,
+            'at_last_timestamp': self.at_last_timestamp,
+            'topics': self.topics,
+        }
+
+
+class ExportCheckpoint:
+    """
+    Checkpoint of a running export, written atomically next to the output.
+    Records the outputs already completed and, for the split being written, the
+    committed stream position, the backend writer state needed to continue it and
+    the state of its output splits.
+    It is only valid for the same input bags and the same blur regions.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.state = None
+
+    def start(self, bag_paths, cams):
+        self.state = {
+            'version': CHECKPOINT_VERSION,
+            'fingerprint': bags_fingerprint(bag_paths),
+            'regions': regions_digest(cams),
+            'completed': [],
+            'split': None,
+        }
+
+    def load(self, bag_paths, cams):
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f'Could not read export checkpoint "{self.path}": {e}')
+            return False
+
+        if state.get('version') != CHECKPOINT_VERSION:
+            print(f'Export checkpoint "{self.path}" has an old version, starting over.')
+            return False
+        if state['fingerprint'] != bags_fingerprint(bag_paths):
+            print(f'Input bags changed since checkpoint "{self.path}", starting over.')
+            return False
+        if state['regions'] != regions_digest(cams):
+            print(f'Blur regions changed since checkpoint "{self.path}", starting over.')
+            return False
+
+        self.state = state
+        return True
+
+    def is_completed(self, output):
+        return str(output) in self.state['completed']
+
+    def split_state(self, output):
+        split = self.state['split']
+        if split is None or split['output'] != str(output):
+            return None
+        return split
+
+    def save_split(self, output, position, writer_state, splits = None):
+        self.state['split'] = {
+            'output': str(output),
+            'position': position.to_dict(),
+            'writer': writer_state,
+            'splits': splits,
+        }
+        self.save()
+
+    def complete_split(self, output):
+        self.state['completed'].append(str(output))
+        self.state['split'] = None
+        self.save()
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if self.path.exists():
+            self.path.unlink()
+        self.state = None
@@ -0,0 +1,92 @@
+# blur_face_manual
+from blur_face_manual.BlurRegion import BLUR_METHODS
+
+# full: every exported topic in one bag, overlay: camera topics only, linked to the original by a manifest
+EXPORT_MODES = ['full', 'overlay']
+
+# output compression, support depends on the backend (ROS1: lz4, bz2; ROS2: lz4 and zstd for mcap, zstd for sqlite3)
+COMPRESSIONS = ['none', 'lz4', 'bz2', 'zstd']
+
+class ExportConfig:
+    """
+    Export settings shared by both bag handlers. Defaults reproduce the plain export.
+    - checkpoint_interval: seconds between export checkpoints (None disables checkpointing).
+      ROS2 exports only checkpoint at split boundaries, finished shards and finished bags, unless
+      segment_checkpoints is set.
+    - segment_checkpoints: ROS2 exports also checkpoint every checkpoint_interval. A rosbag2 writer
+      cannot be reopened, so each checkpoint closes an output segment and the segments are concatenated
+      at the end: the output is written twice. Worth it only when losing a whole bag costs more.
+    - resume: resume an interrupted export from its checkpoint instead of refusing to overwrite it
+    - mode: 'full' writes camera and passthrough topics; 'overlay' writes only the camera topics to
+      <stem>_blurred_overlay plus a manifest, merged with the original on demand (merge_overlay.py)
+    - compression: output compression, one of COMPRESSIONS
+    - chunk_size: bytes per chunk (ROS1 chunk threshold, ROS2 mcap chunk size), None keeps the backend default
+    - storage_preset: ROS2 storage preset profile (mcap: fastwrite, zstd_fast, zstd_small; sqlite3: resilient)
+    - cache_size: ROS2 writer cache size in bytes, None keeps the backend default
+    - split_size: split each output into bags of at most this many bytes (ROS2: message bytes), None disables
+    - split_duration: split each output into bags of at most this many seconds, None disables.
+      Splits are published with a metadata json as soon as they are closed; ROS2 exports
+      checkpoint at split boundaries instead of checkpoint_interval.
+    - shards: cut the time range of each input bag into this many shards, exported by parallel
+      processes into temporary bags and merged in order; the result is identical to a serial export.
+      Checkpoints record finished shards. Cannot be combined with split_size / split_duration.
+    - keep_shards: publish the shards as splits <stem>_blurred_NNNN instead of merging them
+    - blur_method: blur of elliptical regions, one of BLUR_METHODS. 'gaussian' is the fixed 101x101
+      kernel; 'pyramid', 'box' and 'pixelate' scale with the region size and are several times faster
+      (see benchmark_blur.py)
+    """
+
+    def __init__(self, **kwargs):
+        # checkpointing
+        self.checkpoint_interval = 30.0
+        self.resume = True
+        self.segment_checkpoints = False
+
+        # output
+        self.mode = 'full'
+
+        # output storage tuning
+        self.compression = 'none'
+        self.chunk_size = None
+        self.storage_preset = None
+        self.cache_size = None
+
+        # output splitting
+        self.split_size = None
+        self.split_duration = None
+
+        # sharded parallel export
+        self.shards = 1
+        self.keep_shards = False
+
+        # blur
+        self.blur_method = 'gaussian'
+
+        for key, value in kwargs.items():
+            if not hasattr(self, key):
+                raise ValueError(f'Unknown export option "{key}"')
+            setattr(self, key, value)
+
+        if self.mode not in EXPORT_MODES:
+            raise ValueError(f'Unknown export mode "{self.mode}", expected one of {EXPORT_MODES}')
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown compression "{self.compression}", expected one of {COMPRESSIONS}')
+        if self.blur_method not in BLUR_METHODS:
+            raise ValueError(f'Unknown blur method "{self.blur_method}", expected one of {BLUR_METHODS}')
+        if self.shards < 1:
+            raise ValueError(f'shards must be at least 1, not {self.shards}')
+        if self.shards > 1 and (self.split_size or self.split_duration):
+            raise ValueError('Sharded export cannot be combined with split_size / split_duration')
+
+    def storage_settings(self):
+        return {
+            'compression': self.compression,
+            'chunk_size': self.chunk_size,
+            'storage_preset': self.storage_preset,
+            'cache_size': self.cache_size,
+            'split_size': self.split_size,
+            'split_duration': self.split_duration,
+            'shards': self.shards,
+            'keep_shards': self.keep_shards,
+            'blur_method': self.blur_method,
+        }
@@ -0,0 +1,198 @@
+# json
+import json
+
+# time
+import time
+
+# os
+import os
+
+# OpenCV
+import cv2
+
+# blur_face_manual
+from blur_face_manual.BlurRegion import blur_image
+from blur_face_manual.Cam import decode_compressed
+from blur_face_manual.ExportStats import format_duration
+from blur_face_manual.IncrementalExport import region_fingerprint
+
+# frames decoded, blurred and encoded to time the re-encode of a frame
+PLAN_SAMPLE_FRAMES = 24
+
+# windows spread over each bag, and messages read from each, to size the topics and time reading and writing
+PLAN_SAMPLE_WINDOWS = 8
+PLAN_SAMPLE_MESSAGES = 100
+
+def sample_starts(start_time, end_time, windows = PLAN_SAMPLE_WINDOWS):
+    # start timestamps of windows spread evenly over [start_time, end_time]
+    return [start_time + (end_time - start_time) * k // windows for k in range(windows)]
+
+def new_sample(start_time, end_time):
+    # filled by the sample_bag of the handlers: messages per output topic, and a few of them read and written again
+    return {'start_time': start_time, 'end_time': end_time, 'topics': {}, 'read_seconds': 0.0, 'read_bytes': 0,
+            'write_seconds': 0.0, 'written_bytes': 0, 'bytes_on_disk': 0}
+
+def add_sample_topic(sample, topic, messages):
+    sample['topics'].setdefault(topic, {'messages': 0, 'sampled': 0, 'sampled_bytes': 0})['messages'] += messages
+
+def add_sample_message(sample, topic, size):
+    sample['topics'][topic]['sampled'] += 1
+    sample['topics'][topic]['sampled_bytes'] += size
+    sample['read_bytes'] += size
+
+def time_frame_costs(cams, blur_method, frames = PLAN_SAMPLE_FRAMES):
+    """
+    Seconds per frame to decode, blur and encode, timed on frames with regions spread over the cams (any frames when
+    none has regions), and the mean size of the encoded frames relative to the original payloads.
+    """
+    candidates = [(ith, frame) for ith, cam in enumerate(cams) for frame, regions in enumerate(cam.blur_regions) if regions]
+    if not candidates:
+        candidates = [(ith, frame) for ith, cam in enumerate(cams) for frame in range(cam.total_frames)]
+    picks = candidates[::max(1, len(candidates) // frames)][:frames]
+
+    seconds = {'decode': 0.0, 'blur': 0.0, 'encode': 0.0}
+    payload_bytes = encoded_bytes = 0
+    for ith, frame in picks:
+        payload = cams[ith].get_compressed_payload(frame)
+        start = time.perf_counter()
+        image = decode_compressed(payload)
+        decoded = time.perf_counter()
+        blur_image(image, cams[ith].blur_regions[frame], blur_method)
+        blurred = time.perf_counter()
+        _, encoded = cv2.imencode('.jpg', image)
+        seconds['decode'] += decoded - start
+        seconds['blur'] += blurred - decoded
+        seconds['encode'] += time.perf_counter() - blurred
+        payload_bytes += len(payload)
+        encoded_bytes += len(encoded)
+
+    costs = {stage: value / max(1, len(picks)) for stage, value in seconds.items()}
+    costs['frames'] = len(picks)
+    costs['size_ratio'] = encoded_bytes / payload_bytes if payload_bytes else 1.0
+    return costs
+
+
+class ExportPlan:
+    """
+    Dry run of an export: what export_cams would read, copy and re-encode, and how long it would take, without
+    writing any output bag. Built from the frame index and the regions, with timed samples of each bag (sample_bag
+    of the handlers) and of the re-encode of a few frames.
+    - add_bag(input_path, output_path, sample, regions, previous_frames): plans the export of one input bag
+    - estimate(workers): expected seconds of the export with that many shards
+    - finish(path): prints the plan and optionally writes it as json
+    Reading, writing and re-encoding are assumed to scale with the workers, which holds until the disk is the limit.
+    """
+
+    def __init__(self, export_config, camera_topics, frame_costs):
+        self.export_config = export_config
+        self.camera_topics = camera_topics
+        self.frame_costs = frame_costs
+        self.bags = []
+
+    def add_bag(self, input_path, output_path, sample, regions, previous_frames = None):
+        # regions: {timestamp: regions} per camera, previous_frames: {topic: {timestamp: fingerprint}} of a previous
+        # export whose unchanged frames would be reused, None when there is none
+        sampled_bytes = sum(x['sampled_bytes'] for x in sample['topics'].values())
+        sampled = sum(x['sampled'] for x in sample['topics'].values())
+        topics = {}
+        for topic, counts in sample['topics'].items():
+            mean_bytes = counts['sampled_bytes'] / counts['sampled'] if counts['sampled'] else sampled_bytes / max(1, sampled)
+            row = {'messages': counts['messages'], 'mean_bytes': mean_bytes, 'reencoded': 0, 'reused': 0}
+            if topic in self.camera_topics:
+                # frames of this bag with regions, reused when the previous export blurred them with the same regions
+                cam_regions = regions[self.camera_topics.index(topic)]
+                previous = previous_frames.get(topic, {}) if previous_frames is not None else {}
+                for timestamp, frame_regions in cam_regions.items():
+                    if sample['start_time'] <= timestamp <= sample['end_time']:
+                        if previous.get(timestamp) == region_fingerprint(frame_regions, self.export_config.blur_method):
+                            row['reused'] += 1
+                        else:
+                            row['reencoded'] += 1
+            row['copied_bytes'] = (row['messages'] - row['reencoded'] - row['reused']) * mean_bytes
+            topics[topic] = row
+        self.bags.append({'input': str(input_path), 'output': str(output_path), 'topics': topics, 'sample': sample})
+
+    def totals(self):
+        totals = {'messages': 0, 'input_bytes': 0.0, 'copied_bytes': 0.0, 'reencoded': 0, 'reused': 0, 'reused_bytes': 0.0, 'output_bytes': 0.0}
+        for bag in self.bags:
+            for row in bag['topics'].values():
+                totals['messages'] += row['messages']
+                totals['input_bytes'] += row['messages'] * row['mean_bytes']
+                totals['copied_bytes'] += row['copied_bytes']
+                totals['reencoded'] += row['reencoded']
+                totals['reused'] += row['reused']
+                totals['reused_bytes'] += row['reused'] * row['mean_bytes']
+                totals['output_bytes'] += row['copied_bytes'] + row['reused'] * row['mean_bytes'] + row['reencoded'] * row['mean_bytes'] * self.frame_costs['size_ratio']
+
+        # throughput of the samples, and the size on disk after the output compression
+        samples = [bag['sample'] for bag in self.bags]
+        read_seconds = sum(x['read_seconds'] for x in samples)
+        write_seconds = sum(x['write_seconds'] for x in samples)
+        written_bytes = sum(x['written_bytes'] for x in samples)
+        totals['read_bytes_per_second'] = sum(x['read_bytes'] for x in samples) / read_seconds if read_seconds > 0 else 0.0
+        totals['write_bytes_per_second'] = written_bytes / write_seconds if write_seconds > 0 else 0.0
+        totals['disk_ratio'] = sum(x['bytes_on_disk'] for x in samples) / written_bytes if written_bytes else 1.0
+        totals['output_bytes_on_disk'] = totals['output_bytes'] * totals['disk_ratio']
+        return totals
+
+    def estimate(self, workers, totals = None):
+        totals = totals or self.totals()
+
+        # reused frames are read from the previous outputs as well
+        read_bytes = totals['input_bytes'] + totals['reused_bytes']
+        read_seconds = read_bytes / totals['read_bytes_per_second'] if totals['read_bytes_per_second'] else 0.0
+        write_seconds = totals['output_bytes'] / totals['write_bytes_per_second'] if totals['write_bytes_per_second'] else 0.0
+        frame_seconds = self.frame_costs['decode'] + self.frame_costs['blur'] + self.frame_costs['encode']
+        seconds = (read_seconds + write_seconds + totals['reencoded'] * frame_seconds) / workers
+
+        # shards are concatenated into one bag at the end, unless they are kept as splits
+        if workers > 1 and not self.export_config.keep_shards:
+            seconds += write_seconds
+        return seconds
+
+    def worker_counts(self):
+        # powers of two up to the cpus of this machine, and the configured shards
+        cpus = os.cpu_count() or 1
+        counts = {1, cpus, self.export_config.shards}
+        count = 2
+        while count < cpus:
+            counts.add(count)
+            count *= 2
+        return sorted(counts)
+
+    def finish(self, path = None):
+        totals = self.totals()
+        estimates = {workers: self.estimate(workers, totals) for workers in self.worker_counts()}
+
+        print(f'[plan] {len(self.bags)} bags, {totals["messages"]} messages, {totals["input_bytes"] / 1e6:.1f} MB in')
+        for bag in self.bags:
+            print(f'  {bag["input"]} -> {bag["output"]}')
+            for topic, row in bag['topics'].items():
+                line = f'    {topic:<48} {row["messages"]:8d} msgs {row["copied_bytes"] / 1e6:10.1f} MB copied'
+                if topic in self.camera_topics:
+                    line += f' {row["reencoded"]:6d} re-encoded {row["reused"]:6d} reused'
+                print(line)
+        costs = self.frame_costs
+        print(f'  re-encode   {1000 * costs["decode"]:.2f} ms decode, {1000 * costs["blur"]:.2f} ms blur, {1000 * costs["encode"]:.2f} ms encode '
+              f'per frame ({costs["frames"]} frames timed, {self.export_config.blur_method}), encoded size x{costs["size_ratio"]:.2f}')
+        if totals['write_bytes_per_second']:
+            print(f'  throughput  {totals["read_bytes_per_second"] / 1e6:.1f} MB/s read, {totals["write_bytes_per_second"] / 1e6:.1f} MB/s written '
+                  f'({self.export_config.compression} compression, x{totals["disk_ratio"]:.2f} on disk)')
+            print(f'  output      {totals["output_bytes"] / 1e6:.1f} MB, {totals["output_bytes_on_disk"] / 1e6:.1f} MB on disk expected')
+        else:
+            # ROS2 samples are only written with --plan-write-sample
+            print(f'  throughput  {totals["read_bytes_per_second"] / 1e6:.1f} MB/s read, writes not sampled (not in the runtime)')
+            print(f'  output      {totals["output_bytes"] / 1e6:.1f} MB before compression')
+        for workers, seconds in estimates.items():
+            print(f'  {workers:3d} workers  {format_duration(seconds)}' + ('  (configured shards)' if workers == self.export_config.shards else ''))
+
+        plan = {'bags': self.bags, 'frame_costs': costs, 'totals': totals, 'settings': self.export_config.storage_settings(),
+                'estimated_seconds': {str(workers): seconds for workers, seconds in estimates.items()}}
+        if path:
+            try:
+                with open(path, 'w') as f:
+                    json.dump(plan, f, indent=2)
+                print(f'[plan] written to "{path}".')
+            except OSError as e:
+                print(f'Could not write the plan "{path}": {e}')
+        return plan
@@ -0,0 +1,192 @@
+# time
+import time
+
+# json
+import json
+
+# os
+import os
+
+# collections
+from collections import defaultdict
+from contextlib import contextmanager
+
+# stages reported in the summary, in pipeline order
+STAGES = ['read', 'deserialize', 'decode', 'blur', 'encode', 'serialize', 'write']
+
+class ExportStats:
+    """
+    Per-stage timers and counters for reading and exporting bags.
+    - stage(name): context manager accumulating wall time of a pipeline stage
+    - timed_iter(name, iterable): times each step of an iterator (e.g. reader.messages())
+    - add_message(topic, bytes_in, bytes_out): counts a processed message
+    - progress(): prints a throttled progress line with rate and ETA
+    - merge(other): folds in the stats of a worker (e.g. one split scanned in another process)
+    - add_output(path): adds the size on disk of an output bag (file or rosbag2 directory)
+    - finish(path): prints the summary and optionally writes it as json
+    A progress_interval of None disables the progress line (used by workers).
+    A listener, if set, is called with the stats at every progress line (e.g. a background export
+    reporting to the GUI); it may raise to stop the export. finish() does not call it, the outputs are
+    published by then.
+    """
+
+    def __init__(self, name, total_messages = 0, progress_interval = 1.0):
+        self.name = name
+        self.total_messages = total_messages
+        self.progress_interval = progress_interval
+
+        # timers and counters
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.topic_messages = defaultdict(int)
+
+        # progress
+        self.messages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.start_time = time.perf_counter()
+        self.last_progress_time = self.start_time
+        self.end_time = None
+
+        # outputs
+        self.output_bytes = 0
+        self.settings = {}
+
+        # called at every progress line
+        self.listener = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] += time.perf_counter() - start
+            self.stage_calls[name] += 1
+
+    def timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stage_seconds[name] += time.perf_counter() - start
+                return
+            self.stage_seconds[name] += time.perf_counter() - start
+            self.stage_calls[name] += 1
+            yield item
+
+    def count(self, name, value = 1):
+        self.counters[name] += value
+
+    def add_message(self, topic, bytes_in, bytes_out = 0):
+        self.messages += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.topic_messages[topic] += 1
+
+    def add_output(self, path):
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                self.output_bytes += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        elif os.path.exists(path):
+            self.output_bytes += os.path.getsize(path)
+
+    def elapsed(self):
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        return end - self.start_time
+
+    def merge(self, other):
+        for stage, seconds in other.stage_seconds.items():
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += other.stage_calls[stage]
+        for counter, value in other.counters.items():
+            self.counters[counter] += value
+        for topic, value in other.topic_messages.items():
+            self.topic_messages[topic] += value
+        self.messages += other.messages
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+
+    def progress(self, force = False, notify = True):
+        # notify: call the listener, which may stop the export (BackgroundExport)
+        if self.progress_interval is None and not force:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last_progress_time < self.progress_interval:
+            return
+        self.last_progress_time = now
+        if self.listener is not None and notify:
+            self.listener(self)
+
+        elapsed = max(now - self.start_time, 1e-9)
+        rate = self.messages / elapsed
+        line = f'[{self.name}] {self.messages}'
+        if self.total_messages:
+            percent = 100.0 * self.messages / self.total_messages
+            line += f'/{self.total_messages} msgs ({percent:5.1f}%)'
+        else:
+            line += ' msgs'
+        line += f' {rate:8.1f} msg/s {self.bytes_in / elapsed / 1e6:7.1f} MB/s in'
+        if self.total_messages and rate > 0:
+            remaining = max(0, self.total_messages - self.messages) / rate
+            line += f' ETA {format_duration(remaining)}'
+        print('\r' + line, end='', flush=True)
+
+    def summary(self):
+        elapsed = self.elapsed()
+        stages = {}
+        for stage in STAGES + sorted(set(self.stage_seconds) - set(STAGES)):
+            if stage not in self.stage_seconds:
+                continue
+            stages[stage] = {
+                'seconds': self.stage_seconds[stage],
+                'calls': self.stage_calls[stage],
+                'fraction': self.stage_seconds[stage] / elapsed if elapsed > 0 else 0.0,
+            }
+        return {
+            'name': self.name,
+            'elapsed_seconds': elapsed,
+            'messages': self.messages,
+            'total_messages': self.total_messages,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'messages_per_second': self.messages / elapsed if elapsed > 0 else 0.0,
+            'mb_per_second_in': self.bytes_in / elapsed / 1e6 if elapsed > 0 else 0.0,
+            'output_bytes_on_disk': self.output_bytes,
+            'output_mb_per_second': self.output_bytes / elapsed / 1e6 if elapsed > 0 else 0.0,
+            'settings': self.settings,
+            'stages': stages,
+            'counters': dict(self.counters),
+            'topics': dict(self.topic_messages),
+        }
+
+    def finish(self, path = None):
+        self.end_time = time.perf_counter()
+        self.progress(force=True, notify=False)
+        print()
+
+        summary = self.summary()
+        print(f'[{self.name}] {summary["messages"]} messages in {format_duration(summary["elapsed_seconds"])}, '
+              f'{summary["bytes_in"] / 1e6:.1f} MB in, {summary["bytes_out"] / 1e6:.1f} MB out')
+        if self.output_bytes:
+            print(f'  output {self.output_bytes / 1e6:.1f} MB on disk, '
+                  f'{summary["mb_per_second_in"]:.1f} MB/s in, {summary["output_mb_per_second"]:.1f} MB/s out')
+        for stage, values in summary['stages'].items():
+            print(f'  {stage:<12} {values["seconds"]:10.3f} s  {100.0 * values["fraction"]:5.1f}%  ({values["calls"]} calls)')
+        for counter, value in summary['counters'].items():
+            print(f'  {counter:<12} {value}')
+
+        if path:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+            print(f'[{self.name}] summary written to "{path}".')
+
+        return summary
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}'
@@ -0,0 +1,162 @@
+# json
+import json
+
+# collections
+from collections import deque
+
+# numpy
+import numpy as np
+
+# blur_face_manual
+from blur_face_manual.BlurRegion import BorderShape, blur_image
+from blur_face_manual.Cam import decode_compressed
+
+# problems listed per worker, the others are only counted
+MAX_REPORTED_PROBLEMS = 20
+
+# mean gray level change of a region under the blur below which it has no detail to hide
+FLAT_REGION_CHANGE = 2.0
+
+def shard_bounds(start_time, end_time, shards):
+    # time windows covering [start_time, end_time], the first and the last one open
+    return [None] + [start_time + (end_time - start_time) * k // shards for k in range(1, shards)] + [None]
+
+def region_mask(region, image_shape, method):
+    # (y0, y1, x0, x1, mask) of the pixels the export replaces for a region
+    if region.shape == BorderShape.RECTANGLE:
+        y0, y1 = max(0, region.start_y), min(image_shape[0], region.end_y)
+        x0, x1 = max(0, region.start_x), min(image_shape[1], region.end_x)
+        if y0 >= y1 or x0 >= x1:
+            return None
+        return y0, y1, x0, x1, np.ones((y1 - y0, x1 - x0), dtype=bool)
+    geometry = region.blur_geometry(image_shape, method)
+    if geometry is None:
+        return None
+    x0, y0, x1, y1, _, mask = geometry
+    return y0, y1, x0, x1, mask
+
+def check_blurred_frame(original_payload, exported_payload, regions, method):
+    """
+    Problem with a frame exported with regions, None when every region is blurred.
+    The original is blurred again as the export does: inside each region the exported frame must be
+    closer to that than to the original (it is encoded again, so no pixel is exact).
+    Regions without detail, that the blur does not change, cannot be told apart and pass.
+    """
+    original = decode_compressed(original_payload)
+    exported = decode_compressed(exported_payload)
+    if original is None or exported is None:
+        return 'undecodable'
+    if original.shape != exported.shape:
+        return f'size {original.shape} exported as {exported.shape}'
+    expected = original.copy()
+    blur_image(expected, regions, method)
+    for region in regions:
+        bounds = region_mask(region, original.shape, method)
+        if bounds is None:
+            continue
+        y0, y1, x0, x1, mask = bounds
+        inside = [image[y0:y1, x0:x1][mask].astype(np.int16) for image in (original, expected, exported)]
+        if np.abs(inside[1] - inside[0]).mean() < FLAT_REGION_CHANGE:
+            continue
+        if np.abs(inside[2] - inside[0]).mean() <= np.abs(inside[2] - inside[1]).mean():
+            return f'region {region} not blurred'
+    return None
+
+
+class StreamComparer:
+    """
+    Compares the messages of an input bag (side 0) with those of its exported bag (side 1), fed in
+    timestamp order through add(side, topic, timestamp, rawdata), e.g. from heapq.merge of both streams.
+    Messages are paired per topic by timestamp: a message of one side without a partner of the same
+    timestamp by the time the stream moved past it is missing (or extra). Paired messages must be
+    byte-identical, except the camera frames with regions, which must be blurred inside them.
+    """
+
+    def __init__(self, camera_topics, regions, blur_method, locate_payload, stats):
+        self.camera_regions = dict(zip(camera_topics, regions))
+        self.blur_method = blur_method
+        self.locate_payload = locate_payload
+        self.stats = stats
+        self.pending = {}
+        self.problems = []
+
+    def problem(self, kind, topic, timestamp, detail = ''):
+        self.stats.count(kind)
+        if len(self.problems) < MAX_REPORTED_PROBLEMS:
+            self.problems.append({'problem': kind, 'topic': topic, 'timestamp': int(timestamp), 'detail': detail})
+
+    def unpaired(self, side, topic, timestamp):
+        if side == 0:
+            self.problem('missing', topic, timestamp, 'not in the exported bag')
+        else:
+            self.problem('extra', topic, timestamp, 'not in the input bag')
+
+    def add(self, side, topic, timestamp, rawdata):
+        queues = self.pending.setdefault(topic, (deque(), deque()))
+        other = queues[1 - side]
+
+        # messages of the other side older than this one get no partner any more
+        while other and other[0][0] < timestamp:
+            self.unpaired(1 - side, topic, other.popleft()[0])
+        if not other:
+            queues[side].append((timestamp, rawdata))
+            return
+        _, partner = other.popleft()
+        original, exported = (rawdata, partner) if side == 0 else (partner, rawdata)
+        self.compare(topic, timestamp, original, exported)
+
+    def payload(self, rawdata):
+        # compressed image of a serialized camera message, located by locate_payload (e.g. ros1_compressed_payload)
+        offset, length = self.locate_payload(rawdata)
+        return memoryview(rawdata)[offset:offset + length]
+
+    def compare(self, topic, timestamp, original, exported):
+        self.stats.add_message(topic, len(original), len(exported))
+        frame_regions = self.camera_regions.get(topic, {}).get(timestamp)
+        if not frame_regions:
+            with self.stats.stage('compare'):
+                identical = original == exported
+            if identical:
+                self.stats.count('identical')
+            else:
+                self.problem('changed', topic, timestamp, 'bytes differ')
+            return
+
+        # frames with regions are checked inside them
+        with self.stats.stage('check'):
+            try:
+                problem = check_blurred_frame(self.payload(original), self.payload(exported), frame_regions, self.blur_method)
+            except ValueError as e:
+                problem = f'undecodable: {e}'
+        if problem is None:
+            self.stats.count('blurred')
+        else:
+            self.problem('unblurred', topic, timestamp, problem)
+
+    def finish(self):
+        for topic, queues in self.pending.items():
+            for side, queue in enumerate(queues):
+                for timestamp, _ in queue:
+                    self.unpaired(side, topic, timestamp)
+        self.pending = {}
+        return self.problems
+
+
+def finish_verification(stats, problems, path = None):
+    # prints the summary and the problems, true when the export matches its input and regions
+    summary = stats.finish()
+    summary['problems'] = problems
+    found = sum(stats.counters[kind] for kind in ('missing', 'extra', 'changed', 'unblurred'))
+    for problem in problems:
+        print(f'  {problem["problem"]:<10} {problem["topic"]} at {problem["timestamp"]}: {problem["detail"]}')
+    if found > len(problems):
+        print(f'  ... {found - len(problems)} more problems')
+    if path:
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f'[{stats.name}] report written to "{path}".')
+    if found:
+        print(f'Verification FAILED: {found} problems.')
+    else:
+        print(f'Verification passed: {stats.counters["identical"]} messages identical, {stats.counters["blurred"]} frames blurred inside their regions.')
+    return found == 0
@@ -0,0 +1,116 @@
+# array
+from array import array
+
+# struct
+import struct
+
+# string lengths and sequence sizes of serialized messages
+UINT32_LE = struct.Struct('<I')
+UINT32_BE = struct.Struct('>I')
+
+def read_uint32(layout, view, offset):
+    if offset + 4 > len(view):
+        raise ValueError(f'message of {len(view)} bytes ends before offset {offset + 4}')
+    return layout.unpack_from(view, offset)[0]
+
+def ros1_compressed_payload(rawdata):
+    # (offset, length) of the data of a ROS1 sensor_msgs/CompressedImage:
+    # header (uint32 seq, time stamp, string frame_id), string format, uint8[] data, little endian
+    view = memoryview(rawdata)
+    offset = 12
+    for _ in range(2):
+        offset += 4 + read_uint32(UINT32_LE, view, offset)
+    length = read_uint32(UINT32_LE, view, offset)
+    if offset + 4 + length > len(view):
+        raise ValueError(f'data of {length} bytes at {offset + 4} overruns the message of {len(view)} bytes')
+    return offset + 4, length
+
+def cdr_compressed_payload(rawdata):
+    # (offset, length) of the data of a CDR sensor_msgs/msg/CompressedImage (ROS 2):
+    # encapsulation header, header (int32 sec, uint32 nanosec, string frame_id), string format, uint8[] data,
+    # strings and sequence lengths aligned to 4 bytes from the end of the encapsulation header
+    view = memoryview(rawdata)
+    if len(view) < 4 or view[0] != 0 or view[1] not in (0, 1):
+        raise ValueError('not a plain CDR message')
+    layout = UINT32_LE if view[1] == 1 else UINT32_BE
+    position = 8
+    for _ in range(2):
+        position = (position + 3) & ~3
+        position += 4 + read_uint32(layout, view, 4 + position)
+    position = (position + 3) & ~3
+    length = read_uint32(layout, view, 4 + position)
+    offset = 4 + position + 4
+    if offset + length > len(view):
+        raise ValueError(f'data of {length} bytes at {offset} overruns the message of {len(view)} bytes')
+    return offset, length
+
+
+class FrameArena:
+    """
+    Serialized camera messages of a cam, in one contiguous buffer instead of one message object each.
+    offsets/lengths locate every message in the buffer, payload_offsets/payload_lengths its compressed image,
+    which is decoded straight from a memoryview of the buffer (no copy, no deserialization).
+    Frames are appended while loading and only read afterwards: the buffer cannot grow while a view of it is alive.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('q')
+        self.lengths = array('q')
+        self.payload_offsets = array('q')
+        self.payload_lengths = array('q')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def nbytes(self):
+        return len(self.buffer) + sum(x.itemsize * len(x) for x in (self.offsets, self.lengths, self.payload_offsets, self.payload_lengths))
+
+    def append(self, rawdata, payload):
+        # payload: (offset, length) of the compressed image in rawdata
+        offset = len(self.buffer)
+        self.buffer += rawdata
+        self.offsets.append(offset)
+        self.lengths.append(len(rawdata))
+        self.payload_offsets.append(offset + payload[0])
+        self.payload_lengths.append(payload[1])
+
+    def message(self, frame):
+        # serialized message and the (offset, length) of its payload, as given to append
+        offset = self.offsets[frame]
+        rawdata = memoryview(self.buffer)[offset:offset + self.lengths[frame]]
+        return rawdata, (self.payload_offsets[frame] - offset, self.payload_lengths[frame])
+
+    def payload(self, frame):
+        offset = self.payload_offsets[frame]
+        return memoryview(self.buffer)[offset:offset + self.payload_lengths[frame]]
+
+
+class SplitArenas:
+    """
+    Frames of the arenas of several splits or bags, merged into one timeline without copying them into one buffer:
+    every frame is located by its split and its frame in that split's arena. Same reading interface as FrameArena.
+    """
+
+    def __init__(self, arenas):
+        self.arenas = list(arenas)
+        self.splits = array('q')
+        self.frames = array('q')
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def nbytes(self):
+        return sum(x.nbytes for x in self.arenas) + self.splits.itemsize * len(self.splits) + self.frames.itemsize * len(self.frames)
+
+    def append(self, split, frame):
+        self.splits.append(split)
+        self.frames.append(frame)
+
+    def message(self, frame):
+        return self.arenas[self.splits[frame]].message(self.frames[frame])
+
+    def payload(self, frame):
+        return self.arenas[self.splits[frame]].payload(self.frames[frame])
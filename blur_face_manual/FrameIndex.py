@@ -0,0 +1,150 @@
+# numpy
+import numpy as np
+
+# json
+import json
+
+# hashing
+import hashlib
+
+# time
+import time
+
+# path
+from pathlib import Path
+
+# bump when the layout of the sidecar changes
+FRAME_INDEX_VERSION = 1
+
+# bytes hashed at the start and the end of each bag file
+HASH_BLOCK_SIZE = 1 << 16
+
+def bag_files(path):
+    path = Path(path)
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.is_file())
+    return [path]
+
+def file_fingerprint(path):
+    stat = path.stat()
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_BLOCK_SIZE))
+        if stat.st_size > HASH_BLOCK_SIZE:
+            f.seek(max(HASH_BLOCK_SIZE, stat.st_size - HASH_BLOCK_SIZE))
+            digest.update(f.read(HASH_BLOCK_SIZE))
+    return {'name': path.name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+
+def bags_fingerprint(paths):
+    """
+    Cheap identity of a set of bags: size, mtime and a hash of the first and last
+    block of every file. Any rewrite of a bag changes at least one of them.
+    """
+    return [[file_fingerprint(f) for f in bag_files(p)] for p in paths]
+
+
+class FrameIndex:
+    """
+    Per-camera frame index of a bag: topics, message types, timestamps and storage
+    locators. Locators are backend specific rows of integers, e.g. (split, chunk_pos, offset)
+    for ROS1 or (bag, timestamp) for ROS2, used to read a single frame without a scan.
+    """
+
+    def __init__(self, topics = None, msgtypes = None, timestamps = None, locators = None):
+        self.topics = topics or []
+        self.msgtypes = msgtypes or []
+        self.timestamps = timestamps or []
+        self.locators = locators or []
+
+    def counts(self):
+        return [len(t) for t in self.timestamps]
+
+    def window(self, start = None, stop = None):
+        # frames with a timestamp in [start, stop) (None for open ends)
+        index = FrameIndex(list(self.topics), list(self.msgtypes))
+        for timestamps, locators in zip(self.timestamps, self.locators):
+            timestamps = np.asarray(timestamps, dtype=np.int64)
+            mask = np.ones(len(timestamps), dtype=bool)
+            if start is not None:
+                mask &= timestamps >= start
+            if stop is not None:
+                mask &= timestamps < stop
+            index.timestamps.append(timestamps[mask])
+            index.locators.append(np.asarray(locators)[mask])
+        return index
+
+def window_covers(outer, inner):
+    # true when the time window outer = (start, stop) contains inner, None ends are open
+    starts = outer[0] is None or (inner[0] is not None and outer[0] <= inner[0])
+    stops = outer[1] is None or (inner[1] is not None and inner[1] <= outer[1])
+    return starts and stops
+
+
+class FrameIndexFile:
+    """
+    Sidecar file (.npz) persisting a FrameIndex, validated against the bags' fingerprint
+    and the requested camera topics. An index scanned for a time window records it, and
+    is only reused for windows it covers.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def write(self, index, bag_paths, requested_topics, window = (None, None)):
+        meta = {
+            'version': FRAME_INDEX_VERSION,
+            'fingerprint': bags_fingerprint(bag_paths),
+            'requested_topics': list(requested_topics),
+            'window': list(window),
+            'topics': index.topics,
+            'msgtypes': index.msgtypes,
+        }
+        arrays = {'meta': np.array(json.dumps(meta))}
+        for ith in range(len(index.topics)):
+            arrays[f'timestamps_{ith}'] = np.asarray(index.timestamps[ith], dtype=np.int64)
+            arrays[f'locators_{ith}'] = np.asarray(index.locators[ith], dtype=np.int64)
+
+        # write next to the bag, atomically so a crash never leaves a truncated index
+        tmp_path = self.path.with_name(self.path.name + '.tmp.npz')
+        try:
+            np.savez(tmp_path, **arrays)
+            tmp_path.replace(self.path)
+        except OSError as e:
+            print(f'Could not write frame index "{self.path}": {e}')
+            return False
+        print(f'frame index written to "{self.path}".')
+        return True
+
+    def read(self, bag_paths, requested_topics, window = (None, None)):
+        if not self.path.exists():
+            return None
+
+        start = time.perf_counter()
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                if meta.get('version') != FRAME_INDEX_VERSION:
+                    print(f'frame index "{self.path}" has an old version, rebuilding.')
+                    return None
+                if meta['requested_topics'] != list(requested_topics):
+                    print(f'frame index "{self.path}" was built for other topics, rebuilding.')
+                    return None
+                if meta['fingerprint'] != bags_fingerprint(bag_paths):
+                    print(f'bag changed since frame index "{self.path}" was built, rebuilding.')
+                    return None
+                if not window_covers(meta.get('window', [None, None]), window):
+                    print(f'frame index "{self.path}" was built for another time window, rebuilding.')
+                    return None
+
+                index = FrameIndex(meta['topics'], meta['msgtypes'])
+                for ith in range(len(index.topics)):
+                    index.timestamps.append(data[f'timestamps_{ith}'])
+                    index.locators.append(data[f'locators_{ith}'])
+        except Exception as e:
+            print(f'Could not read frame index "{self.path}": {e}')
+            return None
+
+        print(f'frame index read from "{self.path}" in {1000 * (time.perf_counter() - start):.1f} ms.')
+        if window != (None, None):
+            index = index.window(*window)
+        return index
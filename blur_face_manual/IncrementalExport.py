@@ -0,0 +1,155 @@
+# json
+import json
+
+# hashing
+import hashlib
+
+# os
+import os
+import shutil
+
+# path
+from pathlib import Path
+
+# blur_face_manual
+from blur_face_manual.FrameIndex import bags_fingerprint, bag_files, file_fingerprint
+
+# bump when the layout of the frames file changes
+FRAMES_VERSION = 1
+
+# outputs of the previous export are moved aside to <output>.previous while exporting again
+PREVIOUS_SUFFIX = '.previous'
+
+def region_fingerprint(regions, blur_method):
+    # the blurred payload of a frame depends on its regions, in order, and on the blur method
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(blur_method.encode())
+    for region in regions:
+        digest.update(f' {region}'.encode())
+    return digest.hexdigest()
+
+def output_fingerprint(path):
+    # fingerprint of an output bag (file or rosbag2 folder), independent of its name
+    return [{k: v for k, v in file_fingerprint(f).items() if k != 'name'} for f in bag_files(path)]
+
+def previous_path(path):
+    return str(path) + PREVIOUS_SUFFIX
+
+def remove_output(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        Path(path).unlink(missing_ok=True)
+
+
+class FrameFingerprints:
+    """
+    Sidecar file of an export, next to its stats: the fingerprint of the regions of every blurred
+    frame (by camera topic and timestamp) and the fingerprint of every output bag.
+    The next export of the same bags with the same blur method moves the outputs aside
+    (<output>.previous) and copies the payload of the frames whose regions did not change
+    from them, instead of decoding, blurring and encoding them again.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.state = None
+
+    def write(self, bag_paths, blur_method, camera_topics, regions, outputs):
+        # regions: {timestamp: regions} per camera, outputs: {output name: [output bags]}
+        state = {
+            'version': FRAMES_VERSION,
+            'fingerprint': bags_fingerprint(bag_paths),
+            'blur_method': blur_method,
+            'outputs': {name: [[str(p), output_fingerprint(p)] for p in paths] for name, paths in outputs.items()},
+            'frames': {topic: {str(timestamp): region_fingerprint(frame_regions, blur_method) for timestamp, frame_regions in cam_regions.items()}
+                       for topic, cam_regions in zip(camera_topics, regions)},
+        }
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        tmp_path.replace(self.path)
+        print(f'frame fingerprints written to "{self.path}".')
+
+    def load(self, bag_paths, blur_method):
+        # true when the previous export was made from the same bags with the same blur method
+        self.state = None
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f'Could not read frame fingerprints "{self.path}": {e}')
+            return False
+        if state.get('version') != FRAMES_VERSION or state['blur_method'] != blur_method:
+            return False
+        if state['fingerprint'] != bags_fingerprint(bag_paths):
+            return False
+        self.state = state
+        return True
+
+    def owns(self, output_name, paths):
+        # true when paths are exactly the outputs recorded for output_name
+        if self.state is None:
+            return False
+        recorded = self.state['outputs'].get(str(output_name), [])
+        return [str(p) for p in paths] == [p for p, _ in recorded] and all(output_fingerprint(p) == f for p, f in recorded)
+
+    def previous_outputs(self, output_name):
+        # outputs of the previous export moved aside, if they are still the recorded ones
+        if self.state is None:
+            return []
+        recorded = self.state['outputs'].get(str(output_name), [])
+        for p, fingerprint in recorded:
+            if not os.path.exists(previous_path(p)) or output_fingerprint(previous_path(p)) != fingerprint:
+                return []
+        return [previous_path(p) for p, _ in recorded]
+
+    def frames(self, topic):
+        if self.state is None:
+            return {}
+        return {int(timestamp): fingerprint for timestamp, fingerprint in self.state['frames'].get(topic, {}).items()}
+
+
+class PreviousOutput:
+    """
+    Payloads of the previous export, read in step with the exported stream: messages iterates
+    (topic, timestamp, rawdata) of the camera topics of the previous outputs, from where the export starts.
+    payload(topic, timestamp, fingerprint) returns the previous serialized message when the frame
+    was blurred with the same regions, None otherwise. Lookups must come in timestamp order.
+    """
+
+    def __init__(self, frames, messages):
+        self.frames = frames
+        self.messages = messages
+        self.buffer = {}
+        self.buffer_timestamp = None
+        self.pending = None
+
+    def payload(self, topic, timestamp, fingerprint):
+        if self.frames.get(topic, {}).get(timestamp) != fingerprint:
+            return None
+
+        # advance the previous stream to timestamp, keeping the messages at timestamp
+        if self.buffer_timestamp != timestamp:
+            self.buffer = {}
+            self.buffer_timestamp = timestamp
+        while True:
+            if self.pending is None:
+                self.pending = next(self.messages, None)
+                if self.pending is None:
+                    break
+            previous_topic, previous_timestamp, rawdata = self.pending
+            if previous_timestamp > timestamp:
+                break
+            if previous_timestamp == timestamp:
+                self.buffer.setdefault(previous_topic, []).append(rawdata)
+            self.pending = None
+
+        # messages of a topic sharing a timestamp come in the same order as in the input
+        payloads = self.buffer.get(topic)
+        return payloads.pop(0) if payloads else None
+
+    def close(self):
+        self.messages.close()
@@ -0,0 +1,117 @@
+# json
+import json
+
+# os
+import os
+
+# glob
+import glob
+
+# blur_face_manual
+from blur_face_manual.ExportCheckpoint import partial_path
+
+class OutputSplitter:
+    """
+    Splits an export output into bags of a maximum size and/or duration, named
+    <base>_0000<extension>, <base>_0001<extension>, ... Every split is written to its partial
+    path and published as soon as it is closed, together with a metadata file <base>_NNNN.json,
+    so consumers can start on the first splits while the export is still running.
+    Without limits the output is the single bag <base><extension>, unless numbered is set
+    (outputs split otherwise, e.g. kept export shards).
+    """
+
+    def __init__(self, base, extension, max_size = None, max_duration = None, state = None, numbered = False):
+        self.base = base
+        self.extension = extension
+        self.max_size = max_size
+        self.max_duration = int(max_duration * 1e9) if max_duration else None
+        self.numbered = numbered or self.enabled
+
+        # current split, and finished splits not yet published
+        state = state or {}
+        self.index = state.get('index', 0)
+        self.start_time = state.get('start_time')
+        self.end_time = state.get('end_time')
+        self.bytes = state.get('bytes', 0)
+        self.topics = dict(state.get('topics', {}))
+        self.start_position = state.get('start_position')
+        self.pending = list(state.get('pending', []))
+
+    @property
+    def enabled(self):
+        return bool(self.max_size or self.max_duration)
+
+    def split_path(self, index = None):
+        if not self.numbered:
+            return self.base + self.extension
+        index = self.index if index is None else index
+        return f'{self.base}_{index:04d}{self.extension}'
+
+    def metadata_path(self, index):
+        return f'{self.base}_{index:04d}.json'
+
+    def split_paths(self):
+        # outputs on disk
+        if not self.numbered:
+            return [self.split_path()] if os.path.exists(self.split_path()) else []
+        return sorted(glob.glob(glob.escape(self.base) + '_[0-9][0-9][0-9][0-9]' + self.extension))
+
+    def should_roll(self, timestamp, size):
+        # a split holds at least one message
+        if not self.enabled or self.start_time is None:
+            return False
+        if self.max_duration and timestamp - self.start_time >= self.max_duration:
+            return True
+        return bool(self.max_size and size >= self.max_size)
+
+    def record(self, topic, timestamp, size):
+        if self.start_time is None:
+            self.start_time = timestamp
+        self.end_time = timestamp
+        self.bytes += size
+        self.topics[topic] = self.topics.get(topic, 0) + 1
+
+    def finish_split(self, source, topic_types, position):
+        # metadata of the closed split, published with it
+        self.pending.append({
+            'path': os.path.basename(self.split_path()),
+            'index': self.index,
+            'source': str(source),
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'message_count': sum(self.topics.values()),
+            'topics': {topic: {'type': topic_types.get(topic), 'message_count': count} for topic, count in self.topics.items()},
+        })
+
+        # the next split starts at the current stream position
+        self.index += 1
+        self.start_time = None
+        self.end_time = None
+        self.bytes = 0
+        self.topics = {}
+        self.start_position = position.to_dict()
+
+    def publish(self):
+        # rename the closed splits to their final path, then write their metadata
+        published = []
+        for metadata in self.pending:
+            path = self.split_path(metadata['index'])
+            if os.path.exists(partial_path(path)):
+                os.replace(partial_path(path), path)
+            with open(self.metadata_path(metadata['index']), 'w') as f:
+                json.dump(metadata, f, indent=2)
+            print(f'Split {path} written ({metadata["message_count"]} messages)')
+            published.append(path)
+        self.pending = []
+        return published
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'bytes': self.bytes,
+            'topics': self.topics,
+            'start_position': self.start_position,
+            'pending': self.pending,
+        }
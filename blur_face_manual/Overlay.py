@@ -0,0 +1,68 @@
+# json
+import json
+
+# os
+import os
+
+# copy
+import copy
+
+# path
+from pathlib import Path
+
+# blur_face_manual
+from blur_face_manual.FrameIndex import bags_fingerprint
+from blur_face_manual.ExportConfig import ExportConfig
+
+# bump when the layout of the manifest changes
+MANIFEST_VERSION = 2
+
+def write_manifest(path, ros_version, input_paths, overlay_paths, camera_topics, passthrough_topics, blurred_frames):
+    """
+    Manifest linking overlay bags (camera topics only) to the untouched original bags.
+    overlay_paths holds the list of overlay splits of each input bag.
+    """
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'ros_version': ros_version,
+        'inputs': [str(Path(p).resolve()) for p in input_paths],
+        'fingerprint': bags_fingerprint(input_paths),
+        'overlays': [[str(Path(p).resolve()) for p in paths] for paths in overlay_paths],
+        'camera_topics': list(camera_topics),
+        'passthrough_topics': list(passthrough_topics),
+        'blurred_frames': blurred_frames,
+    }
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'overlay manifest written to "{path}".')
+
+def read_manifest(path):
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f'Unsupported overlay manifest version in "{path}".')
+    if manifest['fingerprint'] != bags_fingerprint(manifest['inputs']):
+        raise ValueError(f'Original bags of "{path}" changed since the overlay was exported.')
+    return manifest
+
+def merge_from_manifest(path, export_folder = None, export_config = None):
+    """
+    Merge overlay bags with the passthrough topics of their original bags into full
+    <stem>_blurred bags, written next to the manifest unless export_folder is given.
+    export_config sets the output storage (compression, chunking); its mode is ignored.
+    """
+    manifest = read_manifest(path)
+    if export_folder is None:
+        export_folder = str(Path(path).parent) + os.sep
+
+    export_config = copy.copy(export_config) if export_config else ExportConfig()
+    export_config.mode = 'full'
+
+    args = ([Path(p) for p in manifest['inputs']], export_folder, manifest['camera_topics'], manifest['passthrough_topics'], export_config)
+    if manifest['ros_version'] == 1:
+        from blur_face_manual.BagFileHandler import BagFileHandler_ros1
+        handler = BagFileHandler_ros1(*args)
+    else:
+        from blur_face_manual.BagFileHandler_ros2 import BagFileHandler_ros2
+        handler = BagFileHandler_ros2(*args)
+    handler.merge_overlay(manifest)
@@ -0,0 +1,244 @@
+# sqlite
+import sqlite3
+
+# time
+import time
+
+# os
+import os
+import getpass
+import socket
+
+# collections
+from collections import Counter
+
+# blur_face_manual
+from blur_face_manual.BlurRegion import BlurRegion
+from blur_face_manual.Cam import Cam
+
+# bump when the schema changes
+REGION_DB_VERSION = 1
+
+# locks without a heartbeat for this long belong to a dead annotator and can be taken over
+LOCK_STALE_AFTER = 600.0
+HEARTBEAT_INTERVAL = 60.0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS cams (cam INTEGER PRIMARY KEY, total_frames INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS regions (
+    id INTEGER PRIMARY KEY,
+    cam INTEGER NOT NULL,
+    frame INTEGER NOT NULL,
+    timestamp INTEGER,
+    start_x INTEGER NOT NULL,
+    start_y INTEGER NOT NULL,
+    end_x INTEGER NOT NULL,
+    end_y INTEGER NOT NULL,
+    annotator TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS regions_cam_frame ON regions (cam, frame);
+CREATE TABLE IF NOT EXISTS locks (
+    id INTEGER PRIMARY KEY,
+    annotator TEXT NOT NULL,
+    cam INTEGER NOT NULL,
+    start_frame INTEGER NOT NULL,
+    end_frame INTEGER NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS locks_cam ON locks (cam);
+'''
+
+class RegionDatabase:
+    """
+    Blur regions of a bag in a SQLite file (WAL mode) shared by several annotator processes.
+    Each annotator locks a frame range of some cameras and only writes regions inside it;
+    every region row records its annotator and edit time. Reads see every annotator's regions,
+    so the export reads straight from the database. Same interface as SaveFileHandler.
+    """
+
+    def __init__(self, path, annotator = None, cams = None, frame_range = None, read_only = False):
+        self.path = str(path)
+        self.annotator = annotator or f'{getpass.getuser()}@{socket.gethostname()}:{os.getpid()}'
+        self.cams = cams
+        self.frame_range = frame_range
+        self.read_only = read_only
+        self.locked = False
+        self.last_heartbeat = 0.0
+
+        # autocommit, writes use explicit BEGIN IMMEDIATE transactions
+        self.connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        version = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None:
+            self.connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', ?)", (str(REGION_DB_VERSION),))
+        elif int(version[0]) != REGION_DB_VERSION:
+            raise ValueError(f'Unsupported region database version {version[0]} in "{self.path}".')
+
+    # ----------------- session -----------------
+    def register_cams(self, cams):
+        # the first annotator records the frame counts, the others must open the same bag
+        with self.transaction():
+            for ith, cam in enumerate(cams):
+                self.connection.execute('INSERT OR IGNORE INTO cams (cam, total_frames) VALUES (?, ?)', (ith, cam.total_frames))
+            stored = dict(self.connection.execute('SELECT cam, total_frames FROM cams'))
+        for ith, cam in enumerate(cams):
+            if stored.get(ith) != cam.total_frames:
+                print(f'Error: region database "{self.path}" has {stored.get(ith)} frames for cam{ith}, the bag has {cam.total_frames}.')
+                return False
+        return True
+
+    def lock_ranges(self):
+        # (cam, start, end) locked by this annotator
+        total_frames = dict(self.connection.execute('SELECT cam, total_frames FROM cams'))
+        cams = self.cams if self.cams is not None else sorted(total_frames)
+        return [(cam, *(self.frame_range or (0, total_frames[cam]))) for cam in cams if cam in total_frames]
+
+    def acquire_lock(self):
+        if self.read_only:
+            return True
+        now = time.time()
+        with self.transaction():
+            # drop the locks of dead annotators
+            self.connection.execute('DELETE FROM locks WHERE heartbeat < ?', (now - LOCK_STALE_AFTER,))
+
+            # overlapping ranges of other annotators
+            ranges = self.lock_ranges()
+            for cam, start, end in ranges:
+                conflict = self.connection.execute(
+                    'SELECT annotator, start_frame, end_frame FROM locks WHERE cam = ? AND start_frame < ? AND end_frame > ? AND annotator != ?',
+                    (cam, end, start, self.annotator)).fetchone()
+                if conflict is not None:
+                    print(f'Error: cam{cam} frames {conflict[1]}-{conflict[2]} are locked by {conflict[0]}.')
+                    return False
+
+            self.connection.execute('DELETE FROM locks WHERE annotator = ?', (self.annotator,))
+            self.connection.executemany('INSERT INTO locks (annotator, cam, start_frame, end_frame, heartbeat) VALUES (?, ?, ?, ?, ?)',
+                                        [(self.annotator, cam, start, end, now) for cam, start, end in ranges])
+        self.locked = True
+        self.last_heartbeat = now
+        for cam, start, end in ranges:
+            print(f'{self.annotator} locked cam{cam} frames {start}-{end}')
+        return True
+
+    def release_lock(self):
+        if self.locked:
+            with self.transaction():
+                self.connection.execute('DELETE FROM locks WHERE annotator = ?', (self.annotator,))
+            self.locked = False
+
+    def heartbeat(self, force = False):
+        # keep the lock alive, throttled
+        now = time.time()
+        if self.locked and (force or now - self.last_heartbeat >= HEARTBEAT_INTERVAL):
+            self.connection.execute('UPDATE locks SET heartbeat = ? WHERE annotator = ?', (now, self.annotator))
+            self.last_heartbeat = now
+
+    def owns(self, cam, frame):
+        # frames this annotator may edit
+        if self.read_only:
+            return False
+        if self.cams is not None and cam not in self.cams:
+            return False
+        return self.frame_range is None or self.frame_range[0] <= frame < self.frame_range[1]
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    def close(self):
+        self.release_lock()
+        self.connection.close()
+
+    # ----------------- regions -----------------
+    def write_to_save_file(self, cams):
+        if self.read_only:
+            print(f'region database "{self.path}" is opened read only, nothing written.')
+            return
+        now = time.time()
+        written = 0
+        with self.transaction():
+            # the lock may have been taken over after a long pause
+            held = self.connection.execute('SELECT COUNT(*) FROM locks WHERE annotator = ?', (self.annotator,)).fetchone()[0]
+            if not held:
+                print(f'Error: {self.annotator} lost its lock on "{self.path}", regions not written.')
+                return
+
+            for cam, start, end in self.lock_ranges():
+                # stored rows of the locked range
+                stored = {}
+                for row_id, frame, *coords in self.connection.execute(
+                        'SELECT id, frame, start_x, start_y, end_x, end_y FROM regions WHERE cam = ? AND frame >= ? AND frame < ?', (cam, start, end)):
+                    stored.setdefault((frame, *coords), []).append(row_id)
+
+                # regions in memory, unchanged rows keep their edit time
+                wanted = Counter()
+                for frame in range(start, min(end, cams[cam].total_frames)):
+                    for region in cams[cam].blur_regions[frame]:
+                        wanted[(frame, region.start_x, region.start_y, region.end_x, region.end_y)] += 1
+                removed = []
+                for key, row_ids in stored.items():
+                    keep = min(len(row_ids), wanted[key])
+                    removed += row_ids[keep:]
+                    wanted[key] -= keep
+                self.connection.executemany('DELETE FROM regions WHERE id = ?', [(row_id,) for row_id in removed])
+                rows = []
+                for (frame, *coords), count in wanted.items():
+                    timestamp = cams[cam].get_timestamp(frame) if frame < len(cams[cam].timestamp_list) else None
+                    rows += [(cam, frame, timestamp, *coords, self.annotator, now)] * count
+                self.connection.executemany(
+                    'INSERT INTO regions (cam, frame, timestamp, start_x, start_y, end_x, end_y, annotator, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                written += len(rows) + len(removed)
+            self.connection.execute('UPDATE locks SET heartbeat = ? WHERE annotator = ?', (now, self.annotator))
+        self.last_heartbeat = now
+        print(f'blurred regions written to "{self.path}" ({written} rows changed).')
+
+    def read_regions(self, cam, start, end):
+        # regions of cam in frames [start, end), as (frame, BlurRegion), indexed by (cam, frame)
+        rows = self.connection.execute(
+            'SELECT frame, start_x, start_y, end_x, end_y FROM regions WHERE cam = ? AND frame >= ? AND frame < ? ORDER BY frame, id', (cam, start, end))
+        regions = []
+        for frame, start_x, start_y, end_x, end_y in rows:
+            blur_region = BlurRegion()
+            blur_region.set_region(start_x, start_y, end_x, end_y)
+            regions.append((frame, blur_region))
+        return regions
+
+    def read_from_save_file(self, cams = None):
+        # rows are keyed by frame of the whole bag, cams (the session) is not needed
+        total_frames = dict(self.connection.execute('SELECT cam, total_frames FROM cams'))
+        if not total_frames:
+            print(f'region database "{self.path}" has no regions yet.')
+            return None
+
+        cams = []
+        for cam in range(max(total_frames) + 1):
+            current_cam = Cam()
+            current_cam.blur_regions = [[] for _ in range(total_frames.get(cam, 0))]
+            for frame, blur_region in self.read_regions(cam, 0, len(current_cam.blur_regions)):
+                current_cam.blur_regions[frame].append(blur_region)
+            cams.append(current_cam)
+
+        print(f'blurred regions read from "{self.path}".')
+        return cams
+
+
+class Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT, rolled back on errors (an early return commits).
+    IMMEDIATE takes the write lock up front, so concurrent annotators wait (busy timeout)
+    instead of failing on a lock upgrade.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
@@ -5,40 +5,94 @@ from blur_face_manual.Cam import Cam
 # path
 from pathlib import Path
 
+# first line of save files keyed by timestamp, older save files are keyed by frame number
+SAVE_FILE_HEADER = 'blur_regions'
+SAVE_FILE_VERSION = 2
+
 class SaveFileHandler:
 
-    def __init__(self, path):
+    def __init__(self, path, windowed = False):
         self.path = path
 
+        # frame numbers of a time window session are not those of the bag
+        self.windowed = windowed
+
+    def owns(self, cam, frame):
+        # a save file has a single annotator
+        return True
+
     def write_to_save_file(self, cams):
+        # regions by absolute timestamp, so sessions of different time windows share the file
         with open(self.path, 'w') as f:
+            f.write(f'{SAVE_FILE_HEADER} {SAVE_FILE_VERSION}\n')
             for ith, cam in enumerate(cams):
-                f.write(f'cam{ith} {len(cam.blur_regions)}\n')
-                f.write(str(cam))
+                f.write(f'cam{ith}\n')
+                lines = []
+                for frame, regions in enumerate(cam.blur_regions):
+                    lines += [(cam.get_timestamp(frame), str(region)) for region in regions]
+                for timestamp, regions in cam.outside_regions.items():
+                    lines += [(timestamp, str(region)) for region in regions]
+                for timestamp, region in sorted(lines, key=lambda x: x[0]):
+                    f.write(f'{timestamp} {region}\n')
         print(f'blurred regions written to "./{self.path}".')
-    
-    def read_from_save_file(self):
+
+    def read_from_save_file(self, cams):
         if not Path(self.path).exists():
             print(f'file "./{self.path}" does not exist.')
             return None
 
-        cams = []
-
         with open(self.path, 'r') as f:
-            lines = f.readlines()
-
-            current_cam = None
-            for line in lines:
-                if line.startswith('cam'):
-                    length = int(line[5:])
-                    current_cam = Cam()
-                    current_cam.blur_regions = [[] for _ in range(length)]
-                    cams.append(current_cam)
-                else:
-                    index, region_str = line.split(' ', 1)
-                    blur_region = BlurRegion().from_str(region_str)
-                    current_cam.blur_regions[int(index)].append(blur_region)
-        
+            lines = f.read().splitlines()
+        if lines and lines[0].startswith(SAVE_FILE_HEADER):
+            loaded = self.read_timestamps(lines[1:], cams)
+        else:
+            loaded = self.read_frames(lines)
+        if loaded is None:
+            return None
+
+        outside = sum(len(regions) for cam in loaded for regions in cam.outside_regions.values())
+        if outside:
+            print(f'{outside} blurred regions are outside the loaded frames, they are kept and exported.')
         print(f'blurred regions read from "./{self.path}".')
 
-        return cams
+        return loaded
+
+    def read_timestamps(self, lines, cams):
+        # regions go to the frame of their timestamp, or outside the loaded frames
+        loaded = []
+        current_cam = None
+        for line in lines:
+            if line.startswith('cam'):
+                current_cam = Cam()
+                reference = cams[len(loaded)] if len(loaded) < len(cams) else Cam()
+                current_cam.blur_regions = [[] for _ in range(reference.total_frames)]
+                loaded.append(current_cam)
+            elif line:
+                timestamp, region_str = line.split(' ', 1)
+                blur_region = BlurRegion().from_str(region_str)
+                frame = reference.get_frame(int(timestamp))
+                if frame is None:
+                    current_cam.outside_regions.setdefault(int(timestamp), []).append(blur_region)
+                else:
+                    current_cam.blur_regions[frame].append(blur_region)
+        return loaded
+
+    def read_frames(self, lines):
+        # save files keyed by frame number of the whole bag
+        if self.windowed:
+            print(f'Error: "./{self.path}" is keyed by frame number, open the whole bag and write it (W) once to use it with a time window.')
+            return None
+
+        loaded = []
+        current_cam = None
+        for line in lines:
+            if line.startswith('cam'):
+                length = int(line[5:])
+                current_cam = Cam()
+                current_cam.blur_regions = [[] for _ in range(length)]
+                loaded.append(current_cam)
+            elif line:
+                index, region_str = line.split(' ', 1)
+                blur_region = BlurRegion().from_str(region_str)
+                current_cam.blur_regions[int(index)].append(blur_region)
+        return loaded
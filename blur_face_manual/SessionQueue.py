@@ -0,0 +1,134 @@
+# multiprocessing
+import multiprocessing
+import queue
+
+# shell-like splitting of the queue file lines
+import shlex
+
+# time
+import time
+
+# frames of every cam read by the preload once the next bag is scanned, so the first frames come from the page cache
+PRELOAD_FRAMES = 30
+
+def read_session_queue(path, save_file_folder = ""):
+    """
+    Bags of a session queue file, one per line: the bag (a bag, a folder of splits or a glob, quoted if it
+    has spaces) optionally followed by its save path prefix, which defaults to save_file_folder.
+    Empty lines and lines starting with # are skipped.
+    """
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            fields = shlex.split(line, comments=True)
+            if not fields:
+                continue
+            if len(fields) > 2:
+                raise ValueError(f'Invalid session queue line "{line.strip()}", expected <bag> [<save_path_prefix>]')
+            entries.append((fields[0], fields[1] if len(fields) == 2 else save_file_folder))
+    return entries
+
+def run_preload(handler, status_queue):
+    # entry point of the preload process: scan the bag (writes its frame index) and read the first frames
+    start = time.perf_counter()
+    try:
+        cams = handler.get_cams()
+        for cam in cams:
+            for frame in range(min(PRELOAD_FRAMES, cam.total_frames)):
+                cam.get_compressed_payload(frame)
+    except SystemExit:
+        status_queue.put(('failed',))
+        return
+    except Exception:
+        status_queue.put(('failed',))
+        raise
+    status_queue.put(('ready', [cam.total_frames for cam in cams], time.perf_counter() - start))
+
+class SessionQueue:
+    """
+    Bags annotated back to back in one Application, each with its save path prefix.
+    While a bag is annotated the next one is preloaded in a background process: it is scanned, which writes
+    its frame index next to it, and its first frames are read. Switching to it then only reads the index.
+    - preload(ith, handler): starts preloading entry ith with the handler that will open it
+    - poll(): reads the status of the preload, true when it changed
+    - wait(ith): waits for the preload of entry ith, if it is the one running
+    - close(): stops the preload, the bag is scanned again when opened
+    The process is spawned, not forked, so it does not inherit the GUI state.
+    """
+
+    def __init__(self, entries):
+        if not entries:
+            raise ValueError('The session queue has no bags')
+        self.entries = list(entries)
+        self.current = 0
+        self.context = multiprocessing.get_context('spawn')
+        self.process = None
+        self.status_queue = None
+        self.preloading = None
+        self.state = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def name(self, ith):
+        return str(self.entries[ith][0])
+
+    def preload(self, ith, handler):
+        self.close()
+        if not 0 <= ith < len(self.entries):
+            return False
+        self.status_queue = self.context.Queue()
+        self.process = self.context.Process(target=run_preload, args=(handler, self.status_queue))
+        self.process.start()
+        self.preloading = ith
+        self.state = 'running'
+        print(f'Preloading the next bag {self.name(ith)} in the background (pid {self.process.pid}).')
+        return True
+
+    def poll(self):
+        if self.process is None:
+            return False
+
+        # checked before reading, so the last status of an ended process is read
+        alive = self.process.is_alive()
+        changed = False
+        while True:
+            try:
+                status = self.status_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.state = status[0]
+            if status[0] == 'ready':
+                _, frames, seconds = status
+                print(f'Next bag {self.name(self.preloading)} preloaded in {seconds:.1f} s, {frames} frames.')
+            changed = True
+
+        # the preload process ended
+        if not alive:
+            if self.state != 'ready':
+                self.state = 'failed'
+                print(f'Could not preload the next bag {self.name(self.preloading)}, it is loaded when opened.')
+            self.process.join()
+            self.process = None
+            changed = True
+        return changed
+
+    def wait(self, ith):
+        # a bag opened while it is preloaded waits for it instead of scanning it a second time
+        if self.preloading != ith or not self.running:
+            return
+        print(f'Waiting for the preload of {self.name(ith)} ...')
+        self.process.join()
+        self.poll()
+
+    def close(self):
+        if self.running:
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+        self.preloading = None
+        self.state = None
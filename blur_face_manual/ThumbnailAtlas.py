@@ -0,0 +1,228 @@
+# numpy
+import numpy as np
+
+# json
+import json
+
+# hashing
+import hashlib
+
+# threading
+import threading
+
+# time
+import time
+
+# os
+import shutil
+
+# path
+from pathlib import Path
+
+# OpenCV
+import cv2
+
+# blur_face_manual
+from blur_face_manual.Cam import decode_compressed
+from blur_face_manual.FrameIndex import bags_fingerprint
+
+# bump when the layout of the atlas changes
+THUMBNAIL_VERSION = 1
+
+# frames are built coarse to fine, so the whole timeline has thumbnails early
+THUMBNAIL_STRIDES = [256, 64, 16, 4, 1]
+
+# seconds between flushes of the built thumbnails to disk
+THUMBNAIL_FLUSH_INTERVAL = 5.0
+
+# jpeg can be decoded at 1/2, 1/4 or 1/8 of its size, much faster than a full decode
+REDUCED_COLOR = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+REDUCED_GRAYSCALE = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+def timestamps_digest(timestamps):
+    return hashlib.blake2b(np.asarray(timestamps, dtype=np.int64).tobytes(), digest_size=16).hexdigest()
+
+def decode_thumbnail(data, image_shape, thumbnail_shape):
+    # decode at the largest reduction that is still larger than the thumbnail, then resize
+    height, width = thumbnail_shape[:2]
+    factor = max([1] + [f for f in REDUCED_COLOR if image_shape[1] // f >= width and image_shape[0] // f >= height])
+    gray = len(thumbnail_shape) == 2
+    if factor == 1:
+        image = decode_compressed(data)
+        if gray and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        elif not gray and image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        elif not gray and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    else:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), (REDUCED_GRAYSCALE if gray else REDUCED_COLOR)[factor])
+    if image is None:
+        return None
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class ThumbnailAtlas:
+    """
+    Low resolution copy of every frame of every cam, for instant jumps along the timeline.
+    A background thread decodes the frames (jpeg at reduced size) into memory mapped arrays on disk,
+    <folder>/cam{i}.npy (frames x height x width [x 3] uint8) with the built flags in cam{i}_built.npy,
+    so later sessions of the same bags and frames reuse them and resume an unfinished build.
+    - built(ith, frame): true once the thumbnail of a frame is in the atlas
+    - thumbnail(ith, frame): the thumbnail scaled back to the size of the frame, None if not built yet
+    """
+
+    def __init__(self, folder, bag_paths, cams, width):
+        self.folder = Path(folder)
+        self.bag_paths = bag_paths
+        self.cams = cams
+        self.width = int(width)
+        self.thumbnails = [None] * len(cams)
+        self.built_flags = [None] * len(cams)
+        self.image_shapes = [None] * len(cams)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # ----------------- files -----------------
+    def meta_path(self):
+        return self.folder / 'meta.json'
+
+    def cam_meta(self, ith):
+        return {'frames': self.cams[ith].total_frames, 'timestamps': timestamps_digest(self.cams[ith].timestamp_list)}
+
+    def open_existing(self):
+        # thumbnails of a previous session of the same bags, frames and width
+        try:
+            with open(self.meta_path(), 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get('version') != THUMBNAIL_VERSION or meta['width'] != self.width or meta['fingerprint'] != bags_fingerprint(self.bag_paths):
+            return False
+        if len(meta['cams']) != len(self.cams):
+            return False
+        for ith, cam_meta in enumerate(meta['cams']):
+            if {k: cam_meta[k] for k in ('frames', 'timestamps')} != self.cam_meta(ith):
+                return False
+        try:
+            for ith, cam_meta in enumerate(meta['cams']):
+                if cam_meta['image_shape'] is None:
+                    continue
+                self.thumbnails[ith] = np.load(self.folder / f'cam{ith}.npy', mmap_mode='r+')
+                self.built_flags[ith] = np.load(self.folder / f'cam{ith}_built.npy', mmap_mode='r+')
+                self.image_shapes[ith] = tuple(cam_meta['image_shape'])
+        except (OSError, ValueError) as e:
+            print(f'Could not open the thumbnails in "{self.folder}": {e}')
+            self.thumbnails = [None] * len(self.cams)
+            self.built_flags = [None] * len(self.cams)
+            return False
+        return True
+
+    def create(self):
+        # thumbnail size from the first frame of each cam, every file is written again
+        shutil.rmtree(self.folder, ignore_errors=True)
+        self.folder.mkdir(parents=True)
+        cams_meta = []
+        for ith, cam in enumerate(self.cams):
+            cam_meta = self.cam_meta(ith)
+            cam_meta['image_shape'] = None
+            image = cam.get_image(0) if cam.total_frames else None
+            if image is not None:
+                height = max(1, round(image.shape[0] * self.width / image.shape[1]))
+                shape = (height, self.width) if image.ndim == 2 else (height, self.width, 3)
+                self.thumbnails[ith] = np.lib.format.open_memmap(self.folder / f'cam{ith}.npy', mode='w+', dtype=np.uint8, shape=(cam.total_frames,) + shape)
+                self.built_flags[ith] = np.lib.format.open_memmap(self.folder / f'cam{ith}_built.npy', mode='w+', dtype=np.uint8, shape=(cam.total_frames,))
+                self.image_shapes[ith] = image.shape[:2]
+                cam_meta['image_shape'] = list(image.shape[:2])
+            cams_meta.append(cam_meta)
+
+        meta = {'version': THUMBNAIL_VERSION, 'fingerprint': bags_fingerprint(self.bag_paths), 'width': self.width, 'cams': cams_meta}
+        tmp_path = self.meta_path().with_name('meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        tmp_path.replace(self.meta_path())
+
+    # ----------------- build -----------------
+    def start(self):
+        if not self.open_existing():
+            self.create()
+        if self.progress() < 1.0:
+            self.thread = threading.Thread(target=self.build, daemon=True)
+            self.thread.start()
+
+    def build_order(self, total_frames):
+        # coarse to fine, each frame once
+        visited = np.zeros(total_frames, dtype=bool)
+        for stride in THUMBNAIL_STRIDES:
+            for frame in range(0, total_frames, stride):
+                if not visited[frame]:
+                    visited[frame] = True
+                    yield frame
+
+    def build(self):
+        # the cams are built side by side, each with its own reader (the GUI keeps reading its frames)
+        start = time.perf_counter()
+        last_flush = start
+        built = 0
+        readers = [cam.frame_reader.clone() if cam.frame_reader is not None else None for cam in self.cams]
+        orders = [self.build_order(cam.total_frames) if self.thumbnails[ith] is not None else iter(()) for ith, cam in enumerate(self.cams)]
+        pending = list(range(len(self.cams)))
+        while pending and not self.stop_event.is_set():
+            for ith in list(pending):
+                frame = next(orders[ith], None)
+                if frame is None:
+                    pending.remove(ith)
+                    continue
+                if self.built_flags[ith][frame]:
+                    continue
+                data = self.cams[ith].get_compressed_payload(frame, readers[ith])
+                thumbnail = decode_thumbnail(data, self.image_shapes[ith], self.thumbnails[ith].shape[1:])
+                if thumbnail is None:
+                    continue
+                self.thumbnails[ith][frame] = thumbnail
+                self.built_flags[ith][frame] = 1
+                built += 1
+            if time.perf_counter() - last_flush > THUMBNAIL_FLUSH_INTERVAL:
+                self.flush()
+                last_flush = time.perf_counter()
+        for reader in readers:
+            if reader is not None:
+                reader.close()
+        self.flush()
+        if not self.stop_event.is_set():
+            print(f'thumbnails: {built} frames built in {time.perf_counter() - start:.1f} s, "{self.folder}"')
+
+    def flush(self):
+        # thumbnails before their flags, so a flag on disk always has its thumbnail
+        for thumbnails, built_flags in zip(self.thumbnails, self.built_flags):
+            if thumbnails is not None:
+                thumbnails.flush()
+                built_flags.flush()
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # ----------------- read -----------------
+    def built(self, ith, frame):
+        return self.built_flags[ith] is not None and bool(self.built_flags[ith][frame])
+
+    def built_frames(self, ith):
+        # frames with a thumbnail, as a boolean array
+        if self.built_flags[ith] is None:
+            return np.zeros(self.cams[ith].total_frames, dtype=bool)
+        return np.asarray(self.built_flags[ith]) != 0
+
+    def progress(self):
+        total = sum(cam.total_frames for ith, cam in enumerate(self.cams) if self.built_flags[ith] is not None)
+        if total == 0:
+            return 1.0
+        return sum(int(np.count_nonzero(flags)) for flags in self.built_flags if flags is not None) / total
+
+    def thumbnail(self, ith, frame):
+        if not self.built(ith, frame):
+            return None
+        height, width = self.image_shapes[ith]
+        return cv2.resize(self.thumbnails[ith][frame], (width, height), interpolation=cv2.INTER_LINEAR)
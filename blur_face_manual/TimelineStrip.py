@@ -0,0 +1,62 @@
+# numpy
+import numpy as np
+
+# OpenCV
+import cv2
+
+# size of the timeline window
+TIMELINE_WIDTH = 1280
+TIMELINE_ROW_HEIGHT = 24
+
+# BGR colors
+TIMELINE_BACKGROUND = (48, 48, 48)
+TIMELINE_REGIONS = (0, 140, 255)
+TIMELINE_THUMBNAILS = (110, 110, 110)
+TIMELINE_CURRENT = (255, 255, 255)
+
+def frame_columns(frames, total_frames, width):
+    # column of each frame along a strip of width pixels
+    return (np.asarray(frames, dtype=np.int64) * width) // max(1, total_frames)
+
+class TimelineStrip:
+    """
+    One row per cam over the whole timeline: frames with blur regions are marked, the current frame is a
+    white line and a thin line at the bottom shows the frames whose thumbnail is built.
+    Clicking or dragging along the strip jumps to that position (on_seek(ratio)).
+    """
+
+    def __init__(self, on_seek, width = TIMELINE_WIDTH):
+        self.on_seek = on_seek
+        self.width = width
+        self.dragging = False
+
+    def draw(self, cams, thumbnails = None):
+        image = np.empty((TIMELINE_ROW_HEIGHT * len(cams), self.width, 3), dtype=np.uint8)
+        image[:] = TIMELINE_BACKGROUND
+        for ith, cam in enumerate(cams):
+            top = ith * TIMELINE_ROW_HEIGHT
+            row = image[top + 1:top + TIMELINE_ROW_HEIGHT - 1]
+
+            # frames with regions
+            marked = [frame for frame, regions in enumerate(cam.blur_regions) if regions]
+            row[:-3, frame_columns(marked, cam.total_frames, self.width)] = TIMELINE_REGIONS
+
+            # built thumbnails
+            if thumbnails is not None:
+                built = np.nonzero(thumbnails.built_frames(ith))[0]
+                row[-2:, frame_columns(built, cam.total_frames, self.width)] = TIMELINE_THUMBNAILS
+
+            # current frame
+            column = int(frame_columns([cam.current_frame], cam.total_frames, self.width)[0])
+            row[:, max(0, column - 1):column + 1] = TIMELINE_CURRENT
+            cv2.putText(image, f'cam{ith}', (4, top + TIMELINE_ROW_HEIGHT - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.4, TIMELINE_CURRENT, 1, cv2.LINE_AA)
+        return image
+
+    def mouse_callback(self, event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN:
+            self.dragging = True
+        elif event == cv2.EVENT_LBUTTONUP:
+            self.dragging = False
+        elif event != cv2.EVENT_MOUSEMOVE or not self.dragging:
+            return
+        self.on_seek(min(max(x / self.width, 0.0), 1.0))
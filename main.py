@@ -4,6 +4,9 @@ import sys
 
 # other
 from blur_face_manual.Application import Application
+from blur_face_manual.ExportConfig import ExportConfig
+from blur_face_manual.AnnotationConfig import AnnotationConfig
+from blur_face_manual.SessionQueue import SessionQueue, read_session_queue
 
 if __name__ == '__main__':
     ####### topics - frontier v7
@@ -20,7 +23,38 @@ if __name__ == '__main__':
 
     
     ros_version = 2 # 1 for ROS1, 2 for ROS2
-    
+
+    # export settings, see blur_face_manual/ExportConfig.py
+    # mode = 'overlay' writes only the camera topics, merge later with merge_overlay.py
+    # compression: 'none', 'lz4', 'bz2' (ROS1) or 'zstd' (ROS2), chunk_size in bytes, storage_preset/cache_size for ROS2
+    # split_size (bytes) / split_duration (seconds) split the output into bags published while exporting
+    # shards > 1 exports time shards in parallel processes, merged at the end unless keep_shards
+    # blur_method: 'gaussian' (fixed kernel), or 'pyramid', 'box', 'pixelate' scaled to the region size
+    export_config = ExportConfig(checkpoint_interval = 30.0, mode = 'full', compression = 'none', chunk_size = None,
+                                 split_size = None, split_duration = None, shards = 1, keep_shards = False,
+                                 blur_method = 'gaussian')
+
+    # annotation settings, see blur_face_manual/AnnotationConfig.py
+    # backend = 'sqlite' shares <stem>_regions.sqlite between annotators, each editing its cams / frame_range (end excluded)
+    # time_window = (start, end) seconds from the start of the bag loads only that section (file backend)
+    # thumbnail_width: thumbnails shown on jumps (None disables them), timeline = True opens the timeline strip (T)
+    annotation = AnnotationConfig(backend = 'file', annotator = None, cams = None, frame_range = None, read_only = False,
+                                  time_window = None, thumbnail_width = 160, timeline = False)
+
+    # --verify compares the exported bags with the input bags and the save file instead of opening the GUI
+    # --plan estimates the export (frames to re-encode, output size, runtime per worker count) without writing it
+    verify = '--verify' in sys.argv[1:]
+    if verify:
+        sys.argv.remove('--verify')
+    # --plan-write-sample also times the writes on disk, in a scratch bag in the system temp folder (needed for ROS2)
+    plan = '--plan' in sys.argv[1:]
+    if plan:
+        sys.argv.remove('--plan')
+    plan_write_sample = '--plan-write-sample' in sys.argv[1:]
+    if plan_write_sample:
+        sys.argv.remove('--plan-write-sample')
+        plan = True
+
     if len(sys.argv) == 1:
         bag_file = Path('<path_to_bag_file>')
         save_file_folder = ""
@@ -40,9 +74,28 @@ if __name__ == '__main__':
         save_file_folder = sys.argv[2]
         export_folder = sys.argv[3]
     else:
-        print("Usage: python blur_face_manual.py <path_to_bag_file> <save_path_prefix> <export_path>")
+        print("Usage: python blur_face_manual.py [--verify | --plan [--plan-write-sample]] <path_to_bag_file> <save_path_prefix> <export_path>")
         sys.exit(1)
-        
 
-    app = Application(bag_file, save_file_folder, export_folder, camera_topics, passthrough_topics, ros_version)
+    # a .txt file is a session queue: one bag per line, optionally followed by its save path prefix
+    # N / P switch to the next / previous bag, the next one is preloaded in the background
+    session_queue = None
+    if bag_file.suffix == '.txt':
+        session_queue = SessionQueue(read_session_queue(bag_file, save_file_folder))
+
+    if verify or plan:
+        # every bag of a session queue is verified or planned
+        succeeded = True
+        for ith in range(len(session_queue) if session_queue is not None else 1):
+            if session_queue is not None:
+                session_queue.current = ith
+            app = Application(bag_file, save_file_folder, export_folder, camera_topics, passthrough_topics, ros_version, export_config, annotation, session_queue)
+            if verify:
+                succeeded = app.verify_export() and succeeded
+            else:
+                succeeded = app.plan_export(plan_write_sample) is not None and succeeded
+            app.close_bag()
+        sys.exit(0 if succeeded else 1)
+
+    app = Application(bag_file, save_file_folder, export_folder, camera_topics, passthrough_topics, ros_version, export_config, annotation, session_queue)
     app.run()
\ No newline at end of file
@@ -0,0 +1,14 @@
+# path
+import sys
+
+# other
+from blur_face_manual.Overlay import merge_from_manifest
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        merge_from_manifest(sys.argv[1])
+    elif len(sys.argv) == 3:
+        merge_from_manifest(sys.argv[1], sys.argv[2])
+    else:
+        print("Usage: python merge_overlay.py <path_to_overlay_manifest.json> <export_path>")
+        sys.exit(1)
@@ -0,0 +1,90 @@
+# numpy
+import numpy as np
+
+# OpenCV
+import cv2
+
+# path
+from pathlib import Path
+
+# rosbags
+from rosbags.highlevel import AnyReader
+from rosbags.rosbag1 import Writer
+from rosbags.typesys import get_typestore, Stores
+from rosbags.typesys.stores.ros1_noetic import builtin_interfaces__msg__Time as Time
+from rosbags.typesys.stores.ros1_noetic import geometry_msgs__msg__Quaternion as Quaternion
+from rosbags.typesys.stores.ros1_noetic import geometry_msgs__msg__Vector3 as Vector3
+from rosbags.typesys.stores.ros1_noetic import sensor_msgs__msg__CompressedImage as CompressedImage
+from rosbags.typesys.stores.ros1_noetic import sensor_msgs__msg__Imu as Imu
+from rosbags.typesys.stores.ros1_noetic import std_msgs__msg__Header as Header
+
+# blur_face_manual
+from blur_face_manual.BagFileHandler import BagFileHandler_ros1
+from blur_face_manual.BlurRegion import BlurRegion
+
+CAMERA_TOPICS = ['/cam0/image_raw/compressed', '/cam1/image_raw/compressed']
+PASSTHROUGH_TOPICS = ['/imu/data_raw']
+
+# first timestamp of the test bags and the period of their frames, in ns
+START = 1_000_000_000_000
+PERIOD = 100_000_000
+
+TYPESTORE = get_typestore(Stores.ROS1_NOETIC)
+
+def write_bag(path, frames, start = START, topics = CAMERA_TOPICS + PASSTHROUGH_TOPICS):
+    """
+    Small ROS1 bag: every PERIOD a frame of each cam topic at the same timestamp, and two imu messages,
+    the first one at that timestamp as well (messages sharing timestamps across topics).
+    """
+    rng = np.random.default_rng(start // PERIOD)
+    with Writer(Path(path)) as writer:
+        connections = {topic: writer.add_connection(topic, CompressedImage.__msgtype__ if topic in CAMERA_TOPICS else Imu.__msgtype__, typestore=TYPESTORE) for topic in topics}
+        for k in range(frames):
+            timestamp = start + k * PERIOD
+            header = Header(seq=k, stamp=Time(sec=timestamp // 10**9, nanosec=timestamp % 10**9), frame_id='test')
+            for topic, connection in connections.items():
+                if topic in CAMERA_TOPICS:
+                    image = (rng.random((48, 64, 3)) * 255).astype(np.uint8)
+                    _, data = cv2.imencode('.jpg', image)
+                    msg = CompressedImage(header=header, format='jpeg', data=data.reshape(-1))
+                    writer.write(connection, timestamp, TYPESTORE.serialize_ros1(msg, CompressedImage.__msgtype__))
+                else:
+                    for j in range(2):
+                        msg = Imu(header=header, orientation=Quaternion(x=0, y=0, z=0, w=1), orientation_covariance=np.zeros(9),
+                                  angular_velocity=Vector3(x=j, y=0, z=0), angular_velocity_covariance=np.zeros(9),
+                                  linear_acceleration=Vector3(x=0, y=0, z=k), linear_acceleration_covariance=np.zeros(9))
+                        writer.write(connection, timestamp + j * PERIOD // 2, TYPESTORE.serialize_ros1(msg, Imu.__msgtype__))
+    return Path(path)
+
+def read_messages(paths):
+    # (topic, timestamp, rawdata) of every message of a set of bags, in timeline order
+    with AnyReader([Path(p) for p in paths], default_typestore=TYPESTORE) as reader:
+        return [(connection.topic, timestamp, bytes(rawdata)) for connection, timestamp, rawdata in reader.messages()]
+
+def create_handler(path, export_folder, export_config = None, time_window = None):
+    return BagFileHandler_ros1(Path(path), str(export_folder) + '/', CAMERA_TOPICS, PASSTHROUGH_TOPICS, export_config, time_window)
+
+def blurred_cams(handler, frames = range(1, 5)):
+    # scanned cams of a handler with regions on some frames
+    cams = handler.scan_cams()
+    add_regions(cams, frames)
+    return cams
+
+def add_regions(cams, frames = range(1, 5)):
+    # a blur region on some frames of every cam
+    for ith, cam in enumerate(cams):
+        for frame in frames:
+            region = BlurRegion()
+            region.set_region(4 + ith, 4, 40, 30)
+            cam.blur_regions[frame].append(region)
+
+def interrupt_export(monkeypatch, messages):
+    # the export is interrupted (as by Ctrl-C) once it has written this many messages
+    from blur_face_manual.ExportStats import ExportStats
+    add_message = ExportStats.add_message
+
+    def interrupting_add_message(stats, *args):
+        add_message(stats, *args)
+        if stats.name == 'export' and stats.messages == messages:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(ExportStats, 'add_message', interrupting_add_message)
@@ -0,0 +1,66 @@
+# multiprocessing
+import multiprocessing
+
+# time
+import time
+
+# blur_face_manual
+from blur_face_manual.BackgroundExport import BackgroundExport, run_export
+from blur_face_manual.ExportConfig import ExportConfig
+from blur_face_manual.ExportStats import ExportStats
+
+# test bags
+from bags import add_regions, blurred_cams, create_handler, read_messages, write_bag
+
+def statuses(status_queue):
+    # statuses sent by an export, up to the final one
+    sent = []
+    while not sent or sent[-1] == 'progress':
+        sent.append(status_queue.get(timeout=10)[0])
+    return sent
+
+def test_background_export_of_a_snapshot(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 6)
+    (tmp_path / 'serial').mkdir()
+    serial = create_handler(bag, tmp_path / 'serial')
+    assert serial.export_cams(blurred_cams(serial))
+
+    (tmp_path / 'background').mkdir()
+    handler = create_handler(bag, tmp_path / 'background')
+    cams = blurred_cams(handler)
+    export = BackgroundExport()
+    assert export.start(handler, cams)
+    assert not export.start(handler, cams)
+
+    # edits made while the export runs are not in it
+    add_regions(cams, range(0, 6))
+    deadline = time.time() + 60
+    while export.process is not None and time.time() < deadline:
+        export.poll()
+        time.sleep(0.05)
+    assert export.state == 'done'
+    assert export.status_line() is not None
+    assert read_messages(handler.output_bag_names) == read_messages(serial.output_bag_names)
+
+def test_cancelled_export_resumes(tmp_path, monkeypatch):
+    bag = write_bag(tmp_path / 'a.bag', 6)
+    (tmp_path / 'serial').mkdir()
+    serial = create_handler(bag, tmp_path / 'serial')
+    assert serial.export_cams(blurred_cams(serial))
+
+    # the listener sees every message
+    progress = ExportStats.progress
+    monkeypatch.setattr(ExportStats, 'progress', lambda stats, force = False, notify = True: progress(stats, True, notify))
+
+    handler = create_handler(bag, tmp_path, ExportConfig(checkpoint_interval=0, chunk_size=4000))
+    cams = blurred_cams(handler)
+    status_queue, cancel_event = multiprocessing.Queue(), multiprocessing.Event()
+    cancel_event.set()
+    run_export(handler, cams, status_queue, cancel_event)
+    assert statuses(status_queue) == ['cancelled']
+    assert (tmp_path / 'a_blurred_checkpoint.json').exists()
+
+    cancel_event.clear()
+    run_export(handler, cams, status_queue, cancel_event)
+    assert statuses(status_queue)[-1] == 'done'
+    assert read_messages(handler.output_bag_names) == read_messages(serial.output_bag_names)
@@ -0,0 +1,35 @@
+# tempfile
+import tempfile
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+
+# test bags
+from bags import CAMERA_TOPICS, add_regions, create_handler, write_bag
+
+def test_plan_writes_no_bag(tmp_path, monkeypatch):
+    write_bag(tmp_path / 'a.bag', 10)
+    export_folder = tmp_path / 'out'
+    export_folder.mkdir()
+    handler = create_handler(tmp_path / 'a.bag', export_folder, ExportConfig(compression='bz2'))
+    cams = handler.scan_cams()
+    add_regions(cams, range(2, 6))
+
+    # the samples are written into memory, not into a scratch folder
+    def no_scratch(*args, **kwargs):
+        raise AssertionError('scratch folder created')
+    monkeypatch.setattr(tempfile, 'TemporaryDirectory', no_scratch)
+    plan = handler.plan_export(cams)
+
+    assert [p.name for p in export_folder.iterdir()] == ['a_blurred_plan.json']
+    assert plan['totals']['reencoded'] == 4 * len(CAMERA_TOPICS)
+    assert plan['totals']['write_bytes_per_second'] > 0
+    assert 0 < plan['totals']['disk_ratio'] < 1
+
+def test_plan_write_sample_on_disk(tmp_path):
+    write_bag(tmp_path / 'a.bag', 10)
+    handler = create_handler(tmp_path / 'a.bag', tmp_path)
+    cams = handler.scan_cams()
+    plan = handler.plan_export(cams, write_sample=True)
+    sample = plan['bags'][0]['sample']
+    assert sample['bytes_on_disk'] > sample['written_bytes']
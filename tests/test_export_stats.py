@@ -0,0 +1,86 @@
+# json
+import json
+
+# multiprocessing
+import multiprocessing
+
+# pytest
+import pytest
+
+# blur_face_manual
+from blur_face_manual.BackgroundExport import ExportCancelled, ExportListener
+from blur_face_manual.ExportStats import ExportStats, format_duration
+
+# test bags
+from bags import add_regions, create_handler, read_messages, write_bag
+
+def test_stages_and_counters_merge():
+    worker = ExportStats('load', 2, progress_interval=None)
+    for _ in worker.timed_iter('read', range(2)):
+        with worker.stage('payload'):
+            worker.add_message('/cam0', 10, 4)
+    worker.count('failed')
+
+    stats = ExportStats('load', 2)
+    stats.merge(worker)
+    stats.merge(worker)
+    summary = stats.summary()
+    assert summary['messages'] == 4
+    assert (summary['bytes_in'], summary['bytes_out']) == (40, 16)
+    assert summary['stages']['read']['calls'] == 4
+    assert summary['stages']['payload']['calls'] == 4
+    assert summary['counters'] == {'failed': 2}
+    assert summary['topics'] == {'/cam0': 4}
+
+def test_progress_is_throttled():
+    calls = []
+    stats = ExportStats('export', 10, progress_interval=3600)
+    stats.listener = calls.append
+    for _ in range(10):
+        stats.add_message('/cam0', 1)
+        stats.progress()
+    assert calls == []
+    stats.progress(force=True)
+    assert len(calls) == 1
+
+    # workers print no progress unless forced
+    stats = ExportStats('shard', 10, progress_interval=None)
+    stats.listener = calls.append
+    stats.progress()
+    assert len(calls) == 1
+
+def test_format_duration():
+    assert format_duration(3725.9) == '1:02:05'
+
+def test_export_writes_its_summary(tmp_path):
+    write_bag(tmp_path / 'a.bag', 6)
+    handler = create_handler(tmp_path / 'a.bag', tmp_path)
+    cams = handler.scan_cams()
+    add_regions(cams, range(1, 3))
+    handler.export_cams(cams)
+
+    summary = json.loads((tmp_path / 'a_blurred_stats.json').read_text())
+    messages = read_messages([tmp_path / 'a.bag'])
+    assert summary['messages'] == summary['total_messages'] == len(messages)
+    assert summary['counters']['blurred'] == 4
+    assert summary['output_bytes_on_disk'] == (tmp_path / 'a_blurred.bag').stat().st_size
+    assert {'read', 'write', 'blur', 'encode'} <= set(summary['stages'])
+
+def cancelled_stats():
+    # stats of a background export whose cancel was requested
+    cancel_event = multiprocessing.Event()
+    cancel_event.set()
+    stats = ExportStats('export', 10)
+    stats.listener = ExportListener(multiprocessing.Queue(), cancel_event)
+    return stats
+
+def test_progress_stops_a_cancelled_export():
+    with pytest.raises(ExportCancelled):
+        cancelled_stats().progress(force=True)
+
+def test_finish_ignores_a_cancel_once_published(tmp_path):
+    stats = cancelled_stats()
+    stats.add_message('/cam0', 100, 100)
+    path = tmp_path / 'stats.json'
+    stats.finish(path)
+    assert json.loads(path.read_text())['messages'] == 1
@@ -0,0 +1,57 @@
+# numpy
+import numpy as np
+
+# rosbags
+from rosbags.typesys import get_typestore, Stores
+
+# blur_face_manual
+from blur_face_manual.FrameArena import FrameArena, SplitArenas, cdr_compressed_payload, ros1_compressed_payload
+
+# test bags
+from bags import PERIOD, START, create_handler, write_bag
+
+def compressed_image(typestore, frame_id, data, **header):
+    # sensor_msgs/msg/CompressedImage of a typestore, header: the fields only ROS1 headers have (seq)
+    types = typestore.types
+    stamp = types['builtin_interfaces/msg/Time'](sec=1, nanosec=2)
+    return types['sensor_msgs/msg/CompressedImage'](header=types['std_msgs/msg/Header'](stamp=stamp, frame_id=frame_id, **header),
+                                                    format='jpeg', data=np.frombuffer(data, dtype=np.uint8))
+
+def test_payload_of_serialized_messages():
+    data = bytes(range(7))
+    for frame_id in ['', 'a', 'cam_0']:
+        ros1 = get_typestore(Stores.ROS1_NOETIC)
+        rawdata = ros1.serialize_ros1(compressed_image(ros1, frame_id, data, seq=1), 'sensor_msgs/msg/CompressedImage')
+        offset, length = ros1_compressed_payload(rawdata)
+        assert rawdata[offset:offset + length] == data
+
+        ros2 = get_typestore(Stores.ROS2_HUMBLE)
+        for little_endian in [True, False]:
+            rawdata = ros2.serialize_cdr(compressed_image(ros2, frame_id, data), 'sensor_msgs/msg/CompressedImage', little_endian=little_endian)
+            offset, length = cdr_compressed_payload(rawdata)
+            assert rawdata[offset:offset + length] == data
+
+def test_split_arenas_read_as_one():
+    arenas = [FrameArena(), FrameArena()]
+    arenas[0].append(b'xxAByy', (2, 2))
+    arenas[1].append(b'CD', (0, 2))
+    arenas[0].append(b'EFz', (0, 2))
+    merged = SplitArenas(arenas)
+    for split, frame in [(0, 0), (1, 0), (0, 1)]:
+        merged.append(split, frame)
+    assert len(merged) == 3
+    assert [bytes(merged.payload(frame)) for frame in range(3)] == [b'AB', b'CD', b'EF']
+    assert bytes(merged.message(2)[0]) == b'EFz'
+
+def test_lazy_frames_read_payload_views(tmp_path):
+    write_bag(tmp_path / 's_0.bag', 5)
+    write_bag(tmp_path / 's_1.bag', 5, start=START + 5 * PERIOD)
+    handler = create_handler(tmp_path / 's_*.bag', tmp_path)
+    loaded = handler.get_cams()
+    lazy = handler.get_cams()
+    for loaded_cam, lazy_cam in zip(loaded, lazy):
+        assert lazy_cam.frame_reader is not None
+        for frame in range(lazy_cam.total_frames):
+            payload = lazy_cam.get_compressed_payload(frame)
+            assert isinstance(payload, memoryview)
+            assert bytes(payload) == bytes(loaded_cam.get_compressed_payload(frame))
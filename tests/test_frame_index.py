@@ -0,0 +1,68 @@
+# numpy
+import numpy as np
+
+# blur_face_manual
+from blur_face_manual.FrameIndex import FrameIndex, FrameIndexFile
+
+# test bags
+from bags import CAMERA_TOPICS, PERIOD, START, create_handler, write_bag
+
+def sample_index():
+    timestamps = [np.arange(START, START + 5 * PERIOD, PERIOD), np.arange(START, START + 3 * PERIOD, PERIOD)]
+    locators = [np.arange(15).reshape(5, 3), np.arange(9).reshape(3, 3)]
+    return FrameIndex(list(CAMERA_TOPICS), ['sensor_msgs/msg/CompressedImage'] * 2, timestamps, locators)
+
+def test_round_trip(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 2)
+    index = sample_index()
+    index_file = FrameIndexFile(tmp_path / 'a_frameindex.npz')
+    assert index_file.write(index, [bag], CAMERA_TOPICS)
+
+    read = index_file.read([bag], CAMERA_TOPICS)
+    assert read.topics == index.topics and read.msgtypes == index.msgtypes
+    for ith in range(2):
+        assert np.array_equal(read.timestamps[ith], index.timestamps[ith])
+        assert np.array_equal(read.locators[ith], index.locators[ith])
+
+    # a window of the whole index
+    read = index_file.read([bag], CAMERA_TOPICS, (START + PERIOD, START + 3 * PERIOD))
+    assert list(read.timestamps[0]) == [START + PERIOD, START + 2 * PERIOD]
+    assert np.array_equal(read.locators[0], index.locators[0][1:3])
+
+def test_invalidation(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 2)
+    index_file = FrameIndexFile(tmp_path / 'a_frameindex.npz')
+    index_file.write(sample_index(), [bag], CAMERA_TOPICS, (START, START + 3 * PERIOD))
+    assert index_file.read([bag], CAMERA_TOPICS, (START, START + 2 * PERIOD)) is not None
+
+    # other topics, a window the index does not cover
+    assert index_file.read([bag], CAMERA_TOPICS[:1], (START, START + 2 * PERIOD)) is None
+    assert index_file.read([bag], CAMERA_TOPICS) is None
+
+    # the bag was rewritten
+    bag.unlink()
+    write_bag(bag, 3)
+    assert index_file.read([bag], CAMERA_TOPICS, (START, START + 2 * PERIOD)) is None
+
+    # a damaged index
+    index_file.path.write_bytes(b'not an index')
+    assert index_file.read([bag], CAMERA_TOPICS) is None
+
+def test_reopen_uses_the_index(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 6)
+    scanned = create_handler(bag, tmp_path).get_cams()
+    assert (tmp_path / 'a_frameindex.npz').exists()
+    assert scanned[0].frame_reader is None
+
+    reopened = create_handler(bag, tmp_path).get_cams()
+    for scanned_cam, reopened_cam in zip(scanned, reopened):
+        assert reopened_cam.frame_reader is not None
+        assert reopened_cam.timestamp_list == scanned_cam.timestamp_list
+        assert np.array_equal(reopened_cam.get_image(4), scanned_cam.get_image(4))
+
+    # a rewritten bag is scanned again
+    bag.unlink()
+    write_bag(bag, 4)
+    rescanned = create_handler(bag, tmp_path).get_cams()
+    assert rescanned[0].frame_reader is None
+    assert rescanned[0].total_frames == 4
@@ -0,0 +1,45 @@
+# json
+import json
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+
+# test bags
+from bags import add_regions, create_handler, read_messages, write_bag
+
+def export(bag, export_folder, frames, **config):
+    # export with regions on frames, returns the output messages and the stats counters
+    export_folder.mkdir(exist_ok=True)
+    handler = create_handler(bag, export_folder, ExportConfig(**config))
+    cams = handler.scan_cams()
+    add_regions(cams, frames)
+    assert handler.export_cams(cams)
+    stats = json.loads((export_folder / 'a_blurred_stats.json').read_text())
+    return read_messages(handler.output_bag_names), stats['counters']
+
+def test_unchanged_frames_are_reused(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 8)
+    export(bag, tmp_path / 'out', range(1, 5))
+
+    # two cams, frames 1 to 4 unchanged and 5 new
+    messages, counters = export(bag, tmp_path / 'out', range(1, 6))
+    assert counters['reused'] == 8
+    assert counters['blurred'] == 2
+    assert messages == export(bag, tmp_path / 'fresh', range(1, 6))[0]
+    assert not list((tmp_path / 'out').glob('*.previous'))
+
+    # the fingerprints of another blur method are not used
+    (tmp_path / 'out' / 'a_blurred.bag').unlink()
+    _, counters = export(bag, tmp_path / 'out', range(1, 6), blur_method='box')
+    assert 'reused' not in counters
+
+def test_modified_output_is_not_overwritten(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 8)
+    export(bag, tmp_path / 'out', range(1, 5))
+    with open(tmp_path / 'out' / 'a_blurred.bag', 'ab') as f:
+        f.write(b'edited')
+
+    handler = create_handler(bag, tmp_path / 'out')
+    cams = handler.scan_cams()
+    add_regions(cams, range(1, 6))
+    assert not handler.export_cams(cams)
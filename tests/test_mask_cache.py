@@ -0,0 +1,85 @@
+# numpy
+import numpy as np
+
+# OpenCV
+import cv2
+
+# blur_face_manual
+from blur_face_manual.BlurRegion import BLUR_METHODS, BlurRegion, BorderShape, MaskCache, blur_image, mask_cache
+
+def random_image(seed, height = 120, width = 160):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+def region_of(start_x, start_y, end_x, end_y):
+    region = BlurRegion()
+    region.set_region(start_x, start_y, end_x, end_y)
+    return region
+
+def test_cached_masks_match_the_ellipse():
+    # masks of regions inside the image and across its border, including a region the blur margin reaches past
+    for corners in [(40, 30, 80, 70), (0, 0, 30, 20), (140, 100, 170, 130), (-10, 50, 20, 90)]:
+        region = region_of(*corners)
+        x0, y0, x1, y1, _, mask = region.blur_geometry((120, 160, 3), 'pixelate', MaskCache())
+        full = np.zeros((120, 160), dtype=np.uint8)
+        cv2.ellipse(full, ((region.start_x + region.end_x) // 2, (region.start_y + region.end_y) // 2), (region.width // 2, region.height // 2), 0, 0, 360, 255, thickness=-1)
+        assert np.array_equal(mask, full[y0:y1, x0:x1] == 255)
+        assert not mask.flags.writeable
+
+def test_warm_cache_gives_the_same_frames():
+    # the same frames blurred with the cache cleared before every frame and with the cache kept
+    frames = [random_image(seed) for seed in range(4)]
+    moves = [[(20, 20, 60, 50), (100, 60, 150, 110)], [(20, 20, 60, 50), (100, 60, 150, 110)], [(24, 22, 64, 52)], [(0, 0, 40, 30), (130, 90, 170, 130)]]
+    for method in BLUR_METHODS:
+        cold, warm = [], []
+        for frame, corners in zip(frames, moves):
+            mask_cache.clear()
+            image = frame.copy()
+            blur_image(image, [region_of(*c) for c in corners], method)
+            cold.append(image)
+        mask_cache.clear()
+        for frame, corners in zip(frames, moves):
+            image = frame.copy()
+            blur_image(image, [region_of(*c) for c in corners], method)
+            warm.append(image)
+        for a, b in zip(cold, warm):
+            assert np.array_equal(a, b)
+
+def test_moved_region_reuses_its_mask():
+    cache = MaskCache()
+    shape = (480, 640, 3)
+    first = region_of(100, 100, 160, 140).blur_geometry(shape, 'box', cache)
+    moved = region_of(200, 150, 260, 190).blur_geometry(shape, 'box', cache)
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert first[5] is moved[5]
+
+    # at the border the crop is cut, a different mask
+    region_of(0, 0, 60, 40).blur_geometry(shape, 'box', cache)
+    assert cache.misses == 2
+
+def test_same_regions_reuse_the_frame_geometry():
+    cache = MaskCache()
+    shape = (120, 160, 3)
+    geometry = cache.geometry([region_of(20, 20, 60, 50), region_of(100, 60, 150, 110)], shape, 'gaussian')
+    assert cache.geometry([region_of(20, 20, 60, 50), region_of(100, 60, 150, 110)], shape, 'gaussian') is geometry
+    assert cache.misses == 2 and cache.hits == 0
+
+    # a moved region, another method or a rectangle recompute it
+    assert cache.geometry([region_of(21, 20, 61, 50), region_of(100, 60, 150, 110)], shape, 'gaussian') is not geometry
+    assert cache.geometry([region_of(20, 20, 60, 50), region_of(100, 60, 150, 110)], shape, 'box') is not geometry
+    rectangle = region_of(20, 20, 60, 50)
+    rectangle.shape = BorderShape.RECTANGLE
+    assert cache.geometry([rectangle], shape, 'gaussian') == [None]
+
+def test_least_recently_used_masks_are_evicted():
+    cache = MaskCache(max_bytes = 3 * 30 * 40)
+    keys = [((15 + i, 20), (10, 12), (30, 40)) for i in range(4)]
+    for key in keys[:3]:
+        cache.mask(*key)
+    cache.mask(*keys[0])
+    cache.mask(*keys[3])
+    assert list(cache.masks) == [keys[2], keys[0], keys[3]]
+    assert cache.bytes == 3 * 30 * 40
+
+    # a mask larger than the limit is still kept, alone
+    cache.mask((50, 50), (40, 40), (100, 100))
+    assert len(cache.masks) == 1 and cache.bytes == 100 * 100
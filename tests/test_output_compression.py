@@ -0,0 +1,33 @@
+# pytest
+import pytest
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+
+# test bags
+from bags import blurred_cams, create_handler, read_messages, write_bag
+
+def export(path, export_folder, **config):
+    export_folder.mkdir()
+    handler = create_handler(path, export_folder, ExportConfig(**config))
+    assert handler.export_cams(blurred_cams(handler))
+    return handler.output_bag_name
+
+@pytest.mark.parametrize('compression', ['lz4', 'bz2'])
+def test_compressed_output_has_the_same_messages(tmp_path, compression):
+    bag = write_bag(tmp_path / 'a.bag', 6)
+    plain = export(bag, tmp_path / 'plain')
+    compressed = export(bag, tmp_path / compression, compression=compression, chunk_size=8000)
+    assert read_messages([compressed]) == read_messages([plain])
+
+    # every chunk is compressed
+    data = open(compressed, 'rb').read()
+    assert data.count(f'compression={compression}'.encode()) > 1
+    assert b'compression=none' not in data
+
+def test_unsupported_compression_is_refused(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 2)
+    with pytest.raises(ValueError):
+        create_handler(bag, tmp_path, ExportConfig(compression='zstd'))
+    with pytest.raises(ValueError):
+        ExportConfig(compression='gzip')
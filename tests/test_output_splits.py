@@ -0,0 +1,54 @@
+# json
+import json
+
+# pytest
+import pytest
+
+# rosbags
+from rosbags.highlevel import AnyReader
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+
+# test bags
+from bags import CAMERA_TOPICS, PASSTHROUGH_TOPICS, TYPESTORE, blurred_cams, create_handler, interrupt_export, read_messages, write_bag
+
+def export(path, export_folder, **config):
+    export_folder.mkdir(exist_ok=True)
+    handler = create_handler(path, export_folder, ExportConfig(**config))
+    assert handler.export_cams(blurred_cams(handler))
+    return sorted(export_folder.glob('*.bag'))
+
+@pytest.mark.parametrize('config', [{'split_duration': 0.35}, {'split_size': 20000}, {'split_size': 20000, 'split_duration': 0.25}])
+def test_splits_match_the_serial_export(tmp_path, config):
+    bag = write_bag(tmp_path / 'a.bag', 12)
+    serial = export(bag, tmp_path / 'serial')
+    splits = export(bag, tmp_path / 'split', **config)
+    assert len(splits) > 2
+    assert [p.name for p in splits] == [f'a_blurred_{index:04d}.bag' for index in range(len(splits))]
+    assert read_messages(splits) == read_messages(serial)
+
+    for path in splits:
+        # every split has all the output connections, and the metadata of its messages
+        with AnyReader([path], default_typestore=TYPESTORE) as reader:
+            assert {x.topic for x in reader.connections} == set(CAMERA_TOPICS + PASSTHROUGH_TOPICS)
+        metadata = json.loads(path.with_suffix('.json').read_text())
+        messages = read_messages([path])
+        assert metadata['message_count'] == len(messages)
+        assert (metadata['start_time'], metadata['end_time']) == (messages[0][1], messages[-1][1])
+        if 'split_duration' in config:
+            assert metadata['end_time'] - metadata['start_time'] < config['split_duration'] * 1e9
+
+def test_interrupted_split_export_resumes(tmp_path, monkeypatch):
+    bag = write_bag(tmp_path / 'a.bag', 12)
+    serial = export(bag, tmp_path / 'serial')
+    with monkeypatch.context() as patch:
+        interrupt_export(patch, 30)
+        with pytest.raises(KeyboardInterrupt):
+            export(bag, tmp_path / 'split', split_duration=0.35, checkpoint_interval=0)
+
+    # the splits closed before the interruption are published
+    assert list((tmp_path / 'split').glob('a_blurred_0000.bag'))
+    splits = export(bag, tmp_path / 'split', split_duration=0.35, checkpoint_interval=0)
+    assert read_messages(splits) == read_messages(serial)
+    assert not list((tmp_path / 'split').glob('*.partial'))
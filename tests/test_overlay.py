@@ -0,0 +1,48 @@
+# json
+import json
+
+# pytest
+import pytest
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+from blur_face_manual.Overlay import merge_from_manifest, read_manifest
+
+# test bags
+from bags import CAMERA_TOPICS, PERIOD, START, blurred_cams, create_handler, read_messages, write_bag
+
+def timeline(message):
+    topic, timestamp, _ = message
+    return timestamp, topic
+
+def export(path, export_folder, mode):
+    export_folder.mkdir()
+    handler = create_handler(path, export_folder, ExportConfig(mode=mode))
+    assert handler.export_cams(blurred_cams(handler))
+    return handler
+
+def test_overlay_merges_into_the_full_export(tmp_path):
+    write_bag(tmp_path / 's_0.bag', 6)
+    write_bag(tmp_path / 's_1.bag', 6, start=START + 6 * PERIOD)
+    full = export(tmp_path / 's_*.bag', tmp_path / 'full', 'full')
+    overlay = export(tmp_path / 's_*.bag', tmp_path / 'overlay', 'overlay')
+
+    # the overlay has the camera topics only
+    assert {topic for topic, _, _ in read_messages(overlay.output_bag_names)} == set(CAMERA_TOPICS)
+    manifest = json.loads((tmp_path / 'overlay' / 's_blurred_overlay.json').read_text())
+    assert manifest['blurred_frames'] == 4 * len(CAMERA_TOPICS)
+
+    (tmp_path / 'merged').mkdir()
+    merge_from_manifest(tmp_path / 'overlay' / 's_blurred_overlay.json', str(tmp_path / 'merged') + '/')
+    for full_path in full.output_bag_names:
+        merged_path = tmp_path / 'merged' / full_path.split('/')[-1]
+        # messages sharing a timestamp may come in another topic order, each topic keeps its order
+        assert sorted(read_messages([merged_path]), key=timeline) == sorted(read_messages([full_path]), key=timeline)
+
+def test_changed_original_is_refused(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 6)
+    export(bag, tmp_path / 'overlay', 'overlay')
+    bag.unlink()
+    write_bag(bag, 7)
+    with pytest.raises(ValueError):
+        read_manifest(tmp_path / 'overlay' / 'a_blurred_overlay.json')
@@ -0,0 +1,102 @@
+# time
+import time
+
+# blur_face_manual
+from blur_face_manual.BlurRegion import BlurRegion
+from blur_face_manual.Cam import Cam
+from blur_face_manual.RegionDatabase import LOCK_STALE_AFTER, RegionDatabase
+
+def session_cams(frames = 10, count = 2):
+    cams = []
+    for _ in range(count):
+        cam = Cam()
+        cam.total_frames = frames
+        cam.timestamp_list = list(range(100, 100 + frames))
+        cam.blur_regions = [[] for _ in range(frames)]
+        cams.append(cam)
+    return cams
+
+def add_region(cam, frame, x):
+    region = BlurRegion()
+    region.set_region(x, x, x + 10, x + 20)
+    cam.blur_regions[frame].append(region)
+
+def open_database(path, annotator, session, **kwargs):
+    # kwargs: the cams and frame range the annotator edits
+    database = RegionDatabase(path, annotator, **kwargs)
+    assert database.register_cams(session)
+    return database
+
+def stored(path):
+    # (cam, frame, start_x) of every region, as another annotator reads them
+    database = RegionDatabase(path, read_only=True)
+    regions = [(cam, frame, region.start_x) for cam, frames in enumerate(database.read_from_save_file())
+               for frame, regions in enumerate(frames.blur_regions) for region in regions]
+    database.close()
+    return sorted(regions)
+
+def test_annotators_of_disjoint_ranges(tmp_path):
+    path = tmp_path / 'regions.sqlite'
+    cams_a, cams_b = session_cams(), session_cams()
+    a = open_database(path, 'a', cams_a, frame_range=(0, 5))
+    b = open_database(path, 'b', cams_b, frame_range=(5, 10))
+    assert a.acquire_lock() and b.acquire_lock()
+
+    add_region(cams_a[0], 1, 1)
+    add_region(cams_a[1], 4, 2)
+    add_region(cams_b[0], 7, 3)
+
+    # regions outside the own range are not written
+    add_region(cams_b[0], 2, 9)
+    a.write_to_save_file(cams_a)
+    b.write_to_save_file(cams_b)
+    assert stored(path) == [(0, 1, 1), (0, 7, 3), (1, 4, 2)]
+
+    # an overlapping range is refused until its owner releases it
+    c = open_database(path, 'c', session_cams(), cams=[0], frame_range=(3, 6))
+    assert not c.acquire_lock()
+    a.close()
+    b.close()
+    assert c.acquire_lock()
+    c.close()
+
+def test_unchanged_rows_keep_their_edit_time(tmp_path):
+    path = tmp_path / 'regions.sqlite'
+    cams = session_cams()
+    database = open_database(path, 'a', cams)
+    assert database.acquire_lock()
+    add_region(cams[0], 1, 1)
+    database.write_to_save_file(cams)
+    first = database.connection.execute('SELECT id, updated_at FROM regions').fetchall()
+
+    add_region(cams[0], 2, 2)
+    database.write_to_save_file(cams)
+    assert database.connection.execute('SELECT id, updated_at FROM regions WHERE frame = 1').fetchall() == first
+
+    cams[0].blur_regions[1] = []
+    database.write_to_save_file(cams)
+    assert stored(path) == [(0, 2, 2)]
+    database.close()
+
+def test_stale_locks_are_taken_over(tmp_path):
+    path = tmp_path / 'regions.sqlite'
+    dead = open_database(path, 'dead', session_cams())
+    assert dead.acquire_lock()
+    dead.connection.execute('UPDATE locks SET heartbeat = ?', (time.time() - 2 * LOCK_STALE_AFTER,))
+
+    cams = session_cams()
+    alive = open_database(path, 'alive', cams)
+    assert alive.acquire_lock()
+
+    # the dead annotator lost its lock and writes nothing
+    dead_cams = session_cams()
+    add_region(dead_cams[0], 1, 1)
+    dead.write_to_save_file(dead_cams)
+    assert stored(path) == []
+    alive.close()
+    dead.connection.close()
+
+def test_another_bag_is_refused(tmp_path):
+    path = tmp_path / 'regions.sqlite'
+    open_database(path, 'a', session_cams()).close()
+    assert not RegionDatabase(path, 'b').register_cams(session_cams(frames=12))
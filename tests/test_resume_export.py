@@ -0,0 +1,50 @@
+# pytest
+import pytest
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+
+# test bags
+from bags import PERIOD, START, blurred_cams, create_handler, interrupt_export, read_messages, write_bag
+
+# small chunks, so an export has several checkpoints
+CONFIG = {'checkpoint_interval': 0, 'chunk_size': 4000}
+
+def export(path, export_folder):
+    handler = create_handler(path, export_folder, ExportConfig(**CONFIG))
+    return handler, handler.export_cams(blurred_cams(handler))
+
+@pytest.mark.parametrize('interrupted_after', [1, 17, 30, 47])
+def test_resumed_export_matches_an_uninterrupted_one(tmp_path, monkeypatch, capsys, interrupted_after):
+    write_bag(tmp_path / 's_0.bag', 6)
+    write_bag(tmp_path / 's_1.bag', 6, start=START + 6 * PERIOD)
+    (tmp_path / 'serial').mkdir()
+    (tmp_path / 'resumed').mkdir()
+    handler, _ = export(tmp_path / 's_*.bag', tmp_path / 'serial')
+    expected = read_messages(handler.output_bag_names)
+
+    with monkeypatch.context() as patch:
+        interrupt_export(patch, interrupted_after)
+        with pytest.raises(KeyboardInterrupt):
+            export(tmp_path / 's_*.bag', tmp_path / 'resumed')
+    assert (tmp_path / 'resumed' / 's_blurred_checkpoint.json').exists()
+
+    capsys.readouterr()
+    handler, done = export(tmp_path / 's_*.bag', tmp_path / 'resumed')
+    assert done
+    assert 'Resuming export from checkpoint' in capsys.readouterr().out
+    assert read_messages(handler.output_bag_names) == expected
+    assert sorted(p.name for p in (tmp_path / 'resumed').iterdir()) == sorted(p.name for p in (tmp_path / 'serial').iterdir())
+
+def test_changed_regions_start_over(tmp_path, monkeypatch):
+    write_bag(tmp_path / 'a.bag', 6)
+    with monkeypatch.context() as patch:
+        interrupt_export(patch, 20)
+        with pytest.raises(KeyboardInterrupt):
+            export(tmp_path / 'a.bag', tmp_path)
+
+    handler = create_handler(tmp_path / 'a.bag', tmp_path, ExportConfig(**CONFIG))
+    assert handler.export_cams(blurred_cams(handler, range(1, 3)))
+    messages = read_messages(handler.output_bag_names)
+    assert len(messages) == len(read_messages([tmp_path / 'a.bag']))
+    assert not (tmp_path / 'a_blurred_checkpoint.json').exists()
@@ -0,0 +1,51 @@
+# pytest
+import pytest
+
+# blur_face_manual
+from blur_face_manual.SessionQueue import SessionQueue, read_session_queue
+
+# test bags
+from bags import create_handler, write_bag
+
+def test_read_session_queue(tmp_path):
+    path = tmp_path / 'queue.txt'
+    path.write_text('# bags of the day\n'
+                    '\n'
+                    'a.bag\n'
+                    '"with space/b.bag" saves/b_  # trailing comment\n'
+                    "  'split_*.bag'\n")
+    assert read_session_queue(path, 'default/') == [('a.bag', 'default/'), ('with space/b.bag', 'saves/b_'), ('split_*.bag', 'default/')]
+
+    path.write_text('a.bag saves/a_ extra\n')
+    with pytest.raises(ValueError, match='expected <bag>'):
+        read_session_queue(path)
+
+def test_empty_queue():
+    with pytest.raises(ValueError):
+        SessionQueue([])
+
+def test_preload_writes_the_frame_index(tmp_path):
+    write_bag(tmp_path / 'a.bag', 4)
+    write_bag(tmp_path / 'b.bag', 4)
+    queue = SessionQueue([(tmp_path / 'a.bag', ''), (tmp_path / 'b.bag', '')])
+    assert len(queue) == 2
+    assert not queue.preload(2, create_handler(tmp_path / 'b.bag', tmp_path))
+
+    assert queue.preload(1, create_handler(tmp_path / 'b.bag', tmp_path))
+    queue.wait(1)
+    assert queue.state == 'ready' and not queue.running
+    assert (tmp_path / 'b_frameindex.npz').exists()
+
+    # the bag is then opened from its index
+    cams = create_handler(tmp_path / 'b.bag', tmp_path).get_cams()
+    assert cams[0].frame_reader is not None and cams[0].total_frames == 4
+    queue.close()
+    assert queue.preloading is None and queue.state is None
+
+def test_failed_preload(tmp_path):
+    (tmp_path / 'broken.bag').write_bytes(b'not a bag')
+    queue = SessionQueue([(tmp_path / 'broken.bag', '')])
+    assert queue.preload(0, create_handler(tmp_path / 'broken.bag', tmp_path))
+    queue.wait(0)
+    assert queue.state == 'failed'
+    assert not (tmp_path / 'broken_frameindex.npz').exists()
@@ -0,0 +1,35 @@
+# pytest
+import pytest
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+
+# test bags
+from bags import PERIOD, START, blurred_cams, create_handler, read_messages, write_bag
+
+def export(path, export_folder, **config):
+    export_folder.mkdir()
+    handler = create_handler(path, export_folder, ExportConfig(**config))
+    assert handler.export_cams(blurred_cams(handler))
+    return sorted(export_folder.glob('*.bag'))
+
+@pytest.mark.parametrize('shards', [2, 3, 5])
+def test_shards_match_the_serial_export(tmp_path, shards):
+    write_bag(tmp_path / 's_0.bag', 8)
+    write_bag(tmp_path / 's_1.bag', 8, start=START + 8 * PERIOD)
+    serial = export(tmp_path / 's_*.bag', tmp_path / 'serial')
+    sharded = export(tmp_path / 's_*.bag', tmp_path / 'sharded', shards=shards)
+    assert [p.name for p in sharded] == [p.name for p in serial]
+    for sharded_path, serial_path in zip(sharded, serial):
+        assert read_messages([sharded_path]) == read_messages([serial_path])
+
+def test_kept_shards_are_published_as_splits(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 12)
+    serial = export(bag, tmp_path / 'serial')
+    shards = export(bag, tmp_path / 'kept', shards=3, keep_shards=True)
+    assert [p.name for p in shards] == ['a_blurred_0000.bag', 'a_blurred_0001.bag', 'a_blurred_0002.bag']
+    assert read_messages(shards) == read_messages(serial)
+
+def test_shards_cannot_be_split():
+    with pytest.raises(ValueError):
+        ExportConfig(shards=2, split_size=1000)
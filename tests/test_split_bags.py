@@ -0,0 +1,36 @@
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+
+# test bags
+from bags import CAMERA_TOPICS, PASSTHROUGH_TOPICS, PERIOD, START, add_regions, create_handler, read_messages, write_bag
+
+def test_splits_load_as_one_timeline(tmp_path):
+    write_bag(tmp_path / 's_0.bag', 5)
+    write_bag(tmp_path / 's_1.bag', 5, start=START + 5 * PERIOD)
+    handler = create_handler(tmp_path / 's_*.bag', tmp_path)
+    cams = handler.scan_cams()
+
+    expected = [START + k * PERIOD for k in range(10)]
+    messages = read_messages(handler.input_bag_paths)
+    for ith, cam in enumerate(cams):
+        assert cam.timestamp_list == expected
+        datas = [rawdata for topic, _, rawdata in messages if topic == CAMERA_TOPICS[ith]]
+        assert [bytes(cam.arena.message(frame)[0]) for frame in range(cam.total_frames)] == datas
+
+def test_split_without_camera_topics(tmp_path):
+    write_bag(tmp_path / 's_0.bag', 5)
+    write_bag(tmp_path / 's_1.bag', 5, start=START + 5 * PERIOD, topics=PASSTHROUGH_TOPICS)
+    for mode in ['full', 'overlay']:
+        export_folder = tmp_path / mode
+        export_folder.mkdir()
+        handler = create_handler(tmp_path / 's_*.bag', export_folder, ExportConfig(mode=mode))
+        cams = handler.scan_cams()
+        assert [cam.total_frames for cam in cams] == [5, 5]
+
+        add_regions(cams, range(1, 4))
+        handler.export_cams(cams)
+        topics = [{topic for topic, _, _ in read_messages([path])} for path in handler.output_bag_names]
+        if mode == 'full':
+            assert topics == [set(CAMERA_TOPICS + PASSTHROUGH_TOPICS), set(PASSTHROUGH_TOPICS)]
+        else:
+            assert topics == [set(CAMERA_TOPICS), set()]
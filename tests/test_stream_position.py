@@ -0,0 +1,30 @@
+# blur_face_manual
+from blur_face_manual.ExportCheckpoint import StreamPosition
+
+# (topic, timestamp) of a stream where several topics share timestamps
+STREAM = [('/cam0', 10), ('/cam1', 10), ('/imu', 10), ('/imu', 15), ('/cam0', 20), ('/cam1', 20), ('/imu', 20), ('/imu', 25)]
+
+def export(stream, position):
+    # messages an export writes from a stream, as the handlers do
+    written = []
+    for topic, timestamp in stream:
+        if position.skip(timestamp):
+            continue
+        written.append((topic, timestamp))
+        position.record(topic, timestamp)
+    return written
+
+def test_fresh_export_writes_every_message():
+    assert export(STREAM, StreamPosition()) == STREAM
+
+def test_resumed_export_writes_every_message_once():
+    for committed in range(len(STREAM) + 1):
+        position = StreamPosition()
+        export(STREAM[:committed], position)
+
+        # the resumed stream starts at the last committed timestamp
+        resumed = StreamPosition(position.to_dict())
+        start = resumed.last_timestamp
+        stream = [x for x in STREAM if start is None or x[1] >= start]
+        assert STREAM[:committed] + export(stream, resumed) == STREAM
+        assert resumed.messages == len(STREAM)
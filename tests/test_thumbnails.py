@@ -0,0 +1,115 @@
+# numpy
+import numpy as np
+
+# OpenCV
+import cv2
+
+# blur_face_manual
+from blur_face_manual.ThumbnailAtlas import ThumbnailAtlas, decode_thumbnail
+from blur_face_manual.TimelineStrip import TIMELINE_CURRENT, TIMELINE_REGIONS, TIMELINE_ROW_HEIGHT, TIMELINE_THUMBNAILS, TimelineStrip, frame_columns
+
+# test bags
+from bags import add_regions, create_handler, write_bag
+
+def built_atlas(folder, bag, cams, width = 16):
+    atlas = ThumbnailAtlas(folder, [bag], cams, width)
+    atlas.start()
+    if atlas.thread is not None:
+        atlas.thread.join()
+    return atlas
+
+def test_build_order_is_coarse_to_fine():
+    atlas = ThumbnailAtlas('unused', [], [], 16)
+    order = list(atlas.build_order(600))
+    assert sorted(order) == list(range(600))
+    assert order[:3] == [0, 256, 512]
+
+def test_decode_at_reduced_size():
+    image = (np.random.default_rng(0).random((96, 128, 3)) * 255).astype(np.uint8)
+    _, data = cv2.imencode('.jpg', cv2.GaussianBlur(image, (0, 0), 4))
+    full = cv2.resize(cv2.imdecode(data, cv2.IMREAD_COLOR), (32, 24), interpolation=cv2.INTER_AREA)
+    for shape in [(24, 32, 3), (24, 32)]:
+        thumbnail = decode_thumbnail(data.tobytes(), (96, 128), shape)
+        assert thumbnail.shape == shape
+        expected = full if len(shape) == 3 else cv2.cvtColor(full, cv2.COLOR_BGR2GRAY)
+        assert np.abs(thumbnail.astype(int) - expected).mean() < 8
+    assert decode_thumbnail(b'not a jpeg', (96, 128), (24, 32, 3)) is None
+
+def test_build_and_reuse(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 10)
+    cams = create_handler(bag, tmp_path).get_cams()
+    atlas = built_atlas(tmp_path / 'thumbnails', bag, cams)
+    assert atlas.progress() == 1.0
+    for ith, cam in enumerate(cams):
+        assert atlas.built_frames(ith).all()
+        for frame in [0, 9]:
+            thumbnail = atlas.thumbnail(ith, frame)
+            image = cam.get_image(frame)
+            assert thumbnail.shape == image.shape
+
+            # a thumbnail of the frame, not of another one
+            errors = [np.abs(thumbnail.astype(int) - cam.get_image(other)).mean() for other in range(cam.total_frames)]
+            assert np.argmin(errors) == frame
+
+    # the next session opens the thumbnails without building them
+    reopened = ThumbnailAtlas(tmp_path / 'thumbnails', [bag], cams, 16)
+    reopened.start()
+    assert reopened.thread is None
+    assert np.array_equal(reopened.thumbnails[0], atlas.thumbnails[0])
+
+def test_rebuilt_when_stale(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 4)
+    cams = create_handler(bag, tmp_path).get_cams()
+    built_atlas(tmp_path / 'thumbnails', bag, cams)
+
+    # another width
+    assert not ThumbnailAtlas(tmp_path / 'thumbnails', [bag], cams, 8).open_existing()
+
+    # the bag was rewritten
+    bag.unlink()
+    write_bag(bag, 4)
+    assert not ThumbnailAtlas(tmp_path / 'thumbnails', [bag], cams, 16).open_existing()
+    atlas = built_atlas(tmp_path / 'thumbnails', bag, cams)
+    assert atlas.progress() == 1.0
+
+def test_unfinished_build_resumes(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 6)
+    cams = create_handler(bag, tmp_path).get_cams()
+    atlas = ThumbnailAtlas(tmp_path / 'thumbnails', [bag], cams, 16)
+    atlas.create()
+    atlas.built_flags[0][:3] = 1
+    atlas.flush()
+
+    reopened = ThumbnailAtlas(tmp_path / 'thumbnails', [bag], cams, 16)
+    assert reopened.open_existing()
+    assert list(reopened.built_frames(0)) == [True] * 3 + [False] * 3
+    assert reopened.thumbnail(0, 4) is None
+    reopened.start()
+    reopened.thread.join()
+    assert reopened.progress() == 1.0
+
+def test_timeline_columns_and_seek():
+    assert list(frame_columns([0, 5, 9], 10, 100)) == [0, 50, 90]
+    assert list(frame_columns([0], 0, 100)) == [0]
+
+    seeks = []
+    timeline = TimelineStrip(seeks.append, width = 200)
+    timeline.mouse_callback(cv2.EVENT_MOUSEMOVE, 50, 0, 0, None)
+    timeline.mouse_callback(cv2.EVENT_LBUTTONDOWN, 50, 0, 0, None)
+    timeline.mouse_callback(cv2.EVENT_MOUSEMOVE, 250, 0, 0, None)
+    timeline.mouse_callback(cv2.EVENT_LBUTTONUP, -10, 0, 0, None)
+    timeline.mouse_callback(cv2.EVENT_MOUSEMOVE, 100, 0, 0, None)
+    assert seeks == [0.25, 1.0, 0.0]
+
+def test_timeline_draw(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 10)
+    cams = create_handler(bag, tmp_path).get_cams()
+    add_regions(cams, [2])
+    cams[0].current_frame = 5
+    atlas = built_atlas(tmp_path / 'thumbnails', bag, cams)
+
+    image = TimelineStrip(lambda ratio: None, width = 100).draw(cams, atlas)
+    assert image.shape == (2 * TIMELINE_ROW_HEIGHT, 100, 3)
+    assert tuple(image[2, 20]) == TIMELINE_REGIONS
+    assert tuple(image[TIMELINE_ROW_HEIGHT - 2, 70]) == TIMELINE_THUMBNAILS
+    assert tuple(image[2, 50]) == TIMELINE_CURRENT
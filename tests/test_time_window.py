@@ -0,0 +1,58 @@
+# blur_face_manual
+from blur_face_manual.SaveFileHandler import SaveFileHandler
+
+# test bags
+from bags import PERIOD, START, add_regions, create_handler, read_messages, write_bag
+
+# seconds from the start of the bag, frames 3 to 6
+WINDOW = (0.25, 0.65)
+WINDOW_TIMESTAMPS = [START + k * PERIOD for k in range(3, 7)]
+
+def test_window_is_scanned_alone(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 12)
+    cams = create_handler(bag, tmp_path, time_window=WINDOW).get_cams()
+    assert all(cam.timestamp_list == WINDOW_TIMESTAMPS for cam in cams)
+
+    # the index of the window is reused for the window only
+    assert create_handler(bag, tmp_path, time_window=WINDOW).get_cams()[0].frame_reader is not None
+    assert create_handler(bag, tmp_path).get_cams()[0].total_frames == 12
+
+def test_window_of_a_whole_bag_index(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 12)
+    whole = create_handler(bag, tmp_path).get_cams()
+    cams = create_handler(bag, tmp_path, time_window=WINDOW).get_cams()
+    for whole_cam, cam in zip(whole, cams):
+        assert cam.frame_reader is not None
+        assert cam.timestamp_list == WINDOW_TIMESTAMPS
+        assert bytes(cam.get_compressed_payload(0)) == bytes(whole_cam.get_compressed_payload(3))
+
+def test_sessions_of_windows_share_the_save_file(tmp_path):
+    bag = write_bag(tmp_path / 'a.bag', 12)
+    save_file = SaveFileHandler(str(tmp_path / 'a_save.txt'))
+    whole = create_handler(bag, tmp_path).scan_cams()
+    add_regions(whole, [1, 4, 9])
+    save_file.write_to_save_file(whole)
+
+    # a window session gets the regions of its frames, and keeps the others
+    windowed = create_handler(bag, tmp_path, time_window=WINDOW).get_cams()
+    loaded = SaveFileHandler(save_file.path, windowed=True).read_from_save_file(windowed)
+    for cam, loaded_cam in zip(windowed, loaded):
+        cam.blur_regions = loaded_cam.blur_regions
+        cam.outside_regions = loaded_cam.outside_regions
+        assert [len(regions) for regions in cam.blur_regions] == [0, 1, 0, 0]
+        assert sorted(cam.outside_regions) == [START + PERIOD, START + 9 * PERIOD]
+
+    # its export blurs the whole bag as the whole session does
+    (tmp_path / 'whole').mkdir()
+    (tmp_path / 'windowed').mkdir()
+    whole_handler = create_handler(bag, tmp_path / 'whole')
+    assert whole_handler.export_cams(whole)
+    windowed_handler = create_handler(bag, tmp_path / 'windowed', time_window=WINDOW)
+    assert windowed_handler.export_cams(windowed)
+    assert read_messages(windowed_handler.output_bag_names) == read_messages(whole_handler.output_bag_names)
+
+    # writing the window session keeps the regions outside it
+    add_regions(windowed, [2])
+    SaveFileHandler(save_file.path, windowed=True).write_to_save_file(windowed)
+    reloaded = save_file.read_from_save_file(create_handler(bag, tmp_path).scan_cams())
+    assert [frame for frame, regions in enumerate(reloaded[0].blur_regions) if regions] == [1, 4, 5, 9]
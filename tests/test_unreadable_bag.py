@@ -0,0 +1,19 @@
+# pytest
+import pytest
+
+# test bags
+from bags import PERIOD, START, create_handler, write_bag
+
+def test_missing_split_exits(tmp_path):
+    write_bag(tmp_path / 's_0.bag', 5)
+    write_bag(tmp_path / 's_1.bag', 5, start=START + 5 * PERIOD)
+    handler = create_handler(tmp_path / 's_*.bag', tmp_path)
+    (tmp_path / 's_1.bag').unlink()
+    with pytest.raises(SystemExit):
+        handler.get_cams()
+
+def test_corrupt_bag_exits(tmp_path):
+    (tmp_path / 'corrupt.bag').write_bytes(b'not a bag')
+    handler = create_handler(tmp_path / 'corrupt.bag', tmp_path)
+    with pytest.raises(SystemExit):
+        handler.get_cams()
@@ -0,0 +1,76 @@
+# json
+import json
+
+# path
+from pathlib import Path
+
+# blur_face_manual
+from blur_face_manual.ExportConfig import ExportConfig
+from blur_face_manual.ExportStats import ExportStats
+from blur_face_manual.ExportVerifier import StreamComparer, shard_bounds
+
+# test bags
+from bags import PASSTHROUGH_TOPICS, add_regions, blurred_cams, create_handler, write_bag
+
+def exported(tmp_path, frames = 6):
+    write_bag(tmp_path / 'a.bag', frames)
+    handler = create_handler(tmp_path / 'a.bag', tmp_path, ExportConfig(blur_method='box'))
+    cams = blurred_cams(handler)
+    assert handler.export_cams(cams)
+    return handler, cams
+
+def test_shard_bounds():
+    assert shard_bounds(0, 100, 1) == [None, None]
+    assert shard_bounds(0, 100, 4) == [None, 25, 50, 75, None]
+
+def test_exported_bag_passes(tmp_path, capsys):
+    handler, cams = exported(tmp_path)
+    capsys.readouterr()
+    assert handler.verify_export(cams)
+    assert 'Verification passed' in capsys.readouterr().out
+
+    report = json.loads(Path(handler.verify_file_name).read_text())
+    assert report['problems'] == []
+    assert report['counters']['blurred'] == 8
+    assert report['counters']['identical'] == 12 + 4
+
+def test_unblurred_regions_fail(tmp_path, capsys):
+    handler, cams = exported(tmp_path)
+
+    # regions added after the export
+    add_regions(cams, [5])
+    assert not handler.verify_export(cams)
+    report = json.loads(Path(handler.verify_file_name).read_text())
+    assert {problem['problem'] for problem in report['problems']} == {'unblurred'}
+    assert len(report['problems']) == 2
+
+def test_tampered_bag_fails(tmp_path):
+    handler, cams = exported(tmp_path)
+
+    # the input copied as export: frames not blurred
+    Path(handler.output_bag_names[0]).unlink()
+    write_bag(handler.output_bag_names[0], 6)
+    assert not handler.verify_export(cams)
+    assert {problem['problem'] for problem in json.loads(Path(handler.verify_file_name).read_text())['problems']} == {'unblurred'}
+
+    # the last messages missing
+    Path(handler.output_bag_names[0]).unlink()
+    write_bag(handler.output_bag_names[0], 5)
+    assert not handler.verify_export(cams)
+    assert {problem['problem'] for problem in json.loads(Path(handler.verify_file_name).read_text())['problems']} >= {'missing'}
+
+def test_missing_export(tmp_path, capsys):
+    write_bag(tmp_path / 'a.bag', 2)
+    handler = create_handler(tmp_path / 'a.bag', tmp_path)
+    assert not handler.verify_export(handler.scan_cams())
+    assert 'export it first' in capsys.readouterr().out
+
+def test_stream_comparer_pairs_by_timestamp():
+    stats = ExportStats('verify', 0, progress_interval=None)
+    comparer = StreamComparer([], [], 'gaussian', None, stats)
+    topic = PASSTHROUGH_TOPICS[0]
+    for side, timestamp, rawdata in [(0, 1, b'a'), (1, 1, b'a'), (0, 2, b'b'), (1, 3, b'c'), (0, 4, b'd'), (1, 4, b'x'), (1, 5, b'e')]:
+        comparer.add(side, topic, timestamp, rawdata)
+    problems = comparer.finish()
+    assert [(problem['problem'], problem['timestamp']) for problem in problems] == [('missing', 2), ('extra', 3), ('changed', 4), ('extra', 5)]
+    assert stats.counters['identical'] == 1